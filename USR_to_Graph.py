@@ -1,315 +1,260 @@
-import re
-import json
-from graphviz import Digraph
+import argparse
+import hashlib
+import logging
 import sys
+import os
+from collections import deque
+from renderer import render_svg
+from metrics import count_segments, timed
+from relation_graph import DIRECTIONS, OUTGOING
+from usr_index import SentenceIndex, resolve_inter_relations
+# Parsing and the DOT builder live in usr_engine; the <segment_id=...>
+# dialect is its default, so these names keep working from here.
+from usr_engine import CONSTRUCTION_LABELS, convert_usr_to_dot, create_json as engine_create_json, graph_data, \
+    index_segments, iter_blocks, iter_segments, open_usr_file, parse_block, parse_inter_relations, parse_segment, \
+    parse_segments, parse_usrs, segment_fragment, segment_size
+
+# Bump whenever convert_usr_to_dot output changes so cached renders expire.
+RENDERER_VERSION = "5"
+
+# Default size budget for one drawing; segments beyond it are left out.
+MAX_GRAPH_NODES = 2000
+MAX_GRAPH_EDGES = 4000
 
-def parse_usrs(usrs_text):
-    sentences = {}
-    current_sentence_id = None
-    current_tokens = []
-    main_token = None
-    inter_relations = []
-
-    for line in usrs_text.strip().splitlines():
-        line = line.strip()
-
-        if line.startswith("<segment_id="):
-            if current_sentence_id:
-                sentences[current_sentence_id] = create_json(current_tokens, main_token, inter_relations)
-            current_sentence_id = re.search(r"<segment_id=\s*(\S+)>", line).group(1)
-            current_tokens = []
-            main_token = None
-            inter_relations = []
-
-        elif not line.startswith(("#", "<", "%")) and line:
-            line = re.sub(r'\s+', '\t', line).strip()   # ← normalize FIRST
-
-            if len(line.split("\t")) <= 1:               # ← THEN skip
-                continue
-
-            token_data = line.split("\t")
-            token_id = token_data[1]
-            word = token_data[0]
-            semantic_category = token_data[2] if len(token_data) > 2 else "-"
-            dependency_info = token_data[4] if len(token_data) > 4 else "-"
-            construction_info = token_data[8] if len(token_data) > 8 else "-"
-
-            info = {
-                "semantic_category": semantic_category,
-                "morpho_semantic": token_data[3] if len(token_data) > 3 else "-",
-                "speakers_view": token_data[6] if len(token_data) > 6 else "-",
-                "additional_info": token_data[5] if len(token_data) > 5 else "-"
-            }
-
-            relations = []
-            if dependency_info and dependency_info != "-":
-                for dep in dependency_info.split("|"):
-                    target, label = dep.split(":")
-                    relations.append({"target": target, "label": label})
-
-            elif construction_info and construction_info != "-":
-                for dep in construction_info.split("|"):
-                    target, label = dep.split(":")
-                    relations.append({"target": target, "label": label})
-
-            if "0:main" in dependency_info:
-                main_token = word
-
-            current_tokens.append({"id": token_id, "word": word, "relations": relations, "info": info})
-
-            if info["additional_info"] != "-":
-                inter_relations += parse_inter_relations(info["additional_info"], token_id, current_sentence_id, sentences)
-
-    if current_sentence_id:
-        sentences[current_sentence_id] = create_json(current_tokens, main_token, inter_relations)
-
-    return sentences
-
-# Update the function signature and same-sentence branch:
-def parse_inter_relations(data, source_token, source_sentence, sentences, current_tokens=None):
-    inter_relations = []
-    for relation in data.split("|"):
-        if ":" in relation:
-            target_sentence_id, relation_type = relation.split(":")
-
-            if target_sentence_id.isdigit():
-                target_sentence = source_sentence
-                target_token = target_sentence_id
-            elif '.' in target_sentence_id:
-                target_sentence, target_token = target_sentence_id.split(".")
-            else:
-                target_sentence, target_token = target_sentence_id, None
-
-            target_sentence_found = None
-            target_word = None
-
-            if target_sentence == source_sentence:
-                # ↓ Use current_tokens instead of sentences[source_sentence]
-                target_sentence_found = source_sentence
-                token_list = current_tokens or []
-                for token in token_list:
-                    if token["id"] == target_token:
-                        target_word = token["word"]
-                        break
-            else:
-                # cross-sentence lookup (unchanged)
-                for sentence_id in sentences:
-                    if target_sentence in sentence_id:
-                        target_sentence_found = sentence_id
-                        break
-
-                if target_sentence_found and target_token:
-                    for token in sentences[target_sentence_found].get("tokens", []):
-                        if token["id"] == target_token:
-                            target_word = token["word"]
-                            break
-
-            inter_relations.append({
-                "source_token": source_token,
-                "target_token": target_token,
-                "target_word": target_word,
-                "source_sentence": source_sentence,
-                "target_sentence": target_sentence_found if target_sentence_found else target_sentence,
-                "relation": relation_type
-            })
-    print(inter_relations)
-    return inter_relations
 
 def create_json(tokens, main_token, inter_relations):
-    index_to_word = {token["id"]: token["word"] for token in tokens}
-    index_to_token = {token["id"]: token for token in tokens}
-
-    updated_tokens = []
-    for token in tokens:
-        updated_relations = []
-        for relation in token.get("relations", []):
-            target_index = relation["target"]
-            if target_index in index_to_word:
-                updated_relations.append({
-                    "target": index_to_word[target_index],
-                    "target_id": target_index,
-                    "label": relation["label"]
-                })
-        updated_tokens.append({
-            "id": token["id"],
-            "word": token["word"],
-            "relations": updated_relations,
-            "info": token.get("info", {})
-        })
-
-    sentence_relations = []
-    for relation in inter_relations:
-        sentence_relations.append({
-            "source_token": relation["source_token"],
-            "target_token": relation["target_token"],
-            "target_word": relation["target_word"],
-            "source_sentence": relation["source_sentence"],
-            "target_sentence": relation["target_sentence"],
-            "relation": relation["relation"]
-        })
-
+    # Compatibility shim: main_token used to be just the main word, and
+    # the id of the first token with that word was used.
     if main_token:
-        main_token_word = main_token
-        main_token_id = None
-        for token in tokens:
-            if token['word'] == main_token_word:
-                main_token_id = token['id']
-                break
-        main_token_combined = f"{main_token_word}_{main_token_id}" if main_token_id else None
-    else:
-        main_token_combined = None
-
-    return {
-        "tokens": updated_tokens,
-        "main": main_token_combined,
-        "inter_relations": sentence_relations
-    }
-
-def convert_usr_to_dot(usr_data):
-    dot = Digraph(comment='USR Representation')
-    dot.attr(rankdir='TB')
-    dot.attr(node='*', width='1.5', height='0.75', fontsize='6')
-
-    # ── Collect all cross-sentence pairs so we can place them side by side ──
-    # Build a set of (sent_a, sent_b) pairs that share an inter-relation
-    cross_pairs = set()
-    for sent_id, sentence in usr_data.items():
-        for rel in sentence.get("inter_relations", []):
-            src = rel["source_sentence"]
-            tgt = rel["target_sentence"]
-            if src and tgt and src != tgt and src in usr_data and tgt in usr_data:
-                pair = tuple(sorted([src, tgt]))
-                cross_pairs.add(pair)
-
-    # For each such pair, we'll emit a subgraph with rank=same so Graphviz
-    # places their sentence-root nodes on the same rank (side by side).
-    already_ranked = set()
-    for pair in cross_pairs:
-        sent_a, sent_b = pair
-        subgraph_name = f"same_rank_{sent_a}_{sent_b}"
-        with dot.subgraph(name=subgraph_name) as sg:
-            sg.attr(rank='same')
-            sg.node(f'sent_{sent_a}')
-            sg.node(f'sent_{sent_b}')
-        already_ranked.add(sent_a)
-        already_ranked.add(sent_b)
-
-    # ── Now render each sentence as before ──
-    for sent_id, sentence in usr_data.items():
-        sent_node = f'sent_{sent_id}'
-        dot.node(sent_node, f'Sentence {sent_id}', shape='ellipse',
-                 color='blue', fillcolor='lightblue', style='filled')
-
-        if sentence['main']:
-            dot.node(sentence['main'], label=sentence['main'],
-                     shape='ellipse', fillcolor='lightgray')
-            dot.edge(sent_node, sentence['main'], label='main', fontsize='8')
-
-        special_construction_clusters = {}
-
-        for token in sentence['tokens']:
-            token_node = f'{token["word"]}_{token["id"]}'
-            label = f"{token['word']}:{token['id']}\n"
-            tooltip_info = (
-                f"semCat: {token['info']['semantic_category']}\n"
-                f"morphSem: {token['info']['morpho_semantic']}\n"
-                f"speakersView: {token['info']['speakers_view']}\n"
-                f"Additional Info: {token['info']['additional_info']}"
-            )
-
-            if '[' in token['word'] and ']' in token['word']:
-                special_construction_clusters[token_node] = {
-                    "concept": label,
-                    "connected_nodes": set()
-                }
-                dot.node(token_node, label=label, shape='box', tooltip=tooltip_info)
-            else:
-                dot.node(token_node, label=label, tooltip=tooltip_info)
-
-        for token in sentence['tokens']:
-            token_node = f'{token["word"]}_{token["id"]}'
-            for relation in token['relations']:
-                if 'target' in relation and 'target_id' in relation:
-                    target_node = f'{relation["target"]}_{relation["target_id"]}'
-                    dot.edge(target_node, token_node, label=relation['label'], fontcolor="blue")
-
-                    if '[' in target_node and ']' in target_node:
-                        if target_node in special_construction_clusters:
-                            if relation['label'] in {
-                                "op1", "op2", "op3", "op4", "op5", "op7", "op8",
-                                "start", "end", "mod", "head", "count", "unit",
-                                "component1", "component2", "component3", "component4",
-                                "component5", "component6", "unit_value", "unit_every",
-                                "whole", "part", "kriyAmUla", "verbalizer"
-                            }:
-                                special_construction_clusters[target_node]["connected_nodes"].add(token_node)
-
-        for cluster_token, cluster_data in special_construction_clusters.items():
-            with dot.subgraph(name=f'cluster_{cluster_token}') as cluster:
-                cluster.attr(
-                    style='filled,dashed',
-                    color='black',
-                    fillcolor='lightgray',
-                    label=f'Construction: {cluster_data["concept"]}'
-                )
-                cluster.node(cluster_token, label=cluster_data["concept"], shape='box')
-                for node in cluster_data["connected_nodes"]:
-                    cluster.node(node)
-
-        for relation in sentence.get("inter_relations", []):
-            source_token = f'{relation["source_token"]}'
-            target_token = f'{relation["target_token"]}'
-            target_sentence = relation["target_sentence"]
-
-            if not target_token or not target_sentence:
-                continue
-
-            source_node = None
-            target_node = None
-
-            for token in sentence['tokens']:
-                if str(token['id']) == source_token:
-                    source_node = f'{token["word"]}_{token["id"]}'
-                    break
-
-            if target_sentence in usr_data:
-                for token in usr_data[target_sentence]['tokens']:
-                    if str(token['id']) == target_token:
-                        target_node = f'{token["word"]}_{token["id"]}'
-                        break
-
-            if source_node and target_node:
-                dot.edge(source_node, target_node,
-                         label=relation["relation"], color="red", fontcolor="red")
-
-    return dot
-
-
-def process_and_visualize(usrs_text, sent_id_filter):
-    parsed_data = parse_usrs(usrs_text)
-
-    filtered_data = {}
-    if sent_id_filter in parsed_data:
-        filtered_data[sent_id_filter] = parsed_data[sent_id_filter]
-
-    for relation in parsed_data.get(sent_id_filter, {}).get("inter_relations", []):
-        target_sentence = relation["target_sentence"]
-        if target_sentence and target_sentence not in filtered_data:
-            filtered_data[target_sentence] = parsed_data[target_sentence]
-
-    dot = convert_usr_to_dot(filtered_data)
+        main_token = next(((token["word"], str(token["id"])) for token in tokens if token["word"] == main_token), None)
+    return engine_create_json(tokens, main_token, inter_relations)
+
+
+def stream_neighbourhood(path, seeds, max_depth=1, use_mmap=False):
+    # File-backed counterpart of collect_segments: one streaming pass per
+    # hop, keeping only the segments the walk can reach, so memory is
+    # bounded by the drawing rather than the file. A pass only splits the
+    # file into blocks; just the wanted blocks have their rows parsed.
+    index = SentenceIndex()
+    loaded = {}
+    wanted = set(split_segment_ids(seeds))
+
+    for depth in range(max_depth + 1):
+        if not wanted:
+            break
+        found = {}
+        for segment_id, first_line, block in iter_blocks(open_usr_file(path, use_mmap)):
+            if depth == 0:
+                index.add(segment_id, [])
+            if segment_id in wanted:
+                found[segment_id] = parse_block(block, segment_id, first_line)
+        loaded.update(found)
+
+        wanted = set()
+        for sentence in found.values():
+            for relation in sentence["inter_relations"]:
+                target_sentence = index.resolve_sentence(relation["target_sentence"])
+                if target_sentence and target_sentence not in loaded:
+                    wanted.add(target_sentence)
+
+    for segment_id, sentence in loaded.items():
+        index.add(segment_id, sentence["tokens"])
+    resolve_inter_relations(loaded, index)
+    return select_segments(loaded, seeds, max_depth)
+
+
+def split_segment_ids(sent_ids):
+    if isinstance(sent_ids, str):
+        sent_ids = sent_ids.split(",")
+    return [sent_id.strip() for sent_id in sent_ids if sent_id and sent_id.strip()]
+
+
+def walk_segments(seeds, load, neighbors, max_depth=1, max_nodes=MAX_GRAPH_NODES, max_edges=MAX_GRAPH_EDGES,
+                  size=segment_size):
+    # Breadth-first walk over inter_relations starting from every seed.
+    # load(segment_id) returns the parsed segment or None,
+    # neighbors(segment_id, sentence) the segment ids to walk on to. Segments that would push the drawing
+    # past the node/edge budget are reported in `skipped`. size(sentence)
+    # is the (nodes, edges) a loaded segment adds to the drawing.
+    selected = {}
+    skipped = []
+    nodes = edges = 0
+    queue = deque((seed, 0) for seed in split_segment_ids(seeds))
+    queued = {seed for seed, _ in queue}
+
+    while queue:
+        segment_id, depth = queue.popleft()
+        sentence = load(segment_id)
+        if sentence is None:
+            continue
+
+        segment_nodes, segment_edges = size(sentence)
+        if selected and (nodes + segment_nodes > max_nodes or edges + segment_edges > max_edges):
+            skipped.append(segment_id)
+            continue
+
+        nodes += segment_nodes
+        edges += segment_edges
+        selected[segment_id] = sentence
+
+        if depth < max_depth:
+            for target_sentence in neighbors(segment_id, sentence):
+                if target_sentence and target_sentence not in queued:
+                    queued.add(target_sentence)
+                    queue.append((target_sentence, depth + 1))
+
+    return selected, skipped
+
+
+@timed("collect_segments")
+def collect_segments(lines, offsets, seeds, max_depth=1, max_nodes=MAX_GRAPH_NODES, max_edges=MAX_GRAPH_EDGES,
+                     errors=None, parse=parse_segment):
+    # Lazy variant for pasted text: only the segments reached from the
+    # seeds are parsed, each exactly once. `parse` has parse_segment's
+    # signature and lets callers put a cache in front of it.
+    index = SentenceIndex()
+    for segment_id in offsets:
+        index.add(segment_id, [])
+
+    def load(segment_id):
+        if segment_id not in offsets:
+            return None
+        start, end = offsets[segment_id]
+        sentence = parse(lines[start:end], segment_id, start + 1, errors)
+        index.add(segment_id, sentence["tokens"])
+        return sentence
+
+    def neighbors(segment_id, sentence):
+        return [index.resolve_sentence(relation["target_sentence"]) for relation in sentence["inter_relations"]]
+
+    selected, skipped = walk_segments(seeds, load, neighbors, max_depth, max_nodes, max_edges)
+    count_segments(selected.values())
+    return resolve_inter_relations(selected, index), skipped
+
+
+def select_segments(sentences, seeds, max_depth=1, max_nodes=MAX_GRAPH_NODES, max_edges=MAX_GRAPH_EDGES,
+                    graph=None, direction=OUTGOING):
+    # Same walk over segments that parse_usrs already parsed and resolved.
+    # With a corpus RelationGraph the walk can also follow relations
+    # backwards (direction "in" or "both"), to the segments that refer to
+    # the seeds.
+    def neighbors(segment_id, sentence):
+        if graph is not None:
+            return graph.in_order(graph.neighbors(segment_id, direction))
+        return [relation["target_sentence"] for relation in sentence["inter_relations"]]
+
+    return walk_segments(seeds, sentences.get, neighbors, max_depth, max_nodes, max_edges)
+
+
+def hash_segment(digest, segment_id, lines):
+    # Whitespace is normalized and blank lines dropped, so re-pasted text
+    # hashes the same.
+    digest.update(f"<segment_id={segment_id}>\n".encode("utf-8"))
+    for line in lines:
+        line = " ".join(line.split())
+        if line:
+            digest.update(line.encode("utf-8") + b"\n")
+    return digest
+
+
+def segment_fingerprint(segment_id, lines):
+    return hash_segment(hashlib.sha256(), segment_id, lines).hexdigest()
+
+
+def render_key(lines, offsets, segment_ids, skipped=()):
+    # Content hash of the segments that make up one graph, in drawing
+    # order.
+    fingerprints = []
+    for segment_id in segment_ids:
+        start, end = offsets.get(segment_id, (0, 0))
+        fingerprints.append(segment_fingerprint(segment_id, lines[start:end]))
+    return fingerprint_key(fingerprints, skipped)
+
+
+def fingerprint_key(fingerprints, skipped=()):
+    # render_key from the segment_fingerprint of each segment, for callers
+    # that no longer hold the text (see batch_render.plan_file).
+    digest = hashlib.sha256(f"renderer={RENDERER_VERSION}\n".encode("utf-8"))
+    digest.update(f"skipped={len(skipped)}\n".encode("utf-8"))
+    for fingerprint in fingerprints:
+        digest.update(f"{fingerprint}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def process_and_visualize(usrs_text, sent_id_filter, max_depth=1, max_nodes=MAX_GRAPH_NODES, max_edges=MAX_GRAPH_EDGES):
+    # sent_id_filter may be one id, a comma separated string or a list;
+    # all reached segments are drawn as a single graph.
+    lines, offsets = index_segments(usrs_text)
+    filtered_data, skipped = collect_segments(lines, offsets, sent_id_filter, max_depth, max_nodes, max_edges)
+
+    dot = convert_usr_to_dot(filtered_data, skipped)
     return dot
 
 
 if __name__ == '__main__':
-    input_file = sys.argv[1]
-    sent_id_filter = sys.argv[2]
-
-    with open(input_file, "r") as file:
-        usrs_text = file.read()
-
-    dot = process_and_visualize(usrs_text, sent_id_filter)
-
-    output_file = f"sentence_{sent_id_filter}"
-    dot.render(output_file, format="svg")
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from batch_render import main
+        sys.exit(main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == "validate":
+        from usr_validate import main
+        sys.exit(main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        from static_export import main
+        sys.exit(main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == "diff":
+        from usr_diff import main
+        sys.exit(main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == "snapshot":
+        from usr_snapshot import build_snapshot
+        for input_file in sys.argv[2:]:
+            print(f"Snapshot saved as {build_snapshot(input_file)}")
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "relations":
+        from relation_graph import main
+        sys.exit(main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == "search":
+        from usr_search import main
+        sys.exit(main(sys.argv[2:]))
+
+    logging.basicConfig(level=os.environ.get("USR_LOG_LEVEL", "WARNING").upper())
+
+    parser = argparse.ArgumentParser(prog="USR_to_Graph.py",
+                                     description="Draw segments and their neighbourhood as an SVG. Subcommands: "
+                                                 "batch, validate, export, diff, snapshot, relations, search.")
+    parser.add_argument("input_file")
+    parser.add_argument("sent_ids", help="comma separated segment ids")
+    parser.add_argument("depth", type=int, nargs="?", default=1, help="inter-relation hops to follow (default: 1)")
+    # in/both also draws the segments that refer to the seeds; that needs
+    # the corpus relation graph, built with the snapshot.
+    parser.add_argument("--direction", choices=DIRECTIONS, default=OUTGOING)
+    args = parser.parse_args()
+    input_file, sent_id_filter, max_depth, direction = args.input_file, args.sent_ids, args.depth, args.direction
+
+    # With a snapshot next to the input (see the snapshot subcommand) the
+    # segments are read from it, rebuilding it if the input has changed.
+    from usr_snapshot import load_relation_graph, load_snapshot, snapshot_path
+    if direction != OUTGOING:
+        graph = load_relation_graph(input_file)
+        with load_snapshot(input_file) as snapshot:
+            filtered_data, skipped = select_segments(snapshot, sent_id_filter, max_depth,
+                                                     graph=graph, direction=direction)
+    elif os.path.exists(snapshot_path(input_file)):
+        with load_snapshot(input_file) as snapshot:
+            filtered_data, skipped = select_segments(snapshot, sent_id_filter, max_depth)
+    else:
+        filtered_data, skipped = stream_neighbourhood(input_file, sent_id_filter, max_depth)
+    simplified = []
+    dot = convert_usr_to_dot(filtered_data, skipped, simplified=simplified)
+    if simplified:
+        print(f"Large graph, simplified: {', '.join(simplified)}")
+
+    output_file = f"sentence_{'_'.join(split_segment_ids(sent_id_filter))}.svg"
+    with open(output_file, "wb") as file:
+        file.write(render_svg(dot))
     print(f"Graph saved as {output_file}")
\ No newline at end of file
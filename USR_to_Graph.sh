@@ -1,16 +1,18 @@
 #!/bin/bash
 
 # Check if the correct number of arguments is provided
-if [ "$#" -ne 2 ]; then
-  echo "Usage: $0 <input_file> <sent_id>"
+if [ "$1" != "batch" ] && { [ "$#" -lt 2 ] || [ "$#" -gt 3 ]; }; then
+  echo "Usage: $0 <input_file> <sent_id[,sent_id...]> [depth]"
+  echo "       $0 batch <input_file>... [-o out_dir] [--ids pattern...] [-j workers]"
   exit 1
 fi
 
 INPUT_FILE="$1"
 SENT_ID="$2"
+DEPTH="${3:-1}"
 
 # Check if the input file exists
-if [ ! -f "$INPUT_FILE" ]; then
+if [ "$1" != "batch" ] && [ ! -f "$INPUT_FILE" ]; then
   echo "Error: File '$INPUT_FILE' not found!"
   exit 1
 fi
@@ -24,9 +26,11 @@ fi
 echo "Activating virtual environment..."
 source venv/bin/activate || source venv/Scripts/activate
 
-# Install required dependencies
-echo "Installing required dependencies..."
-pip install --quiet graphviz
+# Install required dependencies only when they are missing
+if ! python3 -c "import graphviz" 2>/dev/null; then
+  echo "Installing required dependencies..."
+  pip install --quiet graphviz
+fi
 
 # Ensure the script is executable
 if [ ! -x USR_to_Graph.py ]; then
@@ -36,7 +40,11 @@ fi
 
 # Run the Python script with the input file and sent_id
 echo "Running the Python script..."
-python3 USR_to_Graph.py "$INPUT_FILE" "$SENT_ID"
+if [ "$1" = "batch" ]; then
+  python3 USR_to_Graph.py "$@"
+else
+  python3 USR_to_Graph.py "$INPUT_FILE" "$SENT_ID" "$DEPTH"
+fi
 
 # Deactivate the virtual environment
 echo "Deactivating virtual environment..."
@@ -1,34 +1,459 @@
-from flask import Flask, render_template, request
+from flask import Blueprint, Flask, Response, abort, current_app, jsonify, render_template, request, session, \
+    url_for
+import hashlib
+import logging
 import os
-from USR_to_Graph import process_and_visualize
+import re
+import subprocess
+import threading
+import uuid
+from functools import partial
+from USR_to_Graph import index_segments, collect_segments, render_key, convert_usr_to_dot, graph_data, parse_usrs, \
+    select_segments
+from usr_model import to_dict
+from render_cache import RenderCache, remove_legacy_renders
+from incremental import SessionStores
+from renderer import render_svg
+from render_jobs import DONE, FINISHED, QueueFull, RenderQueue
+from usr_snapshot import is_current, load_relation_graph, load_search_index, load_snapshot
+from relation_graph import BOTH, DIRECTIONS, OUTGOING
+from usr_search import QueryError
+from usr_engine import graph_size, huge_graph_simplifications, is_huge_graph
+from metrics import REGISTRY
 
-app = Flask(__name__)
+# Routes of the web UI and JSON API, added to every app create_app builds.
+views = Blueprint("usr", __name__)
 
-GRAPH_FOLDER = "static/graphs"
-os.makedirs(GRAPH_FOLDER, exist_ok=True)
+SEGMENT_CACHE = REGISTRY.counter(
+    "usr_segment_cache", "Session store lookups by kind (segments) and result (reused/rebuilt).")
 
 
-@app.route("/", methods=["GET", "POST"])
+def default_config():
+    # Settings create_app reads, taken from the USR_* environment
+    # variables of the same name; a config passed to create_app overrides
+    # them.
+    env = os.environ.get
+    return {
+        "USR_RENDER_CACHE_DIR": env("USR_RENDER_CACHE_DIR", "cache/graphs"),
+        "USR_RENDER_CACHE_SIZE": int(env("USR_RENDER_CACHE_SIZE", "256")),
+        # Parsed segments of this many annotators' last submissions.
+        "USR_SESSION_STORES": int(env("USR_SESSION_STORES", "64")),
+        "USR_RENDER_WORKERS": int(env("USR_RENDER_WORKERS", "4")),
+        "USR_RENDER_QUEUE_SIZE": int(env("USR_RENDER_QUEUE_SIZE", "32")),
+        "USR_RENDER_TIMEOUT": float(env("USR_RENDER_TIMEOUT", "60")),
+        # Set when several server processes share the work (see wsgi.py).
+        "USR_JOB_STATE_DIR": env("USR_JOB_STATE_DIR"),
+        # Server-side corpus file, see corpus().
+        "USR_CORPUS": env("USR_CORPUS"),
+        # Run one small render on every render worker at startup.
+        "USR_WARM_RENDERERS": True,
+        "SECRET_KEY": env("USR_SECRET_KEY"),
+    }
+
+
+class AppState:
+    """Caches, session stores and render workers of one app.
+
+    create_app builds one per app and keeps it in
+    ``app.extensions["usr"]``; views reach it through state().
+    """
+
+    def __init__(self, config, logger):
+        self.logger = logger
+        self.render_cache = RenderCache(config["USR_RENDER_CACHE_DIR"], max_entries=config["USR_RENDER_CACHE_SIZE"])
+        self.segment_stores = SessionStores(max_sessions=config["USR_SESSION_STORES"])
+        # Renders run off the request thread; requests get a job id to poll.
+        self.render_queue = RenderQueue(
+            partial(render_graph, self),
+            max_workers=config["USR_RENDER_WORKERS"],
+            max_pending=config["USR_RENDER_QUEUE_SIZE"],
+            timeout=config["USR_RENDER_TIMEOUT"],
+            state_dir=config["USR_JOB_STATE_DIR"],
+        )
+        self.corpus_file = config["USR_CORPUS"]
+        self.corpus = None
+        self.relation_graph = None
+        self.search_index = None
+        self.corpus_lock = threading.Lock()
+
+
+def state():
+    return current_app.extensions["usr"]
+
+
+def session_store():
+    if "store_id" not in session:
+        session["store_id"] = uuid.uuid4().hex
+    return state().segment_stores.get(session["store_id"])
+
+
+def render_graph(app_state, usr_text, sent_ids, max_depth, store=None, timeout=None):
+    # Runs on a render worker. Returns the cache key of the SVG and, with
+    # a session store, how many segments it could reuse.
+    render_cache = app_state.render_cache
+    lines, offsets = index_segments(usr_text)
+    dot = None
+    stats = None
+    simplified = []
+    if store is None:
+        filtered_data, skipped = collect_segments(lines, offsets, sent_ids, max_depth)
+        key = render_key(lines, offsets, filtered_data, skipped)
+        if not render_cache.has(key):
+            dot = convert_usr_to_dot(filtered_data, skipped, simplified=simplified)
+    else:
+        # Unchanged segments are taken from the session store and their
+        # DOT from the fragment cache; only edited ones are parsed and
+        # converted again. The store tracks one
+        # request at a time, so two jobs of a session take turns here.
+        with store.lock:
+            store.begin()
+            filtered_data, skipped = collect_segments(lines, offsets, sent_ids, max_depth, parse=store.parse)
+            key = render_key(lines, offsets, filtered_data, skipped)
+            if not render_cache.has(key):
+                dot = convert_usr_to_dot(filtered_data, skipped, simplified=simplified)
+            stats = dict(store.stats)
+        app_state.logger.info("segments reused=%(segments_reused)d rebuilt=%(segments_rebuilt)d", stats)
+        for name, count in stats.items():
+            kind, result = name.split("_")
+            SEGMENT_CACHE.inc(count, kind=kind, result=result)
+
+    # Identical resubmissions are served from the cache without dot.
+    if dot is not None:
+        render_cache.put(key, render_svg(dot, timeout=timeout), source=dot.source, engine=dot.engine)
+    if dot is None and is_huge_graph(*graph_size(filtered_data)):
+        # Served from the cache: the same size check tells what the
+        # cached drawing left out.
+        simplified = huge_graph_simplifications()
+    return {"key": key, "reuse": stats, "simplified": simplified}
+
+
+# Longest a poll request is held open waiting for its job.
+MAX_POLL_WAIT = 30
+
+
+def job_id(usr_text, sent_ids, max_depth):
+    # Identical requests share an id, whoever sends them, so a
+    # resubmission while the first is still rendering attaches to it.
+    # Like render_key it depends on the content only: the session store a
+    # job parses through is passed to it, not hashed into the id.
+    digest = hashlib.sha256()
+    for part in (sent_ids or "", str(max_depth), usr_text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def job_status(job):
+    status = job.to_dict()
+    status["poll_url"] = url_for("usr.render_job_status", job_id=job.id)
+    if job.status == DONE:
+        status["graph_url"] = url_for("usr.graph", key=job.result["key"])
+        status["reuse"] = job.result["reuse"]
+        status["simplified"] = job.result["simplified"]
+    return status
+
+
+@views.route("/", methods=["GET", "POST"])
 def index():
 
-    graph_file = None
+    job = None
+    error = None
 
     if request.method == "POST":
 
         usr_text = request.form.get("usr")
-        sent_id = request.form.get("sent_ids")
+        sent_ids = request.form.get("sent_ids")
+        max_depth = request.form.get("depth", 1, type=int)
+
+        store = session_store()
+        try:
+            job = state().render_queue.submit(job_id(usr_text, sent_ids, max_depth), usr_text, sent_ids, max_depth,
+                                              store)
+        except QueueFull:
+            error = "The renderer is busy, please try again in a moment."
+        else:
+            # Cache hits usually finish before the page goes out.
+            job.wait(0.5)
+            job = job_status(job)
+
+    return render_template("index.html", job=job, error=error)
+
+
+@views.route("/graph/<key>.svg")
+def graph(key):
+    if not re.fullmatch(r"[0-9a-f]{64}", key):
+        abort(404)
+    render_cache = state().render_cache
+    svg = render_cache.get(key)
+    if svg is None:
+        # Evicted since its job finished: draw it again from the kept
+        # DOT source.
+        kept = render_cache.source(key)
+        if kept is None:
+            abort(404)
+        source, engine = kept
+        try:
+            svg = render_cache.put(key, render_svg(source, timeout=state().render_queue.timeout, engine=engine))
+        except subprocess.TimeoutExpired:
+            abort(503)
+    # Content-addressed, so the browser may keep it for good.
+    response = Response(svg, mimetype="image/svg+xml")
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
+
+@views.route("/metrics")
+def metrics():
+    # Prometheus scrape endpoint: stage timings, sizes, cache hit rates.
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+@views.route("/jobs", methods=["POST"])
+def submit_render_job():
+    usr_text, sent_ids, max_depth = api_params()
+    if not sent_ids:
+        abort(400, description="missing 'sent_ids'")
+    try:
+        job = state().render_queue.submit(job_id(usr_text, sent_ids, max_depth), usr_text, sent_ids, max_depth)
+    except QueueFull as error:
+        response = jsonify(error=str(error))
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+    return jsonify(job_status(job)), 202
+
+
+@views.route("/jobs/<job_id>")
+def render_job_status(job_id):
+    # ?wait=N long-polls: the response is held for up to N seconds until
+    # the job finishes.
+    job = state().render_queue.get(job_id)
+    if job is None:
+        abort(404)
+    wait = min(request.args.get("wait", 0, type=float), MAX_POLL_WAIT)
+    if wait > 0 and job.status not in FINISHED:
+        job.wait(wait)
+    return jsonify(job_status(job))
+
+
+def corpus():
+    # Optional server-side corpus (USR_CORPUS=path/to/file.txt), served
+    # from a memory-mapped snapshot that is rebuilt when the file changes.
+    app_state = state()
+    if not app_state.corpus_file:
+        abort(404, description="no corpus configured (set USR_CORPUS)")
+    with app_state.corpus_lock:
+        if app_state.corpus is None or not is_current(app_state.corpus_file):
+            # The old mapping is left to the garbage collector: requests
+            # that are still reading from it keep working.
+            app_state.corpus = load_snapshot(app_state.corpus_file)
+            app_state.relation_graph = load_relation_graph(app_state.corpus_file)
+            app_state.search_index = load_search_index(app_state.corpus_file)
+        return app_state.corpus
+
+
+def relation_graph():
+    corpus()
+    return state().relation_graph
+
+
+def search_index():
+    corpus()
+    return state().search_index
+
+
+def direction_param(default=OUTGOING):
+    direction = request.args.get("direction", default)
+    if direction not in DIRECTIONS:
+        abort(400, description=f"'direction' must be one of {', '.join(DIRECTIONS)}")
+    return direction
+
+
+@views.route("/api/corpus/segments/<path:segment_id>")
+def api_corpus_segment(segment_id):
+    sentence = corpus().get(segment_id)
+    if sentence is None:
+        abort(404, description=f"unknown segment {segment_id!r}")
+    return jsonify(segment_id=segment_id, segment=to_dict(sentence))
+
+
+@views.route("/api/corpus/relations/<path:segment_id>")
+def api_corpus_relations(segment_id):
+    # ?hops=1&direction=both -> segments within `hops` relations of
+    # segment_id, nearest first, with their distance.
+    graph = relation_graph()
+    if segment_id not in graph:
+        abort(404, description=f"unknown segment {segment_id!r}")
+    hops = request.args.get("hops", 1, type=int)
+    distances = graph.khop([segment_id], hops, direction_param(BOTH))
+    return jsonify(
+        segment_id=segment_id,
+        outgoing=graph.in_order(graph.outgoing[segment_id]),
+        incoming=graph.in_order(graph.incoming[segment_id]),
+        segments=[{"segment_id": other, "distance": distance} for other, distance in distances.items()],
+    )
+
+
+@views.route("/api/corpus/component/<path:segment_id>")
+def api_corpus_component(segment_id):
+    # All segments connected to segment_id by relations in either direction.
+    graph = relation_graph()
+    if segment_id not in graph:
+        abort(404, description=f"unknown segment {segment_id!r}")
+    return jsonify(segment_id=segment_id, segments=graph.component(segment_id))
+
+
+@views.route("/api/corpus/graph")
+def api_corpus_graph():
+    # ?sent_ids=a,b&depth=1 -> same shape as POST /api/graph.
+    # &direction=in or both also draws the segments that refer to them.
+    sent_ids = request.args.get("sent_ids")
+    if not sent_ids:
+        abort(400, description="missing 'sent_ids'")
+    direction = direction_param()
+    segments, skipped = select_segments(corpus(), sent_ids, request.args.get("depth", 1, type=int),
+                                        graph=relation_graph(), direction=direction)
+    return jsonify(graph_data(segments, skipped))
+
+
+# Segments listed (and drawn) per search at most.
+MAX_SEARCH_RESULTS = 1000
+
+
+@views.route("/api/corpus/search")
+def api_corpus_search():
+    # ?q=sem:per/male head:(word:[conj_*] rel:k1)&limit=50 -> matching
+    # segments in corpus order with the matching token ids (query language
+    # in usr_search). &render=1 also returns the listed segments drawn as
+    # one graph, in the shape of POST /api/graph.
+    query = request.args.get("q")
+    if not query:
+        abort(400, description="missing 'q'")
+    limit = min(max(request.args.get("limit", 50, type=int), 1), MAX_SEARCH_RESULTS)
+    try:
+        total, matches = search_index().search(query, limit)
+    except QueryError as error:
+        abort(400, description=str(error))
+    segment_ids = [segment_id for segment_id, _ in matches]
+    result = {
+        "query": query,
+        "total": total,
+        "segments": [{"segment_id": segment_id, "tokens": tokens} for segment_id, tokens in matches],
+        "graph_url": url_for("usr.api_corpus_graph", sent_ids=",".join(segment_ids), depth=0) if segment_ids else None,
+    }
+    if request.args.get("render") in ("1", "true") and segment_ids:
+        segments, skipped = select_segments(corpus(), segment_ids, 0)
+        result["graph"] = graph_data(segments, skipped)
+    return jsonify(result)
+
+
+def api_params():
+    # JSON body or form fields: usr (required), sent_ids, depth.
+    params = request.get_json(silent=True) or request.form
+    usr_text = params.get("usr")
+    if not usr_text:
+        abort(400, description="missing 'usr'")
+    try:
+        max_depth = int(params.get("depth", 1))
+    except (TypeError, ValueError):
+        abort(400, description="'depth' must be an integer")
+    return usr_text, params.get("sent_ids"), max_depth
+
+
+@views.app_errorhandler(400)
+@views.app_errorhandler(404)
+def api_error(error):
+    if request.path.startswith(("/api/", "/jobs")):
+        return jsonify(error=error.description), error.code
+    return error
+
+
+@views.route("/api/parse", methods=["POST"])
+def api_parse():
+    # Parsed USR (tokens, relations, main, inter_relations). Without
+    # sent_ids the whole text is parsed.
+    usr_text, sent_ids, max_depth = api_params()
+    errors = []
+    skipped = []
+    if sent_ids:
+        lines, offsets = index_segments(usr_text, errors)
+        segments, skipped = collect_segments(lines, offsets, sent_ids, max_depth, errors=errors)
+    else:
+        segments = parse_usrs(usr_text, errors)
+    return jsonify(
+        segments=to_dict(segments),
+        skipped=skipped,
+        errors=[error.to_dict() for error in errors],
+    )
+
+
+@views.route("/api/graph", methods=["POST"])
+def api_graph():
+    # Node/edge/cluster lists for client-side layout; no Graphviz run.
+    usr_text, sent_ids, max_depth = api_params()
+    if not sent_ids:
+        abort(400, description="missing 'sent_ids'")
+    errors = []
+    lines, offsets = index_segments(usr_text, errors)
+    segments, skipped = collect_segments(lines, offsets, sent_ids, max_depth, errors=errors)
+    data = graph_data(segments, skipped)
+    data["key"] = render_key(lines, offsets, segments, skipped)
+    data["errors"] = [error.to_dict() for error in errors]
+    return jsonify(data)
+
+
+# Smallest graph that still runs a layout; used to warm the render workers.
+WARMUP_GRAPH = "digraph { warmup }"
+
 
-        dot = process_and_visualize(usr_text, sent_id)
+def create_app(config=None):
+    # App factory, e.g. for WSGI servers (see wsgi.py): every call builds
+    # a new app with its own SVG cache, session stores and render
+    # workers, from default_config() updated with `config`. Unless
+    # USR_WARM_RENDERERS is off, every render worker runs one small
+    # render before the app is returned, so the first requests do not pay
+    # for thread start-up and Graphviz's first run, and a missing `dot`
+    # is logged at startup.
+    app = Flask(__name__)
+    # Segment order is drawing order; keep it in JSON responses.
+    app.json.sort_keys = False
+    app.config.update(default_config())
+    app.config.update(config or {})
+    if not app.config["SECRET_KEY"]:
+        app.logger.warning("USR_SECRET_KEY is not set: sessions are lost on restart "
+                           "and not shared between server processes")
+        app.config["SECRET_KEY"] = os.urandom(32)
 
-        output_name = f"sentence_{sent_id}"
-        output_path = os.path.join(GRAPH_FOLDER, output_name)
+    app_state = app.extensions["usr"] = AppState(app.config, app.logger)
+    app.register_blueprint(views)
 
-        dot.render(output_path, format="svg", cleanup=True)
+    # Renders from before the cache (static/graphs/sentence_<id>.svg) are
+    # not served any more.
+    remove_legacy_renders()
 
-        graph_file = f"graphs/{output_name}.svg"
+    # The registry is process-wide, so the app created last reports here.
+    render_cache = app_state.render_cache
+    REGISTRY.callback("usr_render_cache_hits", "Renders served from the SVG cache.",
+                      lambda: render_cache.hits, "counter")
+    REGISTRY.callback("usr_render_cache_misses", "Renders that had to run dot.",
+                      lambda: render_cache.misses, "counter")
+    REGISTRY.callback("usr_render_cache_hit_ratio", "SVG cache hits / lookups since start.",
+                      lambda: render_cache.hits / max(1, render_cache.hits + render_cache.misses))
+    REGISTRY.callback("usr_render_jobs_pending", "Render jobs queued or running.",
+                      lambda: app_state.render_queue.pending)
 
-    return render_template("index.html", graph_file=graph_file)
+    if app.config["USR_WARM_RENDERERS"]:
+        render_queue = app_state.render_queue
+        errors = render_queue.warm(lambda: render_svg(WARMUP_GRAPH, timeout=render_queue.timeout))
+        if errors:
+            app.logger.error("render warm-up failed in %d of %d workers: %s",
+                             len(errors), render_queue.max_workers, errors[0])
+    return app
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    # Development server; see wsgi.py for production.
+    logging.basicConfig(level=os.environ.get("USR_LOG_LEVEL", "INFO").upper())
+    create_app().run(debug=True, threaded=True)
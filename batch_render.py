@@ -0,0 +1,276 @@
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+import graphviz
+
+from USR_to_Graph import (
+    RENDERER_VERSION,
+    convert_usr_to_dot,
+    fingerprint_key,
+    iter_blocks,
+    open_usr_file,
+    parse_block,
+    segment_fingerprint,
+    segment_size,
+    walk_segments,
+)
+from renderer import render_svg
+from usr_index import SentenceIndex, resolve_relation
+
+MANIFEST_NAME = "manifest.json"
+
+
+def output_name(segment_id):
+    return "sentence_" + segment_id.replace(os.sep, "_").replace("/", "_") + ".svg"
+
+
+def input_key(input_file):
+    # Manifest key of an input: its normalized path relative to the
+    # working directory, so "a/x.txt" and "./a/x.txt" share entries.
+    try:
+        return os.path.normpath(os.path.relpath(input_file))
+    except ValueError:  # another drive on Windows
+        return os.path.abspath(input_file)
+
+
+def input_output_dir(output_dir, key):
+    # SVGs of one input go under its relative path, so inputs with the
+    # same file name in different directories do not overwrite each
+    # other. Inputs outside the working directory get their file name
+    # and a hash of their path instead.
+    stem = os.path.splitext(key)[0]
+    if os.path.isabs(stem) or stem == os.pardir or stem.startswith(os.pardir + os.sep):
+        digest = hashlib.sha1(os.path.abspath(key).encode("utf-8")).hexdigest()[:10]
+        stem = f"{os.path.basename(stem)}_{digest}"
+    return os.path.join(output_dir, stem)
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if manifest.get("renderer") != RENDERER_VERSION:
+        return {}
+    return manifest.get("files", {})
+
+
+def select_ids(segment_ids, patterns):
+    if not patterns:
+        return list(segment_ids)
+    return [segment_id for segment_id in segment_ids
+            if any(fnmatch.fnmatchcase(segment_id, pattern) for pattern in patterns)]
+
+
+def render_job(job):
+    # Runs in a worker process: one layout per segment, written under a
+    # temporary name and moved into place when complete.
+    segment_id, source, engine, path = job
+    started = time.perf_counter()
+    svg = render_svg(graphviz.Source(source, engine=engine))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(svg)
+    os.replace(tmp_path, path)
+    return segment_id, time.perf_counter() - started
+
+
+def scan_file(input_file):
+    # First pass, one block at a time: the segment ids in file order, and
+    # for each the block it was last defined in, its fingerprint, its
+    # size and the raw targets of its inter-relations. Only this summary
+    # is kept, not the segments.
+    summary = {}
+    for number, (segment_id, first_line, block) in enumerate(iter_blocks(open_usr_file(input_file))):
+        sentence = parse_block(block, segment_id, first_line)
+        targets = [relation["target_sentence"] for relation in sentence["inter_relations"]]
+        summary[segment_id] = (number, segment_fingerprint(segment_id, block), segment_size(sentence), targets)
+    return summary
+
+
+def plan_file(input_file, output_dir, patterns, previous, max_depth, force):
+    # Work out every selected segment's drawing and content key from
+    # scan_file's summary; segments whose key matches the last manifest
+    # and whose SVG is still on disk are skipped. Returns the manifest
+    # entries, a generator of render jobs and the carried-over entries.
+    # The generator streams the file a second time and parses only the
+    # segments of the drawings it still has to build, each kept until
+    # every drawing that needs it is built, so memory follows the
+    # drawings rather than the file.
+    summary = scan_file(input_file)
+    index = SentenceIndex()
+    for segment_id in summary:
+        index.add(segment_id, [])
+
+    def load(segment_id):
+        return summary.get(segment_id)
+
+    def neighbors(segment_id, scanned):
+        return [segment_id if target == segment_id else index.resolve_sentence(target) for target in scanned[3]]
+
+    file_dir = input_output_dir(output_dir, input_key(input_file))
+    os.makedirs(file_dir, exist_ok=True)
+
+    entries = {}
+    drawings = []
+    for segment_id in select_ids(summary, patterns):
+        selected, skipped = walk_segments(segment_id, load, neighbors, max_depth, size=lambda scanned: scanned[2])
+        key = fingerprint_key([scanned[1] for scanned in selected.values()], skipped)
+        path = os.path.join(file_dir, output_name(segment_id))
+        entries[segment_id] = {"key": key, "svg": os.path.relpath(path, output_dir)}
+
+        old = previous.get(segment_id)
+        if not force and old and old.get("key") == key and os.path.exists(path):
+            if "simplified" in old:
+                entries[segment_id]["simplified"] = old["simplified"]
+            continue
+        drawings.append((segment_id, list(selected), skipped, path))
+
+    def jobs():
+        # drawings waiting for a segment, and segments still needed.
+        waiting = {}
+        missing = []
+        needed = {}
+        for number, (_, segment_ids, _, _) in enumerate(drawings):
+            missing.append(len(segment_ids))
+            for segment_id in segment_ids:
+                waiting.setdefault(segment_id, []).append(number)
+                needed[segment_id] = needed.get(segment_id, 0) + 1
+
+        loaded = {}
+        for number, (segment_id, first_line, block) in enumerate(iter_blocks(open_usr_file(input_file))):
+            if not waiting:
+                break
+            if segment_id not in waiting or summary[segment_id][0] != number:
+                continue
+            sentence = loaded[segment_id] = parse_block(block, segment_id, first_line)
+            for relation in sentence["inter_relations"]:
+                resolve_relation(relation, index)
+
+            for drawing in waiting.pop(segment_id):
+                missing[drawing] -= 1
+                if missing[drawing]:
+                    continue
+                seed, segment_ids, skipped, path = drawings[drawing]
+                simplified = []
+                dot = convert_usr_to_dot({member: loaded[member] for member in segment_ids}, skipped,
+                                         simplified=simplified)
+                if simplified:
+                    entries[seed]["simplified"] = simplified
+                yield seed, dot.source, dot.engine, path
+                for member in segment_ids:
+                    needed[member] -= 1
+                    if not needed[member]:
+                        del loaded[member]
+
+    # Segments outside --ids keep their previous manifest entries.
+    carried = {segment_id: previous[segment_id] for segment_id in summary
+               if segment_id not in entries and segment_id in previous}
+    return entries, jobs(), carried
+
+
+def render_corpus(input_files, output_dir, patterns=None, workers=None, max_depth=1, force=False):
+    os.makedirs(output_dir, exist_ok=True)
+    previous = load_manifest(output_dir)
+    started = time.perf_counter()
+
+    # Entries of inputs not in this run are kept, so rendering another
+    # file does not make the next run of this one start over.
+    files = dict(previous)
+    timing = {"files": {}, "rendered": 0, "skipped": 0, "failed": 0}
+    failures = []
+
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for input_file in input_files:
+            file_started = time.perf_counter()
+            key = input_key(input_file)
+            entries, jobs, carried = plan_file(input_file, output_dir, patterns, previous.get(key, {}), max_depth, force)
+            parse_seconds = time.perf_counter() - file_started
+
+            render_seconds = []
+            submitted = 0
+            futures = {}
+
+            def collect(done):
+                for future in done:
+                    segment_id = futures.pop(future)
+                    try:
+                        _, seconds = future.result()
+                    except Exception as error:
+                        failures.append({"file": input_file, "segment_id": segment_id, "error": str(error)})
+                        entries.pop(segment_id, None)
+                        continue
+                    entries[segment_id]["seconds"] = round(seconds, 6)
+                    render_seconds.append(seconds)
+
+            # Jobs are built while earlier ones render; only a few DOT
+            # sources wait for a worker at any time.
+            while True:
+                planning = time.perf_counter()
+                job = next(jobs, None)
+                parse_seconds += time.perf_counter() - planning
+                if job is None:
+                    break
+                futures[pool.submit(render_job, job)] = job[0]
+                submitted += 1
+                if len(futures) >= max_pending:
+                    collect(wait(futures, return_when=FIRST_COMPLETED).done)
+            collect(as_completed(list(futures)))
+
+            files[key] = {**carried, **entries}
+            timing["rendered"] += len(render_seconds)
+            timing["skipped"] += len(entries) - len(render_seconds)
+            timing["failed"] += submitted - len(render_seconds)
+            timing["files"][input_file] = {
+                "segments": len(entries),
+                "rendered": len(render_seconds),
+                "prepare_seconds": round(parse_seconds, 6),
+                "render_seconds": round(sum(render_seconds), 6),
+                "wall_seconds": round(time.perf_counter() - file_started, 6),
+            }
+
+    timing["wall_seconds"] = round(time.perf_counter() - started, 6)
+
+    manifest = {"renderer": RENDERER_VERSION, "files": files, "timing": timing, "failures": failures}
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="USR_to_Graph.py batch",
+                                     description="Render every segment of one or more USR files to SVG.")
+    parser.add_argument("inputs", nargs="+", help="USR files to render")
+    parser.add_argument("-o", "--output", default="graphs", help="output directory (default: graphs)")
+    parser.add_argument("--ids", nargs="*", help="segment ids or glob patterns to render (default: all)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of render workers")
+    parser.add_argument("--depth", type=int, default=1, help="inter-relation hops to include per segment")
+    parser.add_argument("--force", action="store_true", help="re-render segments that are up to date")
+    args = parser.parse_args(argv)
+
+    manifest = render_corpus(args.inputs, args.output, args.ids, args.workers, args.depth, args.force)
+
+    timing = manifest["timing"]
+    for input_file, stats in timing["files"].items():
+        print(f"{input_file}: {stats['segments']} segments, {stats['rendered']} rendered "
+              f"(prepare {stats['prepare_seconds']:.3f}s, render {stats['render_seconds']:.3f}s cpu)")
+    print(f"rendered {timing['rendered']}, skipped {timing['skipped']}, failed {timing['failed']} "
+          f"in {timing['wall_seconds']:.3f}s -> {os.path.join(args.output, MANIFEST_NAME)}")
+    for failure in manifest["failures"]:
+        print(f"error: {failure['file']} {failure['segment_id']}: {failure['error']}", file=sys.stderr)
+    return 1 if manifest["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""Stage timings of both parsers on a synthetic corpus, written as JSON.
+
+    python benchmarks/bench_pipeline.py [--segments 1000] [--constructions 0.5]
+        [--fan-out 2] [--repeat 5] [--render-sample 10] [-o results.json]
+        [--compare previous.json]
+
+For USR_to_Graph.py and usr_to_dot.py separately this times parse_usrs,
+parse_inter_relations (every additional-info cell of the corpus),
+convert_usr_to_dot (the whole corpus as one DOT graph) and the SVG render
+(--render-sample single-segment graphs through render_svg). The
+conversion is forced into detailed mode, whatever the corpus size, and
+timed cold, with the process-wide fragment cache emptied before every
+run, and warm (convert_usr_to_dot_warm), with every fragment already
+cached. Huge-graph mode is timed on its own, cold
+(convert_usr_to_dot_huge). --compare prints the ratio of each stage
+against an earlier results file.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import USR_to_Graph
+import usr_to_dot
+from renderer import get_renderer, render_svg
+from usr_engine import SEGMENT_DIALECT, SENT_DIALECT, clear_fragment_cache, convert_usr_to_dot
+from usr_index import SentenceIndex
+
+from generate_corpus import add_arguments, generate_corpus
+
+MODULES = {
+    "USR_to_Graph": (USR_to_Graph, "segment", SEGMENT_DIALECT),
+    "usr_to_dot": (usr_to_dot, "sent", SENT_DIALECT),
+}
+
+
+def timed(function, repeat, setup=None):
+    # setup runs before every run, outside the timing.
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - started)
+    return {"best": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def inter_relation_cells(sentences):
+    return [(token["info"]["additional_info"], token["id"], segment_id)
+            for segment_id, sentence in sentences.items()
+            for token in sentence["tokens"]
+            if token["info"]["additional_info"] != "-"]
+
+
+def bench_module(module, dialect, text, repeat, render_sample):
+    results = {}
+    results["parse_usrs"] = timed(lambda: module.parse_usrs(text), repeat)
+    sentences = module.parse_usrs(text)
+
+    # The index is built once, as parse_usrs does; only the per-cell
+    # parsing and resolution is timed.
+    cells = inter_relation_cells(sentences)
+    index = SentenceIndex.from_sentences(sentences)
+
+    def parse_cells():
+        for data, source_token, source_sentence in cells:
+            module.parse_inter_relations(data, source_token, source_sentence, sentences, index=index)
+
+    results["parse_inter_relations"] = timed(parse_cells, repeat)
+    results["parse_inter_relations"]["cells"] = len(cells)
+
+    # The module shims pick huge-graph mode by size, which any corpus of
+    # a few hundred segments reaches; the engine is called directly so
+    # the detailed fragments and their cache are what gets timed.
+    def convert(huge=False):
+        return convert_usr_to_dot(sentences, dialect=dialect, huge=huge)
+
+    results["convert_usr_to_dot"] = timed(convert, repeat, setup=clear_fragment_cache)
+    convert()
+    results["convert_usr_to_dot_warm"] = timed(convert, repeat)
+    results["convert_usr_to_dot_huge"] = timed(lambda: convert(huge=True), repeat, setup=clear_fragment_cache)
+
+    sample = {segment_id: sentences[segment_id] for segment_id in list(sentences)[:render_sample]}
+    graphs = [module.convert_usr_to_dot({segment_id: sentence}) for segment_id, sentence in sample.items()]
+
+    def render():
+        for dot in graphs:
+            render_svg(dot)
+
+    if graphs:
+        results["render"] = timed(render, max(1, repeat // 2))
+        results["render"]["graphs"] = len(graphs)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous):
+    print(f"\nagainst {previous.get('revision') or 'previous run'} (best time, lower is better):")
+    for module, stages in results["modules"].items():
+        for stage, timing in stages.items():
+            before = previous.get("modules", {}).get(module, {}).get(stage)
+            if before:
+                print(f"  {module:13} {stage:24} {timing['best'] / before['best']:6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage")
+    parser.add_argument("--render-sample", type=int, default=10, help="segments to render, 0 skips rendering")
+    parser.add_argument("--modules", nargs="+", choices=sorted(MODULES), default=sorted(MODULES))
+    parser.add_argument("-o", "--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    corpus = {"segments": args.segments, "tokens": args.tokens, "constructions": args.constructions,
+              "fan_out": args.fan_out, "seed": args.seed}
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "renderer": get_renderer().name,
+        "corpus": corpus,
+        "modules": {},
+    }
+    for name in args.modules:
+        module, tag, dialect = MODULES[name]
+        text = generate_corpus(args.segments, args.tokens, args.constructions, args.fan_out, tag, args.seed)
+        results["modules"][name] = bench_module(module, dialect, text, args.repeat, args.render_sample)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        for name, stages in results["modules"].items():
+            for stage, timing in stages.items():
+                print(f"{name:13} {stage:24} best {timing['best'] * 1000:10.2f} ms")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
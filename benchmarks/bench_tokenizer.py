@@ -0,0 +1,91 @@
+"""Micro-benchmark: token-row tokenizing, old regex path vs usr_tokenizer.
+
+    python benchmarks/bench_tokenizer.py [--scale 2000] [--repeat 5]
+
+Both variants turn every token row of input.txt (repeated --scale times)
+into word/id/info fields plus (target, label) relation pairs.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from usr_tokenizer import split_relations, split_row
+
+
+def legacy_rows(lines):
+    # The loop body parse_usrs used before usr_tokenizer existed.
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith(("#", "<", "%")) or not line:
+            continue
+        line = re.sub(r'\s+', '\t', line).strip()
+        if len(line.split("\t")) <= 1:
+            continue
+        token_data = line.split("\t")
+        dependency_info = token_data[4] if len(token_data) > 4 else "-"
+        construction_info = token_data[8] if len(token_data) > 8 else "-"
+        relations = []
+        if dependency_info and dependency_info != "-":
+            for dep in dependency_info.split("|"):
+                target, label = dep.split(":")
+                relations.append((target, label))
+        elif construction_info and construction_info != "-":
+            for dep in construction_info.split("|"):
+                target, label = dep.split(":")
+                relations.append((target, label))
+        rows.append((token_data[0], token_data[1], relations))
+    return rows
+
+
+def tokenizer_rows(lines):
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith(("#", "<", "%")) or not line:
+            continue
+        token_data = split_row(line)
+        if token_data is None:
+            continue
+        dependency_info = token_data[4]
+        relation_info = dependency_info if dependency_info != "-" else token_data[8]
+        rows.append((token_data[0], token_data[1], split_relations(relation_info)))
+    return rows
+
+
+def measure(function, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(lines)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", default=os.path.join(ROOT, "input.txt"))
+    parser.add_argument("--scale", type=int, default=2000, help="times to repeat the input")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per variant, best is kept")
+    args = parser.parse_args(argv)
+
+    with open(args.input, "r", encoding="utf-8") as file:
+        lines = file.read().splitlines() * args.scale
+
+    assert legacy_rows(lines[:5000]) == tokenizer_rows(lines[:5000])
+
+    legacy = measure(legacy_rows, lines, args.repeat)
+    tokenizer = measure(tokenizer_rows, lines, args.repeat)
+    print(f"{len(lines)} lines")
+    print(f"legacy regex path : {legacy:12,.0f} lines/sec")
+    print(f"usr_tokenizer     : {tokenizer:12,.0f} lines/sec ({tokenizer / legacy:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Synthetic USR corpus generator for the benchmarks.
+
+    python benchmarks/generate_corpus.py -o corpus.txt --segments 1000 \
+        [--tokens 12] [--constructions 0.5] [--fan-out 2] [--dialect segment|sent]
+
+Segments are shaped like input.txt: nine tab separated columns, one
+0:main token, dependency edges towards later tokens, [conj_1] / [cp_1] /
+[ne_1] construction clusters whose members use the construction column,
+and inter-sentence relations in the additional-info column.
+"""
+import argparse
+import random
+
+WORDS = ["rAma", "mohana", "skUla_1", "pAsa_1", "eka_1", "mExAna_1", "Kela_1", "bAwa_1",
+         "sahapATI_1", "apanA", "xeKaBAla_1", "nirNaya_2", "cikiwsIya_3", "$wyax", "vahAz"]
+VERBS = ["paDZa_1-wA_hE_1", "hE_1-past", "bawA_1-yA_1", "ho_1-gA_1", "kara_1-wA_hE_1"]
+DEPENDENCY_LABELS = ["k1", "k2", "k4", "k7p", "r6", "mod", "dem", "card", "quant", "rt"]
+INTER_LABELS = ["coref", "samAnAXikaraNa", "vyabhicAra", "kAryakAraNa"]
+
+# Construction word -> member labels written in the construction column.
+CONSTRUCTIONS = {
+    "[conj_1]": ["op1", "op2", "op3"],
+    "[cp_1]": ["kriyAmUla", "verbalizer"],
+    "[ne_1]": ["begin", "inside", "end"],
+}
+
+HEADERS = {"segment": "segment_id", "sent": "sent_id"}
+
+
+def segment_ids(segments):
+    return [f"bench_chapter_{number:06d}" for number in range(segments)]
+
+
+def generate_segment(rng, ids, position, tokens, constructions, fan_out):
+    # Plain tokens first, then construction heads, the main verb last.
+    rows = []
+    plain = max(1, tokens - 1)
+    main_id = tokens + len(CONSTRUCTIONS) * 3 + 1
+    next_id = plain + 1
+
+    token_ids = list(range(1, plain + 1))
+    members = {}
+    free = token_ids[:]
+    rng.shuffle(free)
+    for construction, labels in CONSTRUCTIONS.items():
+        if rng.random() >= constructions or len(free) < len(labels):
+            continue
+        construction_id = next_id
+        next_id += 1
+        for label in labels:
+            members[free.pop()] = f"{construction_id}:{label}"
+        rows.append((construction, construction_id, f"{main_id}:{rng.choice(DEPENDENCY_LABELS)}", "-", "-"))
+
+    inter = {}
+    for _ in range(fan_out):
+        if position == 0:
+            break
+        # Mostly nearby earlier segments, as in a running text.
+        target = ids[max(0, position - rng.randint(1, 5))]
+        source = rng.choice(token_ids)
+        entry = f"{target}.{rng.randint(1, plain)}:{rng.choice(INTER_LABELS)}"
+        inter[source] = f"{inter[source]}|{entry}" if source in inter else entry
+
+    for token_id in token_ids:
+        word = rng.choice(WORDS)
+        if token_id in members:
+            rows.append((word, token_id, "-", inter.get(token_id, "-"), members[token_id]))
+        else:
+            head = rng.randint(token_id + 1, plain + 1)
+            head = main_id if head > plain else head
+            rows.append((word, token_id, f"{head}:{rng.choice(DEPENDENCY_LABELS)}", inter.get(token_id, "-"), "-"))
+    rows.append((rng.choice(VERBS), main_id, "0:main", "-", "-"))
+    rows.sort(key=lambda row: row[1])
+
+    return [f"{word}\t{token_id}\t-\t-\t{dependency}\t{additional}\t-\t-\t{construction}"
+            for word, token_id, dependency, additional, construction in rows]
+
+
+def generate_corpus(segments=1000, tokens=12, constructions=0.5, fan_out=2, dialect="segment", seed=0):
+    # constructions: chance per segment of each construction cluster;
+    # fan_out: inter-sentence relations per segment.
+    rng = random.Random(seed)
+    header = HEADERS[dialect]
+    ids = segment_ids(segments)
+    parts = []
+    for position, segment_id in enumerate(ids):
+        parts.append(f"<{header}={segment_id}>")
+        parts.append(f"#synthetic segment {position}")
+        parts.extend(generate_segment(rng, ids, position, tokens, constructions, fan_out))
+        parts.append("%affirmative")
+        parts.append(f"</{header}>")
+        parts.append("")
+    return "\n".join(parts) + "\n"
+
+
+def add_arguments(parser):
+    parser.add_argument("--segments", type=int, default=1000, help="number of segments")
+    parser.add_argument("--tokens", type=int, default=12, help="tokens per segment, main verb included")
+    parser.add_argument("--constructions", type=float, default=0.5,
+                        help="chance (0-1) of each construction cluster per segment")
+    parser.add_argument("--fan-out", type=int, default=2, help="inter-sentence relations per segment")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--dialect", choices=sorted(HEADERS), default="segment",
+                        help="segment: <segment_id=...> (USR_to_Graph), sent: <sent_id=...> (usr_to_dot)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    text = generate_corpus(args.segments, args.tokens, args.constructions, args.fan_out, args.dialect, args.seed)
+    with open(args.output, "w", encoding="utf-8") as file:
+        file.write(text)
+    print(f"{args.segments} segments written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
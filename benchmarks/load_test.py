@@ -0,0 +1,218 @@
+"""Load test of a running server with concurrent simulated annotators.
+
+    python benchmarks/load_test.py [--url http://127.0.0.1:8000] [--annotators 8]
+        [--requests 20 | --duration 60] [--segments 200] [--edit-rate 0.5]
+        [--endpoint jobs|page|both] [-o results.json]
+
+Each annotator thread submits a random segment of a synthetic chapter,
+long-polls the job and downloads the SVG. It submits either through the
+JSON API (POST /jobs) or through the web form (POST /), which keeps a
+session cookie per annotator and so goes through that session's segment
+store; --endpoint both picks one at random for every request. With
+probability --edit-rate it first edits a word of that segment, as an
+annotator would, so the render cache is missed and dot runs. Latency is
+measured from submit to the last byte of the SVG; the report gives
+p50/p90/p99 latency, throughput and failures.
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from html import unescape
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode, urljoin
+
+from generate_corpus import add_arguments, generate_corpus
+
+FINISHED = ("done", "failed", "timeout")
+ENDPOINTS = ("jobs", "page")
+
+# What the form page shows for a finished job, for one still running, and
+# when the queue is full (see templates/index.html).
+PAGE_GRAPH = re.compile(r'data="(/graph/[0-9a-f]{64}\.svg)"')
+PAGE_JOB = re.compile(r"showJob\((\{.*\})\);")
+PAGE_BUSY = "The renderer is busy"
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of an already sorted list.
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(fraction * len(values) + 0.5) - 1))]
+
+
+def request_json(url, body=None, timeout=60, opener=None):
+    data = None if body is None else json.dumps(body).encode("utf-8")
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with (opener or urllib.request.build_opener()).open(request, timeout=timeout) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error:
+        return error.code, None
+
+
+def edit_segment(text, segment_id, serial):
+    # Rename the first token of the segment; enough to change its content key.
+    header = f"<segment_id={segment_id}>\n"
+    start = text.index(header) + len(header)
+    while text.startswith("#", start):
+        start = text.index("\n", start) + 1
+    end = text.index("\t", start)
+    return text[:start] + f"{text[start:end]}_e{serial}" + text[end:]
+
+
+def submit_job(base_url, text, segment_id, depth, opener):
+    # POST /jobs: (outcome, job) where outcome is None when accepted.
+    status, job = request_json(urljoin(base_url, "/jobs"), {"usr": text, "sent_ids": segment_id, "depth": depth},
+                               opener=opener)
+    if status == 503:
+        return "rejected", None
+    if status != 202:
+        return f"http_{status}", None
+    return None, job
+
+
+def submit_page(base_url, text, segment_id, depth, opener):
+    # POST / as the form does. The page either links the finished SVG or
+    # embeds the job for its script to poll.
+    data = urlencode({"usr": text, "sent_ids": segment_id, "depth": depth}).encode("utf-8")
+    try:
+        with opener.open(urljoin(base_url, "/"), data=data, timeout=60) as response:
+            page = response.read().decode("utf-8")
+    except urllib.error.HTTPError as error:
+        return f"http_{error.code}", None
+    if PAGE_BUSY in page:
+        return "rejected", None
+    graph = PAGE_GRAPH.search(page)
+    if graph:
+        return None, {"status": "done", "graph_url": unescape(graph.group(1))}
+    job = PAGE_JOB.search(page)
+    if job is None:
+        return "no_job", None
+    return None, json.loads(job.group(1))
+
+
+def render_once(base_url, text, segment_id, depth, endpoint="jobs", opener=None):
+    # One annotator request: submit, poll until finished, fetch the SVG.
+    opener = opener or urllib.request.build_opener()
+    submit = submit_page if endpoint == "page" else submit_job
+    outcome, job = submit(base_url, text, segment_id, depth, opener)
+    if outcome is not None:
+        return outcome
+    while job["status"] not in FINISHED:
+        status, job = request_json(urljoin(base_url, job["poll_url"]) + "?wait=25", opener=opener)
+        if status != 200:
+            return f"http_{status}"
+    if job["status"] != "done":
+        return job["status"]
+    with opener.open(urljoin(base_url, job["graph_url"]), timeout=60) as response:
+        response.read()
+    return "ok"
+
+
+def annotator(number, args, text, segment_ids, deadline, results, lock):
+    rng = random.Random(args.seed + number)
+    # One cookie jar per annotator: one session, one segment store.
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    done = 0
+    while (args.duration and time.monotonic() < deadline) or (not args.duration and done < args.requests):
+        segment_id = rng.choice(segment_ids)
+        if rng.random() < args.edit_rate:
+            text = edit_segment(text, segment_id, f"{number}_{done}")
+        endpoint = rng.choice(ENDPOINTS) if args.endpoint == "both" else args.endpoint
+        started = time.perf_counter()
+        try:
+            outcome = render_once(args.url, text, segment_id, args.depth, endpoint, opener)
+        except (OSError, ValueError) as error:
+            outcome = type(error).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            results.append((endpoint, outcome, elapsed))
+        done += 1
+        if outcome == "rejected":
+            time.sleep(1)
+
+
+def latency_summary(latencies):
+    # Milliseconds, from a sorted list of seconds.
+    summary = {
+        "p50": percentile(latencies, 0.50),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.mean(latencies) if latencies else None,
+        "max": latencies[-1] if latencies else None,
+    }
+    return {name: None if value is None else round(value * 1000, 1) for name, value in summary.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.set_defaults(segments=200)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="server to test")
+    parser.add_argument("--annotators", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=20, help="requests per annotator")
+    parser.add_argument("--duration", type=float, help="run for this many seconds instead")
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--edit-rate", type=float, default=0.5, help="chance (0-1) of editing before a request")
+    parser.add_argument("--endpoint", choices=ENDPOINTS + ("both",), default="both",
+                        help="submit through POST /jobs, the form page POST /, or both")
+    parser.add_argument("-o", "--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    text = generate_corpus(args.segments, args.tokens, args.constructions, args.fan_out, "segment", args.seed)
+    segment_ids = [line[len("<segment_id="):-1] for line in text.splitlines() if line.startswith("<segment_id=")]
+
+    results = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = time.monotonic() + (args.duration or 0)
+    threads = [threading.Thread(target=annotator, args=(number, args, text, segment_ids, deadline, results, lock))
+               for number in range(args.annotators)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for _, outcome, elapsed in results if outcome == "ok")
+    outcomes = {}
+    for _, outcome, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    report = {
+        "url": args.url,
+        "annotators": args.annotators,
+        "endpoint": args.endpoint,
+        "requests": len(results),
+        "outcomes": outcomes,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(len(latencies) / wall, 3) if wall else None,
+        "latency_ms": latency_summary(latencies),
+        "latency_ms_by_endpoint": {
+            endpoint: latency_summary(sorted(elapsed for used, outcome, elapsed in results
+                                             if used == endpoint and outcome == "ok"))
+            for endpoint in ENDPOINTS if any(used == endpoint for used, _, _ in results)
+        },
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    latency = report["latency_ms"]
+    print(f"{report['requests']} requests from {args.annotators} annotators in {report['wall_seconds']}s: "
+          f"{report['throughput_per_second']} renders/s")
+    print(f"latency ms: p50 {latency['p50']}, p90 {latency['p90']}, p99 {latency['p99']}, max {latency['max']}")
+    for endpoint, latency in report["latency_ms_by_endpoint"].items():
+        print(f"  {endpoint}: p50 {latency['p50']}, p90 {latency['p90']}, p99 {latency['p99']}")
+    print("outcomes: " + ", ".join(f"{name} {count}" for name, count in sorted(outcomes.items())))
+    return 0 if outcomes.get("ok") == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+from functools import lru_cache
+
+from graphviz.quoting import quote as graphviz_quote, quote_edge as graphviz_quote_edge
+
+# DOT statements written as text, line for line what graphviz.Digraph's
+# node()/edge()/subgraph() would append to .body (label first, the other
+# attributes sorted by name), so fragments built here can be mixed with
+# Digraph output and the source stays byte-identical. Quoting runs a few
+# regexes per string; words, labels and tooltips repeat across a corpus,
+# so it is memoized.
+
+quote = lru_cache(maxsize=1 << 16)(graphviz_quote)
+quote_edge = lru_cache(maxsize=1 << 16)(graphviz_quote_edge)
+
+
+def attr_list(label=None, **attrs):
+    parts = [f"label={quote(label)}"] if label is not None else []
+    parts.extend(f"{name}={quote(value)}" for name, value in sorted(attrs.items()) if value is not None)
+    return f" [{' '.join(parts)}]" if parts else ""
+
+
+def node(name, attributes="", indent="\t"):
+    # attributes: the output of attr_list(), usually computed once per
+    # distinct label.
+    return f"{indent}{quote(name)}{attributes}\n"
+
+
+def edge(tail, head, attributes="", indent="\t"):
+    return f"{indent}{quote_edge(tail)} -> {quote_edge(head)}{attributes}\n"
+
+
+def subgraph(name, lines, graph_attributes=None):
+    # Body lines of `with dot.subgraph(name=...) as sub: sub.attr(...)`;
+    # `lines` are sub's own statements, written with indent="\t\t".
+    out = [f"\tsubgraph {quote(name)} {{\n"]
+    if graph_attributes:
+        # Graph attributes are all sorted by name, label included.
+        attributes = " ".join(f"{key}={quote(value)}" for key, value in sorted(graph_attributes.items()))
+        out.append(f"\t\t{attributes}\n")
+    out.extend(lines)
+    out.append("\t}\n")
+    return out
@@ -0,0 +1,22 @@
+# gunicorn -c gunicorn.conf.py wsgi:application
+import multiprocessing
+import os
+import secrets
+
+bind = os.environ.get("USR_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("USR_WEB_WORKERS", multiprocessing.cpu_count()))
+
+# Job polls (/jobs/<id>?wait=) hold a request open for up to 30 s, so each
+# worker process serves requests from a pool of threads.
+worker_class = "gthread"
+threads = int(os.environ.get("USR_WEB_THREADS", "16"))
+timeout = 90
+
+# Each worker imports the app and starts its own render threads; threads
+# started in the master before forking would not exist in the workers.
+preload_app = False
+
+# Shared by every worker: a session cookie must verify on any of them,
+# and a job poll may reach a worker other than the one rendering it.
+os.environ.setdefault("USR_SECRET_KEY", secrets.token_hex(32))
+os.environ.setdefault("USR_JOB_STATE_DIR", "cache/jobs")
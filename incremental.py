@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+from USR_to_Graph import parse_segment, segment_fingerprint
+
+
+class SegmentStore:
+    """Parsed segments, keyed by content fingerprint.
+
+    One store lives per annotator session. When the same chapter is
+    resubmitted with one segment edited, only that segment is parsed
+    again; the rest come from the store.
+
+    Only parsing is per session. DOT fragments come from the one
+    process-wide LRU in usr_engine (cached_fragment), keyed by segment
+    content, so sessions share them. Inter-relations are copied fresh on
+    every use, and every request resolves them and draws their edges
+    again, because they depend on the other segments of the request.
+
+    The fingerprint ignores where a segment sits in the pasted text, so
+    parse errors are not kept: a reused segment that had errors is
+    parsed again when the caller collects them, to report its current
+    line numbers.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.parsed = OrderedDict()
+        self.stats = {}
+        # Held by callers that run begin() and a whole request as a unit.
+        self.lock = threading.RLock()
+        self.begin()
+
+    def begin(self):
+        # Start a new request: reset the per-request counters.
+        with self.lock:
+            self.stats = {"segments_reused": 0, "segments_rebuilt": 0}
+
+    def parse(self, lines, segment_id, first_line=None, errors=None):
+        # Drop-in replacement for parse_segment (see collect_segments).
+        fingerprint = segment_fingerprint(segment_id, lines)
+        with self.lock:
+            entry = self.parsed.get(fingerprint)
+            if entry is not None:
+                self.parsed.move_to_end(fingerprint)
+                self.stats["segments_reused"] += 1
+
+        if entry is None:
+            segment_errors = []
+            sentence = parse_segment(lines, segment_id, first_line, segment_errors)
+            inter_relations = [dict(relation) for relation in sentence["inter_relations"]]
+            entry = (sentence, inter_relations, bool(segment_errors))
+            with self.lock:
+                self.parsed[fingerprint] = entry
+                self.stats["segments_rebuilt"] += 1
+                self._evict(self.parsed)
+            if errors is not None:
+                errors.extend(segment_errors)
+        elif errors is not None and entry[2]:
+            parse_segment(lines, segment_id, first_line, errors)
+
+        sentence, inter_relations, _ = entry
+        return {
+            "tokens": sentence["tokens"],
+            "main": sentence["main"],
+            "inter_relations": [dict(relation) for relation in inter_relations],
+        }
+
+    def _evict(self, entries):
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+
+class SessionStores:
+    """Bounded LRU of SegmentStore objects keyed by session id."""
+
+    def __init__(self, max_sessions=64, max_entries=4096):
+        self.max_sessions = max_sessions
+        self.max_entries = max_entries
+        self.stores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            store = self.stores.get(session_id)
+            if store is None:
+                store = self.stores[session_id] = SegmentStore(self.max_entries)
+            self.stores.move_to_end(session_id)
+            while len(self.stores) > self.max_sessions:
+                self.stores.popitem(last=False)
+            return store
@@ -0,0 +1,174 @@
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# USR_METRICS=0 turns the stage timers into plain function calls.
+ENABLED = os.environ.get("USR_METRICS", "1") != "0"
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.values)
+        return [f"{self.name}_total{format_labels(key)} {format_value(value)}" for key, value in values.items()]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self.series.items()}
+        lines = []
+        for key, (counts, total, count) in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class Callback:
+    """Value read at scrape time, e.g. a cache's hit counter."""
+
+    def __init__(self, name, help, type, function):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.function = function
+
+    def samples(self):
+        value = self.function()
+        suffix = "_total" if self.type == "counter" else ""
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{self.name}{suffix}{format_labels(key)} {format_value(item)}" for key, item in value.items()]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, metric):
+        # Registering a name again replaces the old metric, so modules
+        # that are reloaded (Flask debug reloader, tests) do not clash.
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help):
+        return self.add(Counter(name, help))
+
+    def histogram(self, name, help, buckets=SECONDS_BUCKETS):
+        return self.add(Histogram(name, help, buckets))
+
+    def callback(self, name, help, function, type="gauge"):
+        return self.add(Callback(name, help, type, function))
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4.
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "usr_stage_seconds", "Wall time per pipeline stage; outer stages include the inner ones.")
+TOKENS = REGISTRY.counter("usr_tokens", "Token rows read, counted per file or request.")
+INTER_RELATIONS = REGISTRY.counter("usr_inter_relations", "Inter-sentence relations read, counted per file or request.")
+GRAPH_NODES = REGISTRY.histogram("usr_graph_nodes", "Nodes per DOT graph built.", SIZE_BUCKETS)
+GRAPH_EDGES = REGISTRY.histogram("usr_graph_edges", "Edges per DOT graph built.", SIZE_BUCKETS)
+
+
+def timed(stage):
+    # Decorator: record the call's duration in usr_stage_seconds under
+    # {stage}. Meant for whole-file and per-request stages: timing every
+    # segment costs a noticeable share of the parse itself.
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+        return wrapper
+    return decorate
+
+
+def count_segments(sentences):
+    # Add the tokens and inter-relations of a parsed batch (any iterable
+    # of segments) to usr_tokens / usr_inter_relations in one step.
+    tokens = inter_relations = 0
+    for sentence in sentences:
+        tokens += len(sentence["tokens"])
+        inter_relations += len(sentence["inter_relations"])
+    TOKENS.inc(tokens)
+    INTER_RELATIONS.inc(inter_relations)
+
+
+def observe_graph(nodes, edges):
+    GRAPH_NODES.observe(nodes)
+    GRAPH_EDGES.observe(edges)
@@ -0,0 +1,158 @@
+import argparse
+import sys
+from collections import deque
+
+OUTGOING = "out"
+INCOMING = "in"
+BOTH = "both"
+DIRECTIONS = (OUTGOING, INCOMING, BOTH)
+
+
+class RelationGraph:
+    """Which segments refer to which, over a whole corpus.
+
+    ``outgoing[a]`` holds the segments a's inter-relations point at,
+    ``incoming[a]`` the segments pointing at a. Connected components
+    (ignoring direction) are labelled on first use, after which
+    ``component()`` is a dict lookup.
+    """
+
+    def __init__(self, segments=(), edges=()):
+        self.order = list(segments)
+        self.position = {segment_id: index for index, segment_id in enumerate(self.order)}
+        self.outgoing = {segment_id: set() for segment_id in self.order}
+        self.incoming = {segment_id: set() for segment_id in self.order}
+        for source, target in edges:
+            self.add_edge(source, target)
+        self._component_of = None
+        self._components = None
+
+    @classmethod
+    def from_sentences(cls, sentences):
+        # Uses resolved inter-relations (parse_usrs / resolve_inter_relations);
+        # targets outside the corpus and self references are left out.
+        edges = []
+        for segment_id, sentence in sentences.items():
+            for relation in sentence["inter_relations"]:
+                target = relation["target_sentence"]
+                if target != segment_id and target in sentences:
+                    edges.append((segment_id, target))
+        return cls(sentences, edges)
+
+    def add_edge(self, source, target):
+        for segment_id in (source, target):
+            if segment_id not in self.outgoing:
+                self.position[segment_id] = len(self.order)
+                self.order.append(segment_id)
+                self.outgoing[segment_id] = set()
+                self.incoming[segment_id] = set()
+        self.outgoing[source].add(target)
+        self.incoming[target].add(source)
+        self._component_of = None
+
+    def __contains__(self, segment_id):
+        return segment_id in self.outgoing
+
+    def __len__(self):
+        return len(self.order)
+
+    def neighbors(self, segment_id, direction=BOTH):
+        if segment_id not in self.outgoing:
+            return set()
+        if direction == OUTGOING:
+            return self.outgoing[segment_id]
+        if direction == INCOMING:
+            return self.incoming[segment_id]
+        return self.outgoing[segment_id] | self.incoming[segment_id]
+
+    def in_order(self, segment_ids):
+        # Corpus order, so walks and listings are deterministic.
+        return sorted(segment_ids, key=self.position.__getitem__)
+
+    def khop(self, seeds, hops=1, direction=BOTH):
+        # Breadth-first: segment id -> distance from the nearest seed, in
+        # the order reached (nearest first, ties in corpus order).
+        distances = {seed: 0 for seed in seeds if seed in self.outgoing}
+        queue = deque(distances)
+        while queue:
+            segment_id = queue.popleft()
+            distance = distances[segment_id]
+            if distance >= hops:
+                continue
+            for neighbor in self.in_order(self.neighbors(segment_id, direction)):
+                if neighbor not in distances:
+                    distances[neighbor] = distance + 1
+                    queue.append(neighbor)
+        return distances
+
+    def component(self, segment_id):
+        # Every segment linked to segment_id through any chain of
+        # relations, in corpus order.
+        if self._component_of is None:
+            self._label_components()
+        number = self._component_of.get(segment_id)
+        return [] if number is None else self._components[number]
+
+    def _label_components(self):
+        component_of = {}
+        components = []
+        for start in self.order:
+            if start in component_of:
+                continue
+            number = len(components)
+            component_of[start] = number
+            members = [start]
+            queue = deque(members)
+            while queue:
+                for neighbor in self.neighbors(queue.popleft()):
+                    if neighbor not in component_of:
+                        component_of[neighbor] = number
+                        members.append(neighbor)
+                        queue.append(neighbor)
+            components.append(self.in_order(members))
+        self._component_of = component_of
+        self._components = components
+
+    def to_dict(self):
+        # Compact form for JSON: segments once, edges as index pairs.
+        return {
+            "segments": self.order,
+            "edges": [[self.position[source], self.position[target]]
+                      for source in self.order for target in self.in_order(self.outgoing[source])],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        segments = data["segments"]
+        return cls(segments, ((segments[source], segments[target]) for source, target in data["edges"]))
+
+
+def main(argv=None):
+    # Query the corpus relation graph without drawing anything. Imported
+    # here because usr_snapshot imports this module.
+    from USR_to_Graph import split_segment_ids
+    from usr_snapshot import load_relation_graph
+
+    parser = argparse.ArgumentParser(prog="USR_to_Graph.py relations",
+                                     description="List the segments related to the given ones.")
+    parser.add_argument("input_file")
+    parser.add_argument("sent_ids", help="comma separated segment ids")
+    parser.add_argument("--hops", type=int, default=1)
+    parser.add_argument("--direction", choices=DIRECTIONS, default=BOTH)
+    parser.add_argument("--component", action="store_true",
+                        help="list the whole connected component instead")
+    args = parser.parse_args(argv)
+
+    graph = load_relation_graph(args.input_file)
+    seeds = split_segment_ids(args.sent_ids)
+    if args.component:
+        for segment_id in graph.in_order({member for seed in seeds for member in graph.component(seed)}):
+            print(segment_id)
+    else:
+        for segment_id, distance in graph.khop(seeds, args.hops, args.direction).items():
+            print(f"{distance}\t{segment_id}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import os
+import re
+import threading
+import time
+import uuid
+
+# Cached renders are named after their content key, e.g. "3f2a...e9.svg".
+CACHE_FILE = re.compile(r"^[0-9a-f]{64}\.svg$")
+SOURCE_FILE = re.compile(r"^[0-9a-f]{64}\.gv$")
+# Temporary files older than this belong to renders that were interrupted.
+STALE_TMP_SECONDS = 3600
+# Where the web UI wrote sentence_<id>.svg (and its DOT source) before
+# the cache existed.
+LEGACY_GRAPH_FOLDER = "static/graphs"
+
+
+def remove_legacy_renders(directory=LEGACY_GRAPH_FOLDER):
+    # Nothing reads the old per-id outputs any more. Removes them and the
+    # folder once it is empty; returns how many files were removed.
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if entry.is_file() and entry.name.startswith("sentence_"):
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    try:
+        os.rmdir(directory)
+    except OSError:  # other files are left where they are
+        pass
+    return removed
+
+
+class RenderCache:
+    """Content-addressed SVG cache on disk with LRU eviction.
+
+    Recency is tracked through file mtimes, so the cache survives restarts
+    and is shared by every process serving the same directory.
+
+    The DOT source of each render can be kept too (in ``sources/``, up to
+    max_sources of them, by default four times max_entries). Sources are
+    much smaller than SVGs and outlive them, so an evicted SVG whose URL
+    was already handed out can be drawn again.
+    """
+
+    def __init__(self, directory, max_entries=256, max_sources=None):
+        self.directory = directory
+        self.source_directory = os.path.join(directory, "sources")
+        self.max_entries = max_entries
+        self.max_sources = 4 * max_entries if max_sources is None else max_sources
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.source_directory, exist_ok=True)
+        self.cleanup_stale()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.svg")
+
+    def source_path_for(self, key):
+        return os.path.join(self.source_directory, f"{key}.gv")
+
+    def has(self, key):
+        # Counts as a use: refreshes the entry's LRU position.
+        try:
+            os.utime(self.path_for(key))
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def get(self, key):
+        try:
+            with open(self.path_for(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def source(self, key):
+        # (DOT source, layout engine) kept by put(), or None.
+        try:
+            with open(self.source_path_for(key), "r", encoding="utf-8") as file:
+                engine = file.readline().rstrip("\n")
+                return file.read(), engine
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, svg, source=None, engine="dot"):
+        # Write under a private name and move it into place, so readers
+        # never see a half-written SVG.
+        if source is not None:
+            self._write(self.source_path_for(key), f"{engine}\n{source}".encode("utf-8"))
+        self._write(self.path_for(key), svg)
+        self.evict()
+        return svg
+
+    def _write(self, path, data):
+        tmp_path = os.path.join(self.directory, f".tmp_{os.path.basename(path)}_{uuid.uuid4().hex}")
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def entries(self, directory=None, pattern=CACHE_FILE):
+        entries = []
+        for entry in os.scandir(directory or self.directory):
+            if pattern.match(entry.name):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    def evict(self):
+        with self._lock:
+            for entries, limit in ((self.entries(), self.max_entries),
+                                   (self.entries(self.source_directory, SOURCE_FILE), self.max_sources)):
+                if len(entries) <= limit:
+                    continue
+                entries.sort()
+                for _, path in entries[:len(entries) - limit]:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def cleanup_stale(self):
+        # Drop the old per-id outputs (sentence_<id>.svg), leftover DOT
+        # sources and interrupted temporary renders. Other server processes
+        # may share the directory, so recent temporary files are left to
+        # the render that is still writing them.
+        cutoff = time.time() - STALE_TMP_SECONDS
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or CACHE_FILE.match(entry.name):
+                continue
+            if entry.name.startswith(".tmp_"):
+                try:
+                    if entry.stat().st_mtime > cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+            if entry.name.startswith(("sentence_", ".tmp_")) or entry.name.endswith(".gv"):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        self.evict()
@@ -0,0 +1,294 @@
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REGISTRY
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+TIMEOUT = "timeout"
+
+FINISHED = (DONE, FAILED, TIMEOUT)
+
+# Job ids that may name a state file.
+STATE_NAME = re.compile(r"^[0-9A-Za-z_-]{1,128}$")
+# How often a job owned by another process is re-read while waiting.
+STATE_POLL_INTERVAL = 0.1
+
+JOBS = REGISTRY.counter("usr_render_jobs", "Render jobs by final status.")
+JOB_QUEUED_SECONDS = REGISTRY.histogram("usr_render_job_queued_seconds", "Time jobs waited for a render worker.")
+
+
+class QueueFull(Exception):
+    """Raised by RenderQueue.submit when too many jobs are waiting."""
+
+
+class RenderJob:
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "queued_seconds": round((self.started or time.time()) - self.submitted, 3),
+            "run_seconds": round((self.finished or time.time()) - self.started, 3) if self.started else None,
+        }
+
+    def state(self):
+        return {"id": self.id, "status": self.status, "result": self.result, "error": self.error,
+                "submitted": self.submitted, "started": self.started, "finished": self.finished,
+                "owner": os.getpid()}
+
+
+def process_alive(pid):
+    if os.name == "nt":  # os.kill(pid, 0) would terminate the process there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class StoredJob(RenderJob):
+    """A job run by another process, read back from its state file.
+
+    wait() re-reads the file until the job finishes or the time is up.
+    An unfinished job whose owning process has exited is reported as
+    failed. Owners are process ids, so the processes sharing a state
+    directory must run on one host.
+    """
+
+    def __init__(self, path):
+        super().__init__(None)
+        self.path = path
+        self.owner = None
+
+    def refresh(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return False
+        for name, value in state.items():
+            setattr(self, name, value)
+        if self.status not in FINISHED and not process_alive(self.owner):
+            self.status = FAILED
+            self.error = "the server process running this job exited"
+        if self.status in FINISHED:
+            self._done.set()
+        return True
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._done.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(STATE_POLL_INTERVAL)
+            self.refresh()
+        return self._done.is_set()
+
+
+class RenderQueue:
+    """Bounded pool of render workers with job ids for polling.
+
+    submit() returns at once. Jobs are keyed by the caller's id, so an
+    identical request that is still queued or running is attached to the
+    existing job instead of rendering twice. When max_pending jobs are
+    waiting or running, submit raises QueueFull. Each job gets `timeout`
+    seconds of layout time; work() must accept a timeout keyword and
+    raise subprocess.TimeoutExpired when it runs out (render_svg does).
+
+    With a state_dir every status change is also written there, so when
+    several server processes share the directory, a poll that lands on a
+    process other than the one running the job still finds it. Results
+    must then be JSON-serialisable. The de-duplication is shared too: a
+    process claims a job id with an exclusive lock file before running
+    it, and an identical request reaching another process while the job
+    runs is attached to it (as a StoredJob) instead of rendering twice.
+    """
+
+    def __init__(self, work, max_workers=4, max_pending=32, timeout=60.0, keep_finished=256, state_dir=None):
+        self.work = work
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.keep_finished = keep_finished
+        self.state_dir = state_dir
+        self.jobs = OrderedDict()
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render")
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def submit(self, job_id, *args, **kwargs):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.status not in FINISHED:
+                self.jobs.move_to_end(job_id)
+                return job
+            if self.pending >= self.max_pending:
+                raise QueueFull(f"{self.pending} render jobs pending")
+            running = self._claim(job_id)
+            if running is not None:
+                return running
+            job = self.jobs[job_id] = RenderJob(job_id)
+            self.jobs.move_to_end(job_id)
+            self.pending += 1
+        self._save(job)
+        self._executor.submit(self._run, job, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None and self.state_dir and STATE_NAME.match(job_id):
+            job = StoredJob(self._state_path(job_id))
+            if not job.refresh():
+                return None
+        return job
+
+    def warm(self, function, timeout=30):
+        # Start every worker thread now and run function() on each (e.g.
+        # a tiny render, so dot and its fonts are loaded before the first
+        # real request and a missing Graphviz shows up at startup).
+        # Returns the errors raised, if any.
+        barrier = threading.Barrier(self.max_workers, timeout=timeout)
+
+        def warm_one():
+            barrier.wait()
+            function()
+
+        futures = [self._executor.submit(warm_one) for _ in range(self.max_workers)]
+        return [future.exception() for future in futures if future.exception()]
+
+    def _state_path(self, job_id):
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _lock_path(self, job_id):
+        return os.path.join(self.state_dir, f"{job_id}.lock")
+
+    def _claim(self, job_id):
+        # Take the job's lock file, holding this process id, so no other
+        # process sharing state_dir runs the same job. Returns None once
+        # claimed, or the job of the live process holding the lock. A
+        # lock left by an exited process is taken over.
+        if not self.state_dir or not STATE_NAME.match(job_id):
+            return None
+        path = self._lock_path(job_id)
+        # Written aside and linked into place, so the lock never exists
+        # without its owner.
+        tmp_path = os.path.join(self.state_dir, f".tmp_{job_id}_{uuid.uuid4().hex}")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(str(os.getpid()))
+        try:
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, path)
+                    return None
+                except FileExistsError:
+                    pass
+                owner = self._lock_owner(job_id)
+                if owner and owner != os.getpid() and process_alive(owner):
+                    job = StoredJob(self._state_path(job_id))
+                    job.refresh()
+                    job.id = job_id
+                    return job
+                self._release(job_id, owner)
+            return None
+        finally:
+            os.remove(tmp_path)
+
+    def _lock_owner(self, job_id):
+        try:
+            with open(self._lock_path(job_id), "r", encoding="utf-8") as file:
+                return int(file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _release(self, job_id, owner=None):
+        # Remove the lock if it is still owner's (by default this
+        # process's); another process may have taken it over meanwhile.
+        if not self.state_dir or self._lock_owner(job_id) != (owner or os.getpid()):
+            return
+        try:
+            os.remove(self._lock_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _save(self, job):
+        if not self.state_dir:
+            return
+        path = self._state_path(job.id)
+        tmp_path = os.path.join(self.state_dir, f".tmp_{job.id}_{uuid.uuid4().hex}")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(job.state(), file)
+        os.replace(tmp_path, path)
+
+    def _run(self, job, args, kwargs):
+        job.status = RUNNING
+        job.started = time.time()
+        JOB_QUEUED_SECONDS.observe(job.started - job.submitted)
+        self._save(job)
+        try:
+            job.result = self.work(*args, timeout=self.timeout, **kwargs)
+            job.status = DONE
+        except subprocess.TimeoutExpired:
+            job.status = TIMEOUT
+            job.error = f"layout did not finish within {self.timeout:g}s"
+        except Exception as error:
+            job.status = FAILED
+            job.error = str(error) or type(error).__name__
+        finally:
+            job.finished = time.time()
+            JOBS.inc(status=job.status)
+            self._save(job)
+            self._release(job.id)
+            with self._lock:
+                self.pending -= 1
+                forgotten = self._forget_finished()
+            job._done.set()
+            for job_id in forgotten:
+                self._remove_state(job_id)
+
+    def _forget_finished(self):
+        # Keep the most recent finished jobs around for late pollers.
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED]
+        forgotten = finished[:max(0, len(finished) - self.keep_finished)]
+        for job_id in forgotten:
+            del self.jobs[job_id]
+        return forgotten
+
+    def _remove_state(self, job_id):
+        if not self.state_dir:
+            return
+        try:
+            os.remove(self._state_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
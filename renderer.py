@@ -0,0 +1,140 @@
+import os
+import subprocess
+import tempfile
+
+import graphviz
+
+from metrics import timed
+
+try:
+    import pygraphviz
+except ImportError:  # optional, needs the Graphviz C headers to install
+    pygraphviz = None
+
+
+class PygraphvizRenderer:
+    """Lays out in-process through the cgraph/gvc bindings: no fork, no files."""
+
+    name = "pygraphviz"
+    # An in-process layout cannot be interrupted, so render_svg switches
+    # to the pipe backend when a timeout is requested.
+    supports_timeout = False
+
+    def render(self, source, engine="dot", format="svg", timeout=None):
+        graph = pygraphviz.AGraph(string=source)
+        return graph.draw(format=format, prog=engine)
+
+
+class PipeRenderer:
+    """Streams DOT source into `dot` on stdin and reads SVG from stdout."""
+
+    name = "pipe"
+    supports_timeout = True
+
+    def render(self, source, engine="dot", format="svg", timeout=None):
+        if timeout is None:
+            return graphviz.Source(source, engine=engine).pipe(format=format)
+        # subprocess.run kills dot when the timeout expires.
+        completed = subprocess.run([engine, f"-T{format}"], input=source.encode("utf-8"),
+                                   capture_output=True, timeout=timeout, check=True)
+        return completed.stdout
+
+
+class FileRenderer:
+    """The original path: write a .gv file, run `dot` on it, read the output back."""
+
+    name = "file"
+    supports_timeout = True
+
+    def render(self, source, engine="dot", format="svg", timeout=None):
+        with tempfile.TemporaryDirectory() as directory:
+            if timeout is None:
+                path = graphviz.Source(source, engine=engine).render(os.path.join(directory, "graph"), format=format)
+            else:
+                graph_path = os.path.join(directory, "graph.gv")
+                path = f"{graph_path}.{format}"
+                with open(graph_path, "w", encoding="utf-8") as file:
+                    file.write(source)
+                subprocess.run([engine, f"-T{format}", graph_path, "-o", path],
+                               capture_output=True, timeout=timeout, check=True)
+            with open(path, "rb") as file:
+                return file.read()
+
+
+RENDERERS = {
+    PygraphvizRenderer.name: PygraphvizRenderer,
+    PipeRenderer.name: PipeRenderer,
+    FileRenderer.name: FileRenderer,
+}
+
+_default_renderer = None
+
+
+def get_renderer(name=None):
+    # USR_RENDERER=pygraphviz|pipe|file picks a backend; "auto" prefers the
+    # in-process bindings when they are installed.
+    global _default_renderer
+    if name is None:
+        if _default_renderer is None:
+            _default_renderer = get_renderer(os.environ.get("USR_RENDERER", "auto"))
+        return _default_renderer
+    if name == "auto":
+        name = PygraphvizRenderer.name if pygraphviz is not None else PipeRenderer.name
+    if name == PygraphvizRenderer.name and pygraphviz is None:
+        raise ValueError("pygraphviz renderer requested but pygraphviz is not installed")
+    if name not in RENDERERS:
+        raise ValueError(f"unknown renderer {name!r}, expected one of {', '.join(RENDERERS)}")
+    return RENDERERS[name]()
+
+
+class GraphvizNotInstalled(RuntimeError):
+    """Raised by render_svg when the layout program cannot be found."""
+
+
+def executable_missing(error):
+    # True when the backend could not start its layout program at all:
+    # no `dot` (or other engine) executable, or bindings that cannot find
+    # it. Errors from dot itself (bad DOT, a crash) are not.
+    if isinstance(error, (FileNotFoundError, graphviz.ExecutableNotFound)):
+        return True
+    return pygraphviz is not None and isinstance(error, ValueError) and "not found" in str(error)
+
+
+def fallback_for(renderer, error):
+    # Another backend that can get past `error`, or None. The bindings
+    # may miss a layout program that the executable on PATH still has,
+    # and a dot that closed its stdin early can still read a file. Every
+    # other backend runs the same executable, so a missing one is not
+    # retried.
+    if isinstance(renderer, PygraphvizRenderer) and executable_missing(error):
+        return PipeRenderer()
+    if isinstance(renderer, PipeRenderer) and isinstance(error, BrokenPipeError):
+        return FileRenderer()
+    return None
+
+
+@timed("render")
+def render_svg(dot, renderer=None, timeout=None, engine=None):
+    # Accepts a Digraph or raw DOT source and returns the SVG as bytes.
+    # With a timeout (seconds) the layout is killed when it runs too long
+    # and subprocess.TimeoutExpired is raised. A backend falls back to
+    # another only where that one can succeed (see fallback_for); without
+    # Graphviz, GraphvizNotInstalled is raised, and a DOT syntax error or
+    # a failing dot is raised as it is.
+    source = getattr(dot, "source", dot)
+    engine = engine or getattr(dot, "engine", "dot")
+    renderer = renderer or get_renderer()
+    if timeout is not None and not renderer.supports_timeout:
+        renderer = PipeRenderer()
+    while True:
+        try:
+            return renderer.render(source, engine, timeout=timeout)
+        except Exception as error:
+            fallback = fallback_for(renderer, error)
+            if fallback is not None:
+                renderer = fallback
+                continue
+            if executable_missing(error):
+                raise GraphvizNotInstalled(f"Graphviz is not installed: the {engine!r} layout program "
+                                           f"was not found (install graphviz and put it on PATH)") from error
+            raise
@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import uuid
+
+import jinja2
+
+from batch_render import MANIFEST_NAME, input_key, render_corpus
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+VIEWER_NAME = "index.html"
+
+
+def site_segments(entries, output_dir):
+    # Viewer entries in corpus order: id, SVG path relative to the site
+    # root (forward slashes, for the browser) and what was simplified.
+    return [
+        {"id": segment_id, "svg": entry["svg"].replace(os.sep, "/"), "simplified": entry.get("simplified", [])}
+        for segment_id, entry in entries.items()
+        if os.path.exists(os.path.join(output_dir, entry["svg"]))
+    ]
+
+
+def prune_outputs(entries, output_dir):
+    # SVGs of segments that no longer exist in the input.
+    kept = {os.path.normpath(os.path.join(output_dir, entry["svg"])) for entry in entries.values()}
+    directories = {os.path.dirname(path) for path in kept}
+    removed = 0
+    for directory in directories:
+        for name in os.listdir(directory):
+            path = os.path.normpath(os.path.join(directory, name))
+            if name.startswith("sentence_") and name.endswith(".svg") and path not in kept:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def write_viewer(output_dir, title, segments):
+    # The web app's page, rendered once with the segment list baked in so
+    # it works from file:// or any static file server.
+    environment = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATE_DIR), autoescape=True)
+    html = environment.get_template("index.html").render(site={"title": title, "segments": segments})
+    path = os.path.join(output_dir, VIEWER_NAME)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(html)
+    os.replace(tmp_path, path)
+    return path
+
+
+def export_site(input_file, output_dir, workers=None, max_depth=1, force=False):
+    # Rendering, the manifest and the skip-if-unchanged check are the
+    # batch renderer's; this adds the viewer page and drops stale SVGs.
+    manifest = render_corpus([input_file], output_dir, workers=workers, max_depth=max_depth, force=force)
+    entries = manifest["files"].get(input_key(input_file), {})
+    removed = prune_outputs(entries, output_dir)
+    title = os.path.splitext(os.path.basename(input_file))[0]
+    write_viewer(output_dir, title, site_segments(entries, output_dir))
+    return manifest, removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="USR_to_Graph.py export",
+                                     description="Render a USR file to a static site for offline browsing.")
+    parser.add_argument("input", help="USR file to export")
+    parser.add_argument("-o", "--output", default="site", help="site directory (default: site)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of render workers")
+    parser.add_argument("--depth", type=int, default=1, help="inter-relation hops to include per segment")
+    parser.add_argument("--force", action="store_true", help="re-render segments that are up to date")
+    args = parser.parse_args(argv)
+
+    manifest, removed = export_site(args.input, args.output, args.workers, args.depth, args.force)
+
+    timing = manifest["timing"]
+    print(f"rendered {timing['rendered']}, unchanged {timing['skipped']}, failed {timing['failed']}, "
+          f"removed {removed} in {timing['wall_seconds']:.3f}s")
+    print(f"open {os.path.join(args.output, VIEWER_NAME)} (manifest: {os.path.join(args.output, MANIFEST_NAME)})")
+    for failure in manifest["failures"]:
+        print(f"error: {failure['segment_id']}: {failure['error']}", file=sys.stderr)
+    return 1 if manifest["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
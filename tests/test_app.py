@@ -0,0 +1,63 @@
+import threading
+
+import app as web
+import render_jobs
+
+KEY = "ab" * 32
+
+
+def create_app(tmp_path, **config):
+    return web.create_app({"TESTING": True, "USR_WARM_RENDERERS": False, "SECRET_KEY": "test",
+                           "USR_RENDER_CACHE_DIR": str(tmp_path / "graphs"), **config})
+
+
+def test_evicted_graph_is_drawn_again(tmp_path, monkeypatch):
+    app = create_app(tmp_path, USR_RENDER_CACHE_SIZE=1)
+    cache = app.extensions["usr"].render_cache
+    monkeypatch.setattr(web, "render_svg", lambda source, timeout=None, engine=None: f"<svg>{engine}</svg>".encode())
+    cache.put(KEY, b"<svg>dot</svg>", source="digraph { a }", engine="sfdp")
+    cache.put("cd" * 32, b"<svg/>")
+    assert cache.get(KEY) is None
+
+    client = app.test_client()
+    response = client.get(f"/graph/{KEY}.svg")
+    assert response.status_code == 200
+    assert response.data == b"<svg>sfdp</svg>"
+    assert client.get(f"/graph/{'ef' * 32}.svg").status_code == 404
+
+
+def test_each_app_has_its_own_state(tmp_path, monkeypatch):
+    warmed = []
+    monkeypatch.setattr(render_jobs.RenderQueue, "warm", lambda queue, function: warmed.append(queue) or [])
+
+    first = create_app(tmp_path, USR_WARM_RENDERERS=True)
+    second = create_app(tmp_path, USR_RENDER_WORKERS=2)
+
+    assert first is not second
+    assert first.extensions["usr"].render_cache is not second.extensions["usr"].render_cache
+    assert second.extensions["usr"].render_queue.max_workers == 2
+    # Only the first asked for its workers to be warmed.
+    assert warmed == [first.extensions["usr"].render_queue]
+
+
+def test_identical_form_posts_from_two_sessions_share_a_job(tmp_path, monkeypatch):
+    release = threading.Event()
+    stores = []
+
+    def render_graph(app_state, usr_text, sent_ids, max_depth, store=None, timeout=None):
+        stores.append(store)
+        release.wait(5)
+        return {"key": KEY, "reuse": None, "simplified": []}
+
+    monkeypatch.setattr(web, "render_graph", render_graph)
+    app = create_app(tmp_path)
+    form = {"usr": "<segment_id=1>\nrAma\t1\t-\t-\t0:main\n", "sent_ids": "1", "depth": "1"}
+    try:
+        pages = [app.test_client().post("/", data=form).data for _ in range(2)]
+    finally:
+        release.set()
+
+    shared = web.job_id(form["usr"], form["sent_ids"], 1)
+    assert all(shared.encode() in page for page in pages)
+    # Rendered once, through the first session's store.
+    assert len(stores) == 1 and stores[0] is not None
@@ -0,0 +1,43 @@
+import os
+import sys
+
+from USR_to_Graph import convert_usr_to_dot, index_segments, parse_usrs, render_key, select_segments
+from batch_render import input_key, input_output_dir, plan_file
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from generate_corpus import generate_corpus  # noqa: E402
+
+
+def test_same_file_name_in_different_directories_does_not_collide():
+    first = input_output_dir("graphs", input_key(os.path.join("gold", "chapter_1.txt")))
+    second = input_output_dir("graphs", input_key(os.path.join("annotator", "chapter_1.txt")))
+    assert first != second
+    assert first == os.path.join("graphs", "gold", "chapter_1")
+
+
+def test_equivalent_paths_share_a_manifest_key():
+    assert input_key(os.path.join(".", "gold", "chapter_1.txt")) == input_key(os.path.join("gold", "chapter_1.txt"))
+
+
+def test_inputs_outside_the_working_directory_stay_inside_the_output():
+    directory = input_output_dir("graphs", input_key(os.path.join(os.pardir, "chapter_1.txt")))
+    assert os.path.dirname(directory) == "graphs"
+    assert os.path.basename(directory).startswith("chapter_1_")
+
+
+def test_plan_file_matches_the_in_memory_drawings(tmp_path):
+    text = generate_corpus(120, seed=3)
+    path = tmp_path / "corpus.txt"
+    path.write_text(text, encoding="utf-8")
+    sentences = parse_usrs(text)
+    lines, offsets = index_segments(text)
+
+    entries, jobs, carried = plan_file(str(path), str(tmp_path / "graphs"), None, {}, 2, False)
+    jobs = {segment_id: source for segment_id, source, _, _ in jobs}
+
+    assert list(entries) == list(sentences) == sorted(jobs, key=list(sentences).index)
+    assert carried == {}
+    for segment_id in sentences:
+        selected, skipped = select_segments(sentences, segment_id, 2)
+        assert entries[segment_id]["key"] == render_key(lines, offsets, selected, skipped)
+        assert jobs[segment_id] == convert_usr_to_dot(selected, skipped).source
@@ -0,0 +1,111 @@
+import json
+import os
+
+import usr_diff
+from usr_diff import ADDED, CHANGED, REMOVED, UNCHANGED, diff_files, diff_segment, diff_to_dot, summarize
+from usr_engine import parse_usrs
+
+OLD = """<segment_id=ch1_1>
+rAma\t1\tper/male\t-\t3:k1\t-\t-\t-\t-
+Gara_1\t2\t-\t-\t3:k2\t-\t-\t-\t-
+jA_1\t3\t-\t-\t0:main\t-\t-\t-\t-
+<segment_id=ch1_2>
+vaha\t1\t-\t-\t2:k1\tch1_1.1:coref\t-\t-\t-
+so_1\t2\t-\t-\t0:main\t-\t-\t-\t-
+<segment_id=ch1_3>
+Kela_1\t1\t-\t-\t0:main\t-\t-\t-\t-
+"""
+
+NEW = """<segment_id=ch1_1>
+rAma\t1\tper/male\tsg\t3:k1\t-\t-\t-\t-
+skUla_1\t2\t-\t-\t3:k2p\t-\t-\t-\t-
+jA_1\t3\t-\t-\t0:main\t-\t-\t-\t-
+<segment_id=ch1_2>
+vaha\t1\t-\t-\t2:k1\tch1_1.1:coref\t-\t-\t-
+so_1\t2\t-\t-\t0:main\t-\t-\t-\t-
+<segment_id=ch1_4>
+hE_1\t1\t-\t-\t0:main\t-\t-\t-\t-
+"""
+
+
+def segment(text, segment_id):
+    return parse_usrs(text)[segment_id]
+
+
+def test_changes_within_a_segment():
+    diff = diff_segment(segment(OLD, "ch1_1"), segment(NEW, "ch1_1"))
+
+    assert diff["status"] == CHANGED
+    assert diff["nodes"][ADDED] == ["skUla_1_2"]
+    assert diff["nodes"][REMOVED] == ["Gara_1_2"]
+    assert diff["nodes"][CHANGED] == {"rAma_1": {"morpho_semantic": ["-", "sg"]}}
+    assert diff["edges"][ADDED] == [["jA_1_3", "skUla_1_2", "k2p"]]
+    assert diff["edges"][REMOVED] == [["jA_1_3", "Gara_1_2", "k2"]]
+    assert diff["edges"]["relabeled"] == []
+    assert diff["main"] is None
+    assert summarize(diff)["nodes_changed"] == 1
+
+
+def test_main_and_inter_relations():
+    old = segment(OLD, "ch1_2")
+    new = segment("""<segment_id=ch1_2>
+vaha\t1\t-\t-\t0:main\tch1_1.1:samAnAXikaraNa\t-\t-\t-
+so_1\t2\t-\t-\t1:rt\t-\t-\t-\t-
+""", "ch1_2")
+    diff = diff_segment(old, new)
+
+    assert diff["main"] == ["so_1_2", "vaha_1"]
+    assert diff["edges"][ADDED] == [["vaha_1", "so_1_2", "rt"]]
+    assert diff["edges"][REMOVED] == [["so_1_2", "vaha_1", "k1"]]
+    assert diff["inter_relations"][ADDED] == [["1", "ch1_1", "1", "samAnAXikaraNa"]]
+    assert diff["inter_relations"][REMOVED] == [["1", "ch1_1", "1", "coref"]]
+
+
+def test_relabelled_edge():
+    diff = diff_segment(segment(OLD, "ch1_2"), segment(NEW.replace("2:k1\tch1_1.1", "2:k1s\tch1_1.1"), "ch1_2"))
+    assert diff["edges"]["relabeled"] == [["so_1_2", "vaha_1", ["k1"], ["k1s"]]]
+    assert diff["edges"][ADDED] == diff["edges"][REMOVED] == []
+    assert diff["status"] == CHANGED
+
+
+def test_added_and_removed_segments():
+    assert diff_segment(None, segment(NEW, "ch1_4"))["status"] == ADDED
+    removed = diff_segment(segment(OLD, "ch1_3"), None)
+    assert removed["status"] == REMOVED
+    assert removed["nodes"][REMOVED] == ["Kela_1_1"]
+    assert removed["main"] is None
+
+
+def test_merged_graph_marks_both_versions():
+    old, new = segment(OLD, "ch1_1"), segment(NEW, "ch1_1")
+    source = diff_to_dot("ch1_1", old, new, diff_segment(old, new)).source
+
+    assert 'skUla_1_2 [label="skUla_1:2\n" color=darkgreen' in source
+    assert 'Gara_1_2 [label="Gara_1:2\n" color=red fontcolor=red style=dashed' in source
+    assert 'rAma_1 [label="rAma:1\nmorphSem: - → sg\n" color=darkorange' in source
+    assert "jA_1_3 -> Gara_1_2 [label=k2 color=red" in source
+    # The main row did not move: drawn as usual.
+    assert "sent_ch1_1 -> jA_1_3 [label=main fontsize=8]" in source
+
+
+def test_diff_files(tmp_path, monkeypatch):
+    old_path, new_path = tmp_path / "old.txt", tmp_path / "new.txt"
+    old_path.write_text(OLD, encoding="utf-8")
+    new_path.write_text(NEW, encoding="utf-8")
+    rendered = []
+    monkeypatch.setattr(usr_diff, "render_svg", lambda dot: rendered.append(dot.comment) or b"<svg/>")
+
+    output = tmp_path / "diffs"
+    report = diff_files(str(old_path), str(new_path), str(output), workers=1)
+
+    assert list(report["segments"]) == ["ch1_1", "ch1_2", "ch1_4", "ch1_3"]
+    assert report["counts"] == {UNCHANGED: 1, CHANGED: 1, ADDED: 1, REMOVED: 1}
+    assert report["segments"]["ch1_2"] == {"status": UNCHANGED}
+    assert report["rendered"] == 3 and report["failures"] == []
+    assert sorted(rendered) == ["USR diff of ch1_1", "USR diff of ch1_3", "USR diff of ch1_4"]
+    assert os.path.exists(output / "diff_ch1_1.svg")
+    with open(output / usr_diff.REPORT_NAME, encoding="utf-8") as file:
+        assert json.load(file)["counts"] == report["counts"]
+
+    only = diff_files(str(old_path), str(new_path), patterns=["ch1_1"], workers=1)
+    assert list(only["segments"]) == ["ch1_1"]
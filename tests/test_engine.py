@@ -0,0 +1,162 @@
+import copy
+import re
+
+import pytest
+
+import usr_engine
+from usr_engine import SENT_DIALECT, construction_members, convert_usr_to_dot, create_json, graph_data, \
+    huge_graph_simplifications, parse_usrs
+
+
+def dict_tokens():
+    # The shape callers passed before tokens became records.
+    return [
+        {"id": "1", "word": "rAma", "relations": [{"target": "3", "label": "k1"}, {"target": "9", "label": "r6"}],
+         "info": {"semantic_category": "per/male"}},
+        {"id": "2", "word": "Gara_1", "relations": [{"target": "3", "label": "k2"}]},
+        {"id": 3, "word": "jA_1", "relations": []},
+    ]
+
+
+def test_create_json_accepts_dict_tokens():
+    result = create_json(dict_tokens(), ("jA_1", "3"), [])
+
+    assert result["main"] == "jA_1_3"
+    first = result["tokens"][0]
+    assert first["word"] == "rAma"
+    # The dangling 9:r6 relation is dropped, the other one resolved.
+    assert [relation.to_dict() for relation in first["relations"]] == [
+        {"target": "jA_1", "target_id": "3", "label": "k1"}]
+    assert first["info"]["semantic_category"] == "per/male"
+    assert first["info"]["morpho_semantic"] == "-"
+    assert result["tokens"][2]["id"] == "3"
+
+
+def test_create_json_leaves_the_callers_tokens_alone():
+    tokens = dict_tokens()
+    inter_relations = [{"source_token": "1", "target_token": "2", "target_word": None,
+                        "source_sentence": "a", "target_sentence": "b", "relation": "coref"}]
+    before = copy.deepcopy((tokens, inter_relations))
+
+    result = create_json(tokens, None, inter_relations)
+
+    assert (tokens, inter_relations) == before
+    assert result["inter_relations"] == inter_relations
+    assert result["inter_relations"][0] is not inter_relations[0]
+
+
+def test_create_json_accepts_its_own_output():
+    first = create_json(dict_tokens(), ("jA_1", "3"), [])
+    again = create_json(first["tokens"], ("jA_1", "3"), [])
+
+    assert again["tokens"] == first["tokens"]
+    assert again["tokens"][0] is not first["tokens"][0]
+
+
+def test_module_shims_accept_dict_tokens():
+    import USR_to_Graph
+    import usr_to_dot
+
+    # USR_to_Graph.create_json still takes the main word, as it used to.
+    result = USR_to_Graph.create_json(dict_tokens(), "jA_1", [])
+    assert result["main"] == "jA_1_3"
+    assert result["tokens"][1]["relations"][0]["target"] == "jA_1"
+
+    result = usr_to_dot.create_json(dict_tokens(), ("jA_1", "3"), [])
+    assert result["main"] == "jA_1_3"
+
+
+# [conj_1] (rAma, mohana) is itself the first member of [conj_2]; apanA
+# and the inter-relation from s2 point at rAma, inside both.
+NESTED = """<segment_id=s1>
+rAma\t1\tper/male\t-\t-\t-\t-\t-\t3:op1
+mohana\t2\tper/male\t-\t-\t-\t-\t-\t3:op2
+[conj_1]\t3\t-\t-\t-\t-\t-\t-\t6:op1
+sIwA\t4\tper/female\t-\t-\t-\t-\t-\t6:op2
+jA_1\t5\t-\t-\t0:main\t-\t-\t-\t-
+[conj_2]\t6\t-\t-\t5:k1\t-\t-\t-\t-
+apanA\t7\t-\t-\t1:r6\t-\t-\t-\t-
+Gara_1\t8\t-\t-\t5:k2\t-\t-\t-\t-
+<segment_id=s2>
+vaha\t1\t-\t-\t2:k1\ts1.1:coref\t-\t-\t-
+so_1\t2\t-\t-\t0:main\t-\t-\t-\t-
+"""
+
+DOT_ID = r'("(?:[^"\\]|\\.)*"|[^\s\[]+)'
+DOT_EDGE = re.compile(rf"^\t{DOT_ID} -> {DOT_ID} \[label={DOT_ID}")
+DOT_NODE = re.compile(rf"^\t{DOT_ID} \[")
+
+
+def unquote(name):
+    return name[1:-1] if name.startswith('"') else name
+
+
+def dot_graph(source):
+    # Top-level node statements and edges of DOT written by the engine.
+    nodes, edges = set(), []
+    for line in source.splitlines():
+        match = DOT_EDGE.match(line)
+        if match:
+            edges.append(tuple(unquote(name) for name in match.groups()))
+            continue
+        match = DOT_NODE.match(line)
+        if match and match.group(1) not in ("node", "edge", "graph"):
+            nodes.add(unquote(match.group(1)))
+    return nodes, sorted(edges)
+
+
+@pytest.mark.parametrize("huge", [False, True])
+def test_graph_data_matches_the_dot(huge):
+    sentences = parse_usrs(NESTED)
+    dot = convert_usr_to_dot(sentences, huge=huge)
+    data = graph_data(sentences, huge=huge)
+
+    nodes, edges = dot_graph(dot.source)
+    assert {node["id"] for node in data["nodes"]} == nodes
+    assert sorted((edge["source"], edge["target"], edge["label"]) for edge in data["edges"]) == edges
+    assert data["engine"] == dot.engine
+    clusters = {line.split('"')[1] for line in dot.source.splitlines() if line.startswith("\tsubgraph \"cluster_")}
+    assert {cluster["id"] for cluster in data["clusters"]} == clusters
+    assert bool(data["same_rank"]) is not huge
+
+
+def test_nested_constructions_collapse_into_the_outermost():
+    members = construction_members(parse_usrs(NESTED)["s1"])
+    assert members == {"rAma_1": "[conj_2]_6", "mohana_2": "[conj_2]_6",
+                       "[conj_1]_3": "[conj_2]_6", "sIwA_4": "[conj_2]_6"}
+
+
+def test_huge_graph_mode():
+    sentences = parse_usrs(NESTED)
+    simplified = []
+    dot = convert_usr_to_dot(sentences, huge=True, simplified=simplified)
+    nodes, edges = dot_graph(dot.source)
+
+    assert dot.engine == "sfdp"
+    assert simplified == ["layout:sfdp", "no_tooltips", "collapsed_constructions", "no_rank_same"]
+    assert "tooltip=" not in dot.source and "subgraph" not in dot.source
+
+    collapsed = {"rAma_1", "mohana_2", "[conj_1]_3", "sIwA_4"}
+    assert not collapsed & nodes
+    assert not collapsed & {name for source, target, _ in edges for name in (source, target)}
+    # Edges to members now point at the construction, edges inside it are
+    # gone, and the rest are drawn as before.
+    assert ("[conj_2]_6", "apanA_7", "r6") in edges
+    assert ("vaha_1", "[conj_2]_6", "coref") in edges
+    assert ("jA_1_5", "[conj_2]_6", "k1") in edges
+    assert ("jA_1_5", "Gara_1_8", "k2") in edges
+    assert not [edge for edge in edges if edge[0] == edge[1]]
+    assert '"[conj_2]_6" [label="[conj_2]:6\nrAma, mohana, [conj_1], sIwA"' in dot.source
+
+
+def test_huge_graph_mode_follows_the_size_limits(monkeypatch):
+    sentences = parse_usrs(NESTED)
+    assert convert_usr_to_dot(sentences).engine == "dot"
+
+    monkeypatch.setattr(usr_engine, "HUGE_GRAPH_NODES", 5)
+    simplified = []
+    assert convert_usr_to_dot(sentences, simplified=simplified).engine == "sfdp"
+    assert simplified
+    # The sentence dialect draws no inter-relations, so it has no rank=same
+    # groups to drop.
+    assert huge_graph_simplifications(SENT_DIALECT) == ["layout:sfdp", "no_tooltips", "collapsed_constructions"]
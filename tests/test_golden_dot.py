@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+import USR_to_Graph
+import usr_to_dot
+from usr_engine import clear_fragment_cache
+
+# DOT drawn by the original USR_to_Graph.py and usr_to_dot.py (the first
+# commit of this repository, run with PYTHONHASHSEED=0), for input.txt and
+# for small corpora from benchmarks/generate_corpus.py kept beside them.
+# The graphs stay below the huge-graph limits, where the output must not
+# have changed.
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+INPUT = os.path.join(os.path.dirname(GOLDEN), os.pardir, "input.txt")
+
+
+def read(path):
+    with open(path, encoding="utf-8") as file:
+        return file.read()
+
+
+def normalized(source):
+    # The original code listed construction members and same-rank pairs
+    # from sets, so their order follows the hash seed: sort the lines of
+    # every subgraph and each run of same-rank subgraphs.
+    items = []
+    block = None
+    for line in source.splitlines():
+        if line.startswith("\tsubgraph "):
+            block = [line]
+        elif block is not None:
+            block.append(line)
+            if line == "\t}":
+                items.append([block[0]] + sorted(block[1:-1]) + [line])
+                block = None
+        else:
+            items.append(line)
+
+    lines = []
+    run = []
+    for item in items + [None]:
+        if isinstance(item, list) and item[0].startswith("\tsubgraph same_rank_"):
+            run.append(item)
+            continue
+        for block in sorted(run):
+            lines.extend(block)
+        run = []
+        if isinstance(item, list):
+            lines.extend(item)
+        elif item is not None:
+            lines.append(item)
+    return "\n".join(lines)
+
+
+CASES = {
+    "segment_input": (USR_to_Graph, lambda: read(INPUT)),
+    "segment_corpus": (USR_to_Graph, lambda: read(os.path.join(GOLDEN, "segment_corpus.txt"))),
+    "sentence_input": (usr_to_dot, lambda: read(INPUT).replace("segment_id", "sent_id")),
+    "sentence_corpus": (usr_to_dot, lambda: read(os.path.join(GOLDEN, "sentence_corpus.txt"))),
+}
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_dot_matches_the_original_modules(name):
+    module, text = CASES[name]
+    expected = normalized(read(os.path.join(GOLDEN, f"{name}.gv")))
+    usr_data = module.parse_usrs(text())
+
+    clear_fragment_cache()
+    assert normalized(module.convert_usr_to_dot(usr_data).source) == expected
+    # Drawn again from the fragment cache.
+    assert normalized(module.convert_usr_to_dot(usr_data).source) == expected
@@ -0,0 +1,41 @@
+from USR_to_Graph import collect_segments, index_segments
+from incremental import SegmentStore
+
+BROKEN = ("<segment_id=ch1_2>\n"
+          "vaha\t1\t-\t-\t2:k1:extra\t-\t-\t-\t-\n"
+          "so_1\t2\t-\t-\t0:main\t-\t-\t-\t-\n")
+ADDED = ("<segment_id=ch1_1>\n"
+         "rAma\t1\tper/male\t-\t2:k1\t-\t-\t-\t-\n"
+         "jA_1\t2\t-\t-\t0:main\t-\t-\t-\t-\n")
+
+
+def submit(store, text):
+    store.begin()
+    errors = []
+    lines, offsets = index_segments(text, errors)
+    segments, _ = collect_segments(lines, offsets, "ch1_2", 0, errors=errors, parse=store.parse)
+    return segments, [error.line_number for error in errors], dict(store.stats)
+
+
+def test_reused_segment_reports_its_current_lines():
+    store = SegmentStore()
+    first, lines, stats = submit(store, BROKEN)
+    assert lines == [2]
+    assert stats == {"segments_reused": 0, "segments_rebuilt": 1}
+
+    # A segment pasted above moves the unchanged one down three lines.
+    again, lines, stats = submit(store, ADDED + BROKEN)
+    assert lines == [5]
+    assert stats == {"segments_reused": 1, "segments_rebuilt": 0}
+    assert again["ch1_2"]["tokens"] is first["ch1_2"]["tokens"]
+
+
+def test_segments_without_errors_are_not_parsed_again(monkeypatch):
+    import incremental
+
+    store = SegmentStore()
+    submit(store, ADDED.replace("ch1_1", "ch1_2"))
+    monkeypatch.setattr(incremental, "parse_segment", None)
+    _, lines, stats = submit(store, "\n\n" + ADDED.replace("ch1_1", "ch1_2"))
+    assert lines == []
+    assert stats["segments_reused"] == 1
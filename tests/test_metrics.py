@@ -0,0 +1,27 @@
+from metrics import REGISTRY, STAGE_SECONDS, TOKENS
+from usr_engine import parse_usrs
+
+TEXT = """<segment_id=ch1_1>
+rAma\t1\tper/male\t-\t2:k1\t-\t-\t-\t-
+jA_1\t2\t-\t-\t0:main\t-\t-\t-\t-
+<segment_id=ch1_2>
+vaha\t1\t-\t-\t2:k1\tcoref:ch1_1.1\t-\t-\t-
+so_1\t2\t-\t-\t0:main\t-\t-\t-\t-
+"""
+
+
+def stage_counts():
+    return {dict(key)["stage"]: series[2] for key, series in STAGE_SECONDS.series.items()}
+
+
+def test_parse_is_timed_and_counted_once_per_file():
+    stages = stage_counts()
+    tokens = TOKENS.values.get((), 0)
+
+    parse_usrs(TEXT)
+
+    after = stage_counts()
+    assert after["parse_usrs"] == stages.get("parse_usrs", 0) + 1
+    assert "create_json" not in after
+    assert TOKENS.values[()] == tokens + 4
+    assert "module=" not in REGISTRY.render()
@@ -0,0 +1,96 @@
+import os
+import subprocess
+
+import pytest
+
+import renderer
+from render_cache import RenderCache, remove_legacy_renders
+
+KEYS = [f"{number:064x}" for number in range(4)]
+
+
+class FailingRenderer:
+    name = "failing"
+    supports_timeout = True
+
+    def __init__(self, error):
+        self.error = error
+
+    def render(self, source, engine="dot", format="svg", timeout=None):
+        raise self.error
+
+
+class FakeFileRenderer:
+    name = "file"
+    supports_timeout = True
+
+    def render(self, source, engine="dot", format="svg", timeout=None):
+        return f"<svg>{engine}</svg>".encode("utf-8")
+
+
+def test_sources_outlive_evicted_svgs(tmp_path):
+    cache = RenderCache(str(tmp_path), max_entries=2, max_sources=3)
+    for number, key in enumerate(KEYS):
+        cache.put(key, b"<svg/>", source=f"digraph {{ n{number} }}", engine="sfdp")
+        os.utime(cache.path_for(key), (number, number))
+        os.utime(cache.source_path_for(key), (number, number))
+    cache.evict()
+
+    assert cache.get(KEYS[0]) is None
+    assert cache.get(KEYS[3]) == b"<svg/>"
+    assert cache.source(KEYS[0]) is None
+    assert cache.source(KEYS[1]) == ("digraph { n1 }", "sfdp")
+
+
+def test_legacy_renders_are_removed(tmp_path):
+    legacy = tmp_path / "graphs"
+    legacy.mkdir()
+    (legacy / "sentence_ch1_1.svg").write_text("<svg/>")
+    (legacy / "sentence_ch1_1").write_text("digraph {}")
+
+    assert remove_legacy_renders(str(legacy)) == 2
+    assert not legacy.exists()
+    assert remove_legacy_renders(str(legacy)) == 0
+
+
+def test_legacy_folder_with_other_files_is_kept(tmp_path):
+    (tmp_path / "sentence_ch1_1.svg").write_text("<svg/>")
+    (tmp_path / "logo.png").write_bytes(b"")
+
+    assert remove_legacy_renders(str(tmp_path)) == 1
+    assert os.listdir(tmp_path) == ["logo.png"]
+
+
+def test_missing_binary_is_reported_not_retried(monkeypatch):
+    monkeypatch.setattr(renderer, "FileRenderer", FakeFileRenderer)
+    with pytest.raises(renderer.GraphvizNotInstalled, match="'sfdp'"):
+        renderer.render_svg("digraph {}", renderer=FailingRenderer(FileNotFoundError("sfdp")), engine="sfdp")
+
+
+def test_broken_pipe_falls_back_to_the_file_backend(monkeypatch):
+    class BrokenPipeRenderer(FailingRenderer, renderer.PipeRenderer):
+        pass
+
+    monkeypatch.setattr(renderer, "FileRenderer", FakeFileRenderer)
+    failing = BrokenPipeRenderer(BrokenPipeError())
+    assert renderer.render_svg("digraph {}", renderer=failing, engine="sfdp") == b"<svg>sfdp</svg>"
+
+
+def test_bindings_without_a_layout_program_fall_back_to_the_pipe(monkeypatch):
+    class BindingsRenderer(FailingRenderer, renderer.PygraphvizRenderer):
+        pass
+
+    monkeypatch.setattr(renderer, "pygraphviz", object())
+    monkeypatch.setattr(renderer, "PipeRenderer", FakeFileRenderer)
+    failing = BindingsRenderer(ValueError("Program neato not found in path."))
+    assert renderer.render_svg("digraph {}", renderer=failing, engine="neato") == b"<svg>neato</svg>"
+
+
+@pytest.mark.parametrize("error", [
+    subprocess.CalledProcessError(1, ["dot", "-Tsvg"], stderr=b"syntax error in line 1"),
+    subprocess.TimeoutExpired(["dot", "-Tsvg"], 1),
+])
+def test_dot_failures_are_not_retried(monkeypatch, error):
+    monkeypatch.setattr(renderer, "FileRenderer", FakeFileRenderer)
+    with pytest.raises(type(error)):
+        renderer.render_svg("digraph {", renderer=FailingRenderer(error), timeout=1)
@@ -0,0 +1,176 @@
+import json
+import os
+import subprocess
+import threading
+
+import pytest
+
+from render_jobs import DONE, FAILED, QUEUED, RUNNING, TIMEOUT, QueueFull, RenderQueue, StoredJob
+
+
+def dead_pid():
+    # A process id that is not running: a child that has been reaped.
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+
+def test_job_running_in_another_process_is_shared(tmp_path):
+    owner = os.getppid()
+    (tmp_path / "job1.lock").write_text(str(owner))
+    (tmp_path / "job1.json").write_text(json.dumps({"id": "job1", "status": RUNNING, "owner": owner}))
+    calls = []
+    queue = RenderQueue(lambda timeout=None: calls.append(1), max_workers=1, state_dir=str(tmp_path))
+
+    job = queue.submit("job1")
+
+    assert isinstance(job, StoredJob)
+    assert job.id == "job1"
+    assert job.status == RUNNING
+    assert calls == []
+    queue.shutdown()
+
+
+def test_lock_of_an_exited_process_is_taken_over(tmp_path):
+    (tmp_path / "job1.lock").write_text(str(dead_pid()))
+    release = threading.Event()
+    queue = RenderQueue(lambda timeout=None: release.wait(5) and "svg", max_workers=1, state_dir=str(tmp_path))
+
+    job = queue.submit("job1")
+    assert not isinstance(job, StoredJob)
+    assert (tmp_path / "job1.lock").read_text() == str(os.getpid())
+    release.set()
+    assert job.wait(5)
+    queue.shutdown()
+
+    assert job.status == DONE and job.result == "svg"
+    assert not (tmp_path / "job1.lock").exists()
+    assert [name for name in os.listdir(tmp_path) if name.startswith(".tmp_")] == []
+
+
+@pytest.fixture
+def gate():
+    # Work that blocks until the test opens the gate.
+    release = threading.Event()
+    calls = []
+
+    def work(*args, timeout=None):
+        calls.append(args)
+        assert release.wait(5)
+        return {"key": args[0] if args else None}
+
+    work.release = release
+    work.calls = calls
+    yield work
+    release.set()
+
+
+def test_identical_requests_share_a_job(gate):
+    queue = RenderQueue(gate, max_workers=1)
+    first = queue.submit("job1", "a")
+    second = queue.submit("job1", "a")
+    assert second is first
+
+    gate.release.set()
+    assert first.wait(5)
+    queue.shutdown()
+    assert first.status == DONE
+    assert first.result == {"key": "a"}
+    assert gate.calls == [("a",)]
+    assert first.to_dict()["run_seconds"] is not None
+
+
+def test_finished_job_ids_run_again(gate):
+    gate.release.set()
+    queue = RenderQueue(gate, max_workers=1)
+    first = queue.submit("job1", "a")
+    assert first.wait(5)
+    second = queue.submit("job1", "a")
+    assert second is not first
+    assert second.wait(5)
+    queue.shutdown()
+    assert len(gate.calls) == 2
+
+
+def test_full_queue_rejects(gate):
+    queue = RenderQueue(gate, max_workers=1, max_pending=2)
+    queue.submit("job1")
+    waiting = queue.submit("job2")
+    assert waiting.status == QUEUED
+    with pytest.raises(QueueFull):
+        queue.submit("job3")
+    # Joining a job that is already pending is still allowed.
+    assert queue.submit("job2") is waiting
+    gate.release.set()
+    queue.shutdown()
+    assert queue.pending == 0
+
+
+@pytest.mark.parametrize("error, status, message", [
+    (subprocess.TimeoutExpired(["dot"], 2), TIMEOUT, "layout did not finish within 2s"),
+    (ValueError("bad input"), FAILED, "bad input"),
+    (RuntimeError(), FAILED, "RuntimeError"),
+])
+def test_failures_are_reported(error, status, message):
+    def work(timeout=None):
+        assert timeout == 2
+        raise error
+
+    queue = RenderQueue(work, max_workers=1, timeout=2)
+    job = queue.submit("job1")
+    assert job.wait(5)
+    queue.shutdown()
+    assert job.status == status
+    assert job.error == message
+
+
+def test_only_recent_finished_jobs_are_kept(gate, tmp_path):
+    gate.release.set()
+    queue = RenderQueue(gate, max_workers=1, keep_finished=2, state_dir=str(tmp_path))
+    for number in range(4):
+        assert queue.submit(f"job{number}").wait(5)
+    queue.shutdown()
+    assert list(queue.jobs) == ["job2", "job3"]
+    assert queue.get("job0") is None
+    assert sorted(os.listdir(tmp_path)) == ["job2.json", "job3.json"]
+
+
+def test_jobs_are_visible_to_other_processes(gate, tmp_path):
+    queue = RenderQueue(gate, max_workers=1, state_dir=str(tmp_path))
+    other = RenderQueue(gate, max_workers=1, state_dir=str(tmp_path))
+    job = queue.submit("job1", "a")
+
+    seen = other.get("job1")
+    assert isinstance(seen, StoredJob)
+    assert seen.status in (QUEUED, RUNNING)
+    assert not seen.wait(0.2)
+    gate.release.set()
+    assert seen.wait(5)
+    assert seen.status == DONE
+    assert seen.result == {"key": "a"}
+    assert other.get("../job1") is None
+    assert other.get("unknown") is None
+    queue.shutdown()
+    other.shutdown()
+    assert job.status == DONE
+
+
+def test_job_of_an_exited_process_fails(tmp_path):
+    state = {"id": "job1", "status": RUNNING, "owner": dead_pid()}
+    (tmp_path / "job1.json").write_text(json.dumps(state))
+    job = RenderQueue(lambda timeout=None: None, state_dir=str(tmp_path)).get("job1")
+    assert job.wait(0)
+    assert job.status == FAILED
+    assert "exited" in job.error
+
+
+def test_warm_runs_on_every_worker():
+    threads = set()
+    queue = RenderQueue(lambda timeout=None: None, max_workers=3)
+    assert queue.warm(lambda: threads.add(threading.get_ident())) == []
+    assert len(threads) == 3
+    errors = queue.warm(lambda: 1 / 0)
+    assert len(errors) == 3 and isinstance(errors[0], ZeroDivisionError)
+    queue.shutdown()
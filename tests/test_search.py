@@ -0,0 +1,109 @@
+import pytest
+
+import usr_search
+from usr_engine import parse_usrs
+from usr_search import QueryError, SearchIndex, parse_query
+
+TEXT = """<segment_id=ch1_1>
+rAma\t1\tper/male\t-\t3:k1\t-\t-\t-\t-
+sIwA\t2\tper/female\t-\t-\t-\t-\t-\t4:op2
+jA_1\t3\t-\t-\t0:main\t-\t-\t-\t-
+[conj_1]\t4\t-\t-\t3:k2\t-\t-\t-\t-
+mohana\t5\tper/male\t-\t-\t-\t-\t-\t4:op1
+<segment_id=ch1_2>
+vaha\t1\t-\t-\t2:k1\tch1_1.1:coref\t-\t-\t-
+so_1\t2\t-\t-\t0:main\t-\t-\t-\t-
+<segment_id=ch2_1>
+mohana\t1\tper/male\tpl\t2:k1\t-\t-\t-\t-
+Kela_1\t2\t-\t-\t0:main\t-\t-\t-\t-
+"""
+
+
+@pytest.fixture(scope="module")
+def index():
+    return SearchIndex.from_sentences(parse_usrs(TEXT))
+
+
+def search(index, query):
+    return index.search(query)[1]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("word:rAma", ("term", "word", "rAma")),
+    ("word:rAma sem:per/male", ("and", [("term", "word", "rAma"), ("term", "sem", "per/male")])),
+    ("word:x AND word:y", ("and", [("term", "word", "x"), ("term", "word", "y")])),
+    ("word:x OR word:y", ("or", [("term", "word", "x"), ("term", "word", "y")])),
+    ("(word:x | word:y) -rel:k1",
+     ("and", [("or", [("term", "word", "x"), ("term", "word", "y")]), ("not", ("term", "rel", "k1"))])),
+    ("head:(word:[conj_1] rel:k1)", ("head", ("and", [("term", "word", "[conj_1]"), ("term", "rel", "k1")]))),
+    ('word:"two words"', ("term", "word", "two words")),
+    (r'word:"say \"hi\""', ("term", "word", 'say "hi"')),
+    ("(word:pAsa_1(a_1))", ("term", "word", "pAsa_1(a_1)")),
+    ("SEMCAT:per/male", ("term", "sem", "per/male")),
+])
+def test_parse_query(query, expected):
+    assert parse_query(query) == expected
+
+
+@pytest.mark.parametrize("query, message", [
+    ("", "empty query"),
+    ("   ", "empty query"),
+    ("colour:red", "unknown field"),
+    ("word:", "expected field:value"),
+    ("rAma", "expected field:value"),
+    ("(word:x", "missing )"),
+    ("word:x )", "unexpected ')'"),
+    ("word:x |", "query ends too early"),
+    ("-", "query ends too early"),
+])
+def test_parse_query_errors(query, message):
+    with pytest.raises(QueryError, match=message.replace("(", r"\(").replace(")", r"\)")):
+        parse_query(query)
+
+
+def test_terms_side_by_side_hold_for_the_same_token(index):
+    assert search(index, "word:mohana morph:pl") == [("ch2_1", ["1"])]
+    assert search(index, "word:rAma morph:pl") == []
+
+
+def test_or_not_and_wildcards(index):
+    assert search(index, "word:rAma | word:vaha") == [("ch1_1", ["1"]), ("ch1_2", ["1"])]
+    assert search(index, "sem:per/* -word:mohana") == [("ch1_1", ["1", "2"])]
+    assert search(index, "word:?Ama") == [("ch1_1", ["1"])]
+    assert search(index, "word:nothing*") == []
+
+
+def test_excluding_most_of_a_field(index):
+    # More than half of the tokens have sem "-": the exclusion is turned
+    # into keeping the other values.
+    assert search(index, "-sem:-") == search(index, "sem:per/*")
+
+
+def test_relations_heads_and_segments(index):
+    assert search(index, "rel:op1") == [("ch1_1", ["5"])]
+    assert search(index, "rel:k1>jA_1") == [("ch1_1", ["1"])]
+    assert search(index, "head:[conj_1]") == [("ch1_1", ["2", "5"])]
+    assert search(index, "head:(word:[conj_1] rel:k2) sem:per/female") == [("ch1_1", ["2"])]
+    assert search(index, "inter:coref") == [("ch1_2", ["1"])]
+    assert search(index, "segment:ch1_* rel:k1") == [("ch1_1", ["1"]), ("ch1_2", ["1"])]
+    assert search(index, "segment:ch9") == []
+
+
+def test_limit_keeps_the_total(index):
+    total, matches = index.search("rel:k1", limit=1)
+    assert total == 3
+    assert matches == [("ch1_1", ["1"])]
+
+
+def test_binary_search_filter_agrees_with_sets(index, monkeypatch):
+    queries = ["sem:per/male rel:k1", "word:mohana -morph:pl", "rel:* -head:jA_1", "sem:- rel:k1"]
+    expected = [search(index, query) for query in queries]
+    monkeypatch.setattr(usr_search, "FILTER_RATIO", 10 ** 9)
+    assert [search(index, query) for query in queries] == expected
+
+
+def test_index_parts_round_trip(index):
+    meta, blob = index.to_parts()
+    loaded = SearchIndex.from_parts(meta, memoryview(blob.tobytes()).cast("I"))
+    for query in ("sem:per/male", "head:(word:[conj_1])", "-rel:k1 segment:ch1_1"):
+        assert loaded.search(query) == index.search(query)
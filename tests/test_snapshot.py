@@ -0,0 +1,87 @@
+import os
+import shutil
+import struct
+
+import pytest
+
+import usr_snapshot
+from usr_engine import parse_usrs
+from usr_model import to_dict
+from usr_snapshot import CorpusSnapshot, build_snapshot, is_current, load_relation_graph, load_search_index, \
+    load_snapshot, read_header, read_search_index, search_index_path, snapshot_path
+
+INPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "input.txt")
+# Offset of the format version in both headers: right after the 8-byte magic.
+VERSION_OFFSET = 8
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "chapter.txt"
+    shutil.copy(INPUT, path)
+    return str(path)
+
+
+def set_version(path, version):
+    with open(path, "r+b") as file:
+        file.seek(VERSION_OFFSET)
+        file.write(struct.pack("<I", version))
+
+
+def test_round_trip(source):
+    with open(source, encoding="utf-8") as file:
+        expected = parse_usrs(file.read())
+    build_snapshot(source)
+
+    with load_snapshot(source) as snapshot:
+        assert list(snapshot) == list(expected)
+        assert len(snapshot) == len(expected)
+        for segment_id, sentence in snapshot.items():
+            assert to_dict(sentence) == to_dict(expected[segment_id])
+        assert snapshot.get("no such segment") is None
+        with pytest.raises(KeyError):
+            snapshot["no such segment"]
+
+
+def test_version_mismatch_is_rebuilt(source):
+    path = build_snapshot(source)
+    set_version(path, usr_snapshot.FORMAT_VERSION + 1)
+
+    assert read_header(path) is None
+    assert not is_current(source)
+    with pytest.raises(ValueError, match="not a USR snapshot"):
+        CorpusSnapshot(path)
+
+    with load_snapshot(source) as snapshot:
+        assert len(snapshot) > 0
+    assert is_current(source)
+
+
+def test_search_index_version_mismatch_is_rebuilt(source):
+    build_snapshot(source)
+    set_version(search_index_path(source), usr_snapshot.FORMAT_VERSION + 1)
+
+    assert read_search_index(source) is None
+    assert load_search_index(source).search("rel:k1")[0] > 0
+
+
+def test_changed_source_is_rebuilt(source):
+    build_snapshot(source)
+    with open(source, "a", encoding="utf-8") as file:
+        file.write("\n<segment_id=added_1>\nrAma\t1\t-\t-\t0:main\t-\t-\t-\t-\n")
+
+    assert not is_current(source)
+    with load_snapshot(source) as snapshot:
+        assert "added_1" in snapshot
+    assert "added_1" in load_relation_graph(source)
+
+
+def test_touched_source_only_refreshes_the_stamp(source, monkeypatch):
+    path = build_snapshot(source)
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    monkeypatch.setattr(usr_snapshot, "build_snapshot", pytest.fail)
+
+    assert is_current(source)
+    assert read_header(path)[2] == stat.st_mtime_ns + 10 ** 9
+    assert snapshot_path(source) == path
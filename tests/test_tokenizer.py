@@ -0,0 +1,72 @@
+import pytest
+
+from usr_engine import parse_usrs
+from usr_tokenizer import UsrSyntaxError, split_relations, split_row
+
+
+def relations(sentence, token_id):
+    token = next(token for token in sentence["tokens"] if token["id"] == token_id)
+    return [(relation["target_id"], relation["label"]) for relation in token["relations"]]
+
+
+@pytest.mark.parametrize("field, expected, messages", [
+    ("14:k1|15:op1", [("14", "k1"), ("15", "op1")], []),
+    ("-", [], []),
+    ("", [], []),
+    ("1:k1:extra", [("1", "k1")], ["extra ':extra' in relation '1:k1:extra' ignored"]),
+    ("3:", [], ["malformed relation '3:', expected target:label"]),
+    (":k1", [], ["malformed relation ':k1', expected target:label"]),
+    ("k1", [], ["malformed relation 'k1', expected target:label"]),
+    ("3:k1||4:k2", [("3", "k1"), ("4", "k2")], ["malformed relation '', expected target:label"]),
+])
+def test_split_relations(field, expected, messages):
+    errors = []
+    assert split_relations(field, 7, errors, "the row") == expected
+    assert [error.message for error in errors] == messages
+    assert all(error.line_number == 7 and error.line == "the row" for error in errors)
+
+
+def test_split_relations_without_an_error_list():
+    assert split_relations("1:k1:extra|3:", 7) == [("1", "k1")]
+
+
+def test_split_row_pads_missing_columns():
+    assert split_row("rAma  1\tper/male") == ["rAma", "1", "per/male", "-", "-", "-", "-", "-", "-"]
+    assert split_row("%affirmative") is None
+
+
+def test_malformed_fields_are_reported_with_their_line():
+    text = ("<segment_id=ch1_1>\n"
+            "#rAma went home.\n"
+            "rAma\t1\tper/male\t-\t3:k1:extra\t-\t-\t-\t-\n"
+            "Gara_1\t2\t-\t-\t3:\t-\t-\t-\t-\n"
+            "jA_1\t3\t-\t-\t0:main\t-\t-\t-\t-\n"
+            "\n"
+            "<segment_id=ch1_2>\n"
+            "vaha\t1\t-\t-\t2:k1\tch1_1.1\t-\t-\t-\n"
+            "so_1\t2\t-\t-\t0:main\t-\t-\t-\t-\n")
+    errors = []
+    sentences = parse_usrs(text, errors)
+
+    # Every row is still parsed; only the broken relations are dropped.
+    assert [token["word"] for token in sentences["ch1_1"]["tokens"]] == ["rAma", "Gara_1", "jA_1"]
+    assert relations(sentences["ch1_1"], "1") == [("3", "k1")]
+    assert relations(sentences["ch1_1"], "2") == []
+    assert sentences["ch1_1"]["main"] == "jA_1_3"
+    assert sentences["ch1_2"]["inter_relations"] == []
+    assert relations(sentences["ch1_2"], "1") == [("2", "k1")]
+
+    assert [error.to_dict() for error in errors] == [
+        {"line": 3, "message": "extra ':extra' in relation '3:k1:extra' ignored",
+         "text": "rAma\t1\tper/male\t-\t3:k1:extra\t-\t-\t-\t-"},
+        {"line": 4, "message": "malformed relation '3:', expected target:label",
+         "text": "Gara_1\t2\t-\t-\t3:\t-\t-\t-\t-"},
+        {"line": 8, "message": "malformed relation 'ch1_1.1', expected target:label",
+         "text": "vaha\t1\t-\t-\t2:k1\tch1_1.1\t-\t-\t-"},
+    ]
+    assert str(errors[1]) == "line 4: malformed relation '3:', expected target:label"
+
+
+def test_error_without_a_line():
+    assert str(UsrSyntaxError("empty input")) == "empty input"
+    assert UsrSyntaxError("empty input").to_dict() == {"line": None, "message": "empty input", "text": None}
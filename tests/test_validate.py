@@ -0,0 +1,40 @@
+from usr_validate import check_file, main
+
+# rAma's construction column names token 99, which is not in the segment.
+ROWS = (
+    "rAma\t1\tper/male\t-\t2:k1\t-\t-\t-\t99:op1\n"
+    "jA_1\t2\t-\t-\t0:main\t-\t-\t-\t-\n"
+)
+
+
+def write(tmp_path, header):
+    path = tmp_path / "chapter.txt"
+    path.write_text(header + "\n" + ROWS, encoding="utf-8")
+    return str(path)
+
+
+def codes(issues):
+    return [item["code"] for item in issues]
+
+
+def test_construction_column_is_ignored_where_the_parser_ignores_it(tmp_path):
+    path = write(tmp_path, "<segment_id=ch1_1>")
+    segments, issues = check_file(path, "segment")
+    assert segments == 1
+    assert issues == []
+    assert main([path, "-j", "1"]) == 0
+
+
+def test_construction_column_is_checked_where_the_parser_merges_it(tmp_path):
+    path = write(tmp_path, "<sent_id=ch1_1>")
+    _, issues = check_file(path, "sentence")
+    assert codes(issues) == ["dangling-target"]
+    assert issues[0]["line"] == 2
+
+
+def test_header_without_an_id(tmp_path):
+    path = write(tmp_path, "<segment_id=>")
+    segments, issues = check_file(path, "segment")
+    assert segments == 0
+    assert codes(issues) == ["missing-segment-id"]
+    assert issues[0]["line"] == 1
@@ -0,0 +1,341 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from graphviz import Digraph
+
+from batch_render import select_ids
+from dot_writer import attr_list, edge, node
+from renderer import render_svg
+from usr_engine import MAIN_EDGE, SENTENCE_NODE, index_segments, parse_block, relation_attributes
+from usr_validate import DIALECTS, iter_chunks
+
+UNCHANGED = "unchanged"
+CHANGED = "changed"
+ADDED = "added"
+REMOVED = "removed"
+
+# Colours of the merged graph; unchanged parts are drawn as usual.
+COLORS = {ADDED: "darkgreen", REMOVED: "red", CHANGED: "darkorange"}
+INFO_FIELDS = ("semantic_category", "morpho_semantic", "speakers_view", "additional_info")
+# As in the node tooltips of convert_usr_to_dot.
+INFO_NAMES = {"semantic_category": "semCat", "morpho_semantic": "morphSem",
+              "speakers_view": "speakersView", "additional_info": "Additional Info"}
+REPORT_NAME = "diff_report.json"
+# Changed segments handed to a worker at a time. Smaller than the
+# validator's chunks: each changed segment is also a Graphviz layout.
+CHUNK_SIZE = 16
+
+
+def token_node(token):
+    # The node key convert_usr_to_dot draws the token under.
+    return f'{token["word"]}_{token["id"]}'
+
+
+def graph_parts(sentence):
+    # node key -> token, (head node, dependent node) -> sorted labels.
+    nodes = {}
+    edges = {}
+    if sentence is None:
+        return nodes, edges
+    for token in sentence["tokens"]:
+        nodes[token_node(token)] = token
+    for token in sentence["tokens"]:
+        for relation in token["relations"]:
+            key = (f'{relation["target"]}_{relation["target_id"]}', token_node(token))
+            edges.setdefault(key, []).append(relation["label"])
+    return nodes, {key: tuple(sorted(labels)) for key, labels in edges.items()}
+
+
+def inter_relation_keys(sentence):
+    if sentence is None:
+        return []
+    keys = []
+    for relation in sentence["inter_relations"]:
+        key = [relation["source_token"], relation["target_sentence"], relation["target_token"], relation["relation"]]
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+def diff_segment(old, new):
+    # Differences between two parses of a segment; either may be None
+    # when the segment exists in one version only. Lists follow token
+    # order, removed items in the old version's order.
+    old_nodes, old_edges = graph_parts(old)
+    new_nodes, new_edges = graph_parts(new)
+    changed_nodes = {}
+    for key, token in new_nodes.items():
+        if key in old_nodes:
+            old_info = old_nodes[key]["info"]
+            fields = {field: [old_info[field], token["info"][field]]
+                      for field in INFO_FIELDS if old_info[field] != token["info"][field]}
+            if fields:
+                changed_nodes[key] = fields
+    old_inter = inter_relation_keys(old)
+    new_inter = inter_relation_keys(new)
+    old_main = old["main"] if old else None
+    new_main = new["main"] if new else None
+
+    diff = {
+        "nodes": {
+            ADDED: [key for key in new_nodes if key not in old_nodes],
+            REMOVED: [key for key in old_nodes if key not in new_nodes],
+            CHANGED: changed_nodes,
+        },
+        "edges": {
+            ADDED: [[head, dependent, label] for (head, dependent), labels in new_edges.items()
+                    if (head, dependent) not in old_edges for label in labels],
+            REMOVED: [[head, dependent, label] for (head, dependent), labels in old_edges.items()
+                      if (head, dependent) not in new_edges for label in labels],
+            "relabeled": [[head, dependent, list(old_edges[head, dependent]), list(labels)]
+                          for (head, dependent), labels in new_edges.items()
+                          if old_edges.get((head, dependent), labels) != labels],
+        },
+        "main": [old_main, new_main] if old and new and old_main != new_main else None,
+        "inter_relations": {
+            ADDED: [key for key in new_inter if key not in old_inter],
+            REMOVED: [key for key in old_inter if key not in new_inter],
+        },
+    }
+    if old is None:
+        diff["status"] = ADDED
+    elif new is None:
+        diff["status"] = REMOVED
+    else:
+        diff["status"] = CHANGED if any(summarize(diff).values()) else UNCHANGED
+    return diff
+
+
+def summarize(diff):
+    return {
+        "nodes_added": len(diff["nodes"][ADDED]),
+        "nodes_removed": len(diff["nodes"][REMOVED]),
+        "nodes_changed": len(diff["nodes"][CHANGED]),
+        "edges_added": len(diff["edges"][ADDED]),
+        "edges_removed": len(diff["edges"][REMOVED]),
+        "edges_relabeled": len(diff["edges"]["relabeled"]),
+        "main_changed": int(diff["main"] is not None),
+        "inter_relations_added": len(diff["inter_relations"][ADDED]),
+        "inter_relations_removed": len(diff["inter_relations"][REMOVED]),
+    }
+
+
+def describe(summary):
+    names = {"nodes_added": "+{} nodes", "nodes_removed": "-{} nodes", "nodes_changed": "~{} info",
+             "edges_added": "+{} edges", "edges_removed": "-{} edges", "edges_relabeled": "~{} labels",
+             "main_changed": "main moved", "inter_relations_added": "+{} inter-relations",
+             "inter_relations_removed": "-{} inter-relations"}
+    return ", ".join(names[key].format(count) for key, count in summary.items() if count) or "no changes"
+
+
+def styled(status, label=None, **attrs):
+    if status == REMOVED:
+        attrs.update(color=COLORS[REMOVED], fontcolor=COLORS[REMOVED], style="dashed")
+    elif status in COLORS:
+        attrs.update(color=COLORS[status], fontcolor=COLORS[status], penwidth="2")
+    return attr_list(label, **attrs)
+
+
+def diff_to_dot(segment_id, old, new, diff, dialect=DIALECTS["segment"]):
+    # One graph with both versions merged: added parts green, removed
+    # parts red and dashed, relabelled edges and nodes whose info changed
+    # orange (the node label lists the old and new values).
+    old_nodes, old_edges = graph_parts(old)
+    new_nodes, new_edges = graph_parts(new)
+    changed_nodes = diff["nodes"][CHANGED]
+
+    dot = Digraph(comment=f"USR diff of {segment_id}")
+    if dialect.rankdir:
+        dot.attr(rankdir=dialect.rankdir)
+    dot.attr(label=f"{segment_id} ({diff['status']}): {describe(summarize(diff))}", labelloc="t")
+    dot.attr(node='*', width='1.5', height=dialect.node_height, fontsize='6')
+
+    sent_node = f"sent_{segment_id}"
+    dot.body.append(node(sent_node, attr_list(f"Sentence {segment_id}", **SENTENCE_NODE)))
+    old_main = old["main"] if old else None
+    new_main = new["main"] if new else None
+    if old_main and new_main and old_main == new_main:
+        dot.body.append(edge(sent_node, new_main, MAIN_EDGE))
+    else:
+        if old_main:
+            dot.body.append(edge(sent_node, old_main, styled(REMOVED, "main", fontsize="8")))
+        if new_main:
+            dot.body.append(edge(sent_node, new_main, styled(ADDED, "main", fontsize="8")))
+
+    nodes = dict(new_nodes)
+    nodes.update((key, token) for key, token in old_nodes.items() if key not in new_nodes)
+    for key, token in nodes.items():
+        label = f"{token['word']}:{token['id']}"
+        status = ADDED if key not in old_nodes else REMOVED if key not in new_nodes else None
+        if key in changed_nodes:
+            status = CHANGED
+            label += "".join(f"\n{INFO_NAMES[field]}: {before} → {after}"
+                             for field, (before, after) in changed_nodes[key].items())
+        label += dialect.label_suffix
+        shape = "box" if "[" in token["word"] and "]" in token["word"] else None
+        tooltip = "\n".join(f"{INFO_NAMES[field]}: {token['info'][field]}" for field in INFO_FIELDS)
+        dot.body.append(node(key, styled(status, label, shape=shape, tooltip=tooltip)))
+
+    edges = dict(new_edges)
+    edges.update((key, labels) for key, labels in old_edges.items() if key not in new_edges)
+    for (head, dependent), labels in edges.items():
+        if (head, dependent) not in old_edges or (head, dependent) not in new_edges:
+            status = ADDED if (head, dependent) not in old_edges else REMOVED
+            dot.body.extend(edge(head, dependent, styled(status, label)) for label in labels)
+        elif old_edges[head, dependent] != labels:
+            label = f"{','.join(old_edges[head, dependent])} → {','.join(labels)}"
+            dot.body.append(edge(head, dependent, styled(CHANGED, label)))
+        else:
+            dot.body.extend(edge(head, dependent, relation_attributes(label)) for label in labels)
+    return dot
+
+
+def output_name(segment_id):
+    return "diff_" + segment_id.replace(os.sep, "_").replace("/", "_") + ".svg"
+
+
+def diff_chunk(chunk, dialect_name, output_dir=None):
+    # Runs in a worker process: parse both versions of each segment, diff
+    # them and, with an output_dir, render the changed ones.
+    dialect = DIALECTS[dialect_name]
+    results = []
+    for segment_id, old_block, new_block in chunk:
+        old = parse_block(old_block[1], segment_id, old_block[0], dialect=dialect) if old_block else None
+        new = parse_block(new_block[1], segment_id, new_block[0], dialect=dialect) if new_block else None
+        diff = diff_segment(old, new)
+        entry = {"status": diff["status"], "summary": summarize(diff), "changes": diff}
+        if output_dir and diff["status"] != UNCHANGED:
+            path = os.path.join(output_dir, output_name(segment_id))
+            try:
+                svg = render_svg(diff_to_dot(segment_id, old, new, diff, dialect))
+            except Exception as error:
+                entry["error"] = str(error)
+            else:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as file:
+                    file.write(svg)
+                os.replace(tmp_path, path)
+                entry["svg"] = os.path.basename(path)
+        results.append((segment_id, entry))
+    return results
+
+
+def iter_pairs(old_text, new_text, patterns, dialect):
+    # (segment_id, old block, new block) for every segment in either
+    # version, new order first; a block is (first line, lines) or None.
+    # Segments whose text is identical are yielded as None: they are
+    # unchanged without parsing.
+    old_lines, old_offsets = index_segments(old_text, dialect=dialect)
+    new_lines, new_offsets = index_segments(new_text, dialect=dialect)
+    segment_ids = list(new_offsets) + [segment_id for segment_id in old_offsets if segment_id not in new_offsets]
+    for segment_id in select_ids(segment_ids, patterns):
+        blocks = []
+        for lines, offsets in ((old_lines, old_offsets), (new_lines, new_offsets)):
+            start, end = offsets.get(segment_id, (None, None))
+            blocks.append((start + 1, lines[start:end]) if start is not None else None)
+        if blocks[0] and blocks[1] and blocks[0][1] == blocks[1][1]:
+            yield segment_id, None
+        else:
+            yield segment_id, (segment_id, blocks[0], blocks[1])
+
+
+def diff_files(old_path, new_path, output_dir=None, patterns=None, workers=None, dialect_name="segment"):
+    # Per-segment change report of two versions of a USR file. Changed
+    # segments are diffed (and rendered into output_dir) in worker
+    # processes, at most a few chunks in flight at a time.
+    started = time.perf_counter()
+    dialect = DIALECTS[dialect_name]
+    with open(old_path, "r", encoding="utf-8") as file:
+        old_text = file.read()
+    with open(new_path, "r", encoding="utf-8") as file:
+        new_text = file.read()
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    segments = {}
+    pending = deque()
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        pairs = []
+        for segment_id, pair in iter_pairs(old_text, new_text, patterns, dialect):
+            segments[segment_id] = {"status": UNCHANGED}
+            if pair is not None:
+                pairs.append(pair)
+        for chunk in iter_chunks(pairs, CHUNK_SIZE):
+            if pool is None:
+                segments.update(diff_chunk(chunk, dialect_name, output_dir))
+                continue
+            pending.append(pool.submit(diff_chunk, chunk, dialect_name, output_dir))
+            if len(pending) >= max_pending:
+                segments.update(pending.popleft().result())
+        while pending:
+            segments.update(pending.popleft().result())
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    counts = Counter(entry["status"] for entry in segments.values())
+    report = {
+        "old": old_path,
+        "new": new_path,
+        "dialect": dialect_name,
+        "segments": segments,
+        "counts": {status: counts.get(status, 0) for status in (UNCHANGED, CHANGED, ADDED, REMOVED)},
+        "rendered": sum("svg" in entry for entry in segments.values()),
+        "failures": [{"segment_id": segment_id, "error": entry["error"]}
+                     for segment_id, entry in segments.items() if "error" in entry],
+        "seconds": round(time.perf_counter() - started, 6),
+    }
+    if output_dir:
+        path = os.path.join(output_dir, REPORT_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="USR_to_Graph.py diff",
+                                     description="Compare two versions of a USR file segment by segment.")
+    parser.add_argument("old", help="reference version, e.g. the gold USR")
+    parser.add_argument("new", help="revised version")
+    parser.add_argument("--ids", nargs="*", help="segment ids or glob patterns to compare (default: all)")
+    parser.add_argument("-o", "--output", default="diffs",
+                        help=f"directory for the SVGs of changed segments and {REPORT_NAME} (default: diffs)")
+    parser.add_argument("--no-render", action="store_true", help="only report the changes")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (1 compares in this process)")
+    parser.add_argument("--dialect", choices=sorted(DIALECTS), default="segment",
+                        help="segment: <segment_id=...> files, sentence: <sent_id=...> files")
+    parser.add_argument("--format", choices=("text", "json"), default="text", help="report format on stdout")
+    args = parser.parse_args(argv)
+
+    report = diff_files(args.old, args.new, None if args.no_render else args.output, args.ids, args.workers,
+                        args.dialect)
+
+    if args.format == "json":
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for segment_id, entry in report["segments"].items():
+            if entry["status"] == UNCHANGED:
+                continue
+            svg = f" -> {os.path.join(args.output, entry['svg'])}" if "svg" in entry else ""
+            print(f"{entry['status']}\t{segment_id}: {describe(entry['summary'])}{svg}")
+        counts = report["counts"]
+        print(f"{len(report['segments'])} segments: {counts[CHANGED]} changed, {counts[ADDED]} added, "
+              f"{counts[REMOVED]} removed, {counts[UNCHANGED]} unchanged in {report['seconds']:.3f}s",
+              file=sys.stderr)
+    for failure in report["failures"]:
+        print(f"error: {failure['segment_id']}: {failure['error']}", file=sys.stderr)
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,690 @@
+import logging
+import mmap
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from graphviz import Digraph
+
+from dot_writer import attr_list, edge, node, quote, subgraph
+from metrics import REGISTRY, count_segments, observe_graph, timed
+from usr_tokenizer import SEGMENT_HEADER, SENT_HEADER, report, segment_id as header_segment_id, split_relations, \
+    split_row
+from usr_model import Relation, Token, TokenInfo, as_token, to_dict
+from usr_index import SentenceIndex, read_inter_relations, resolve_relation, resolve_inter_relations
+
+logger = logging.getLogger(__name__)
+
+# Relations from a construction node ([conj_1], [cp_1], ...) that pull the
+# dependent token into the construction's cluster.
+CONSTRUCTION_LABELS = frozenset({
+    "op1", "op2", "op3", "op4", "op5", "op7", "op8",
+    "start", "end", "mod", "head", "count", "unit",
+    "component1", "component2", "component3", "component4",
+    "component5", "component6", "unit_value", "unit_every",
+    "whole", "part", "kriyAmUla", "verbalizer"
+})
+
+# Main-token policies.
+MAIN_ONLY = "main"        # the token whose dependency column has 0:main
+MAIN_OR_RC = "main_or_rc"  # ... else the first token with an rc* dependency
+
+# Graphs above either size are drawn in huge-graph mode (see
+# convert_usr_to_dot): a force-directed engine, no tooltips, no rank=same
+# groups and each construction cluster collapsed into one node.
+HUGE_GRAPH_NODES = 400
+HUGE_GRAPH_EDGES = 800
+HUGE_GRAPH_ENGINE = "sfdp"
+
+# Rendered segment fragments kept by the process-wide cache (see
+# cached_fragment).
+FRAGMENT_CACHE_SIZE = 4096
+
+FRAGMENT_CACHE = REGISTRY.counter("usr_fragment_cache", "DOT fragment cache lookups by result (hit/miss).")
+
+# Relation merge policies.
+FALLBACK = "fallback"  # construction column only when there is no dependency
+MERGE = "merge"        # dependency and construction relations together
+
+
+class Dialect:
+    """How one flavour of USR text is read and drawn.
+
+    The parsing options pick the segment header, the main-token policy and
+    the relation merge policy; tabs_required skips rows without a tab, as
+    usr_to_dot always did. The drawing options only change attributes of
+    the shared DOT builder.
+    """
+
+    def __init__(self, name, tag, header, main_policy=MAIN_ONLY, relation_policy=FALLBACK,
+                 tabs_required=False, node_height="0.75", label_suffix="\n", rankdir="TB",
+                 inter_relation_edges=True):
+        self.name = name
+        self.tag = tag
+        self.header = header
+        self.header_prefix = f"<{tag}="
+        self.main_policy = main_policy
+        self.relation_policy = relation_policy
+        self.tabs_required = tabs_required
+        self.node_height = node_height
+        self.label_suffix = label_suffix
+        self.rankdir = rankdir
+        self.inter_relation_edges = inter_relation_edges
+
+    def __repr__(self):
+        return f"Dialect({self.name!r})"
+
+
+# <segment_id=...> files drawn by USR_to_Graph.py and the web app.
+SEGMENT_DIALECT = Dialect("segment", "segment_id", SEGMENT_HEADER)
+
+# <sent_id=...> files of usr_to_dot.py.
+SENT_DIALECT = Dialect("sentence", "sent_id", SENT_HEADER, main_policy=MAIN_OR_RC, relation_policy=MERGE,
+                       tabs_required=True, node_height="1.75", label_suffix="", rankdir=None,
+                       inter_relation_edges=False)
+
+
+def index_segments(usrs_text, errors=None, dialect=SEGMENT_DIALECT):
+    # One cheap pass over the text: record the line range of every
+    # segment block so single segments can be parsed on demand.
+    lines = usrs_text.splitlines()
+    offsets = {}
+    current_sentence_id = None
+    start = 0
+
+    for number, line in enumerate(lines):
+        if line.lstrip().startswith(dialect.header_prefix):
+            if current_sentence_id:
+                offsets[current_sentence_id] = (start, number)
+            current_sentence_id = header_segment_id(line, dialect.header)
+            if current_sentence_id is None:
+                report(errors, f"{dialect.name} header without an id", number + 1, line.strip())
+            start = number + 1
+
+    if current_sentence_id:
+        offsets[current_sentence_id] = (start, len(lines))
+
+    return lines, offsets
+
+
+def iter_rows(lines, first_line=None, errors=None, dialect=SEGMENT_DIALECT):
+    # The token rows of one segment block, read the way the dialect reads
+    # them: (line_number, line, fields, dependencies, relations), where
+    # relations are the (target, label) pairs its relation policy keeps.
+    # parse_segment and the validator both read rows through this.
+    merge = dialect.relation_policy == MERGE
+
+    for number, line in enumerate(lines):
+        line = line.strip()
+
+        if not line or line.startswith(("#", "<", "%")):
+            continue
+        if dialect.tabs_required and "\t" not in line:
+            continue
+        fields = split_row(line)
+        if fields is None:
+            continue
+
+        line_number = first_line + number if first_line is not None else None
+        dependency_info = fields[4]
+        construction_info = fields[8]
+        dependencies = split_relations(dependency_info, line_number, errors, line)
+        if merge:
+            pairs = dependencies + split_relations(construction_info, line_number, errors, line)
+        elif dependency_info == "-":
+            pairs = split_relations(construction_info, line_number, errors, line)
+        else:
+            pairs = dependencies
+        yield line_number, line, fields, dependencies, pairs
+
+
+def parse_segment(lines, current_sentence_id, first_line=None, errors=None, dialect=SEGMENT_DIALECT):
+    # first_line is the 1-based file line of lines[0], used for errors.
+    current_tokens = []
+    main_token = None
+    inter_relations = []
+    rc_fallback = dialect.main_policy == MAIN_OR_RC
+
+    for line_number, line, fields, dependencies, pairs in iter_rows(lines, first_line, errors, dialect):
+        word, token_id, semantic_category, morpho_semantic, dependency_info, \
+            additional_info, speakers_view = fields[:7]
+
+        info = TokenInfo(semantic_category, morpho_semantic, speakers_view, additional_info)
+        relations = [Relation(target, label) for target, label in pairs]
+
+        if "0:main" in dependency_info:
+            main_token = (word, token_id)
+        elif rc_fallback and main_token is None and any(label.startswith("rc") for _, label in dependencies):
+            main_token = (word, token_id)
+
+        current_tokens.append(Token(token_id, word, relations, info))
+
+        if additional_info != "-":
+            inter_relations += read_inter_relations(additional_info, token_id, current_sentence_id,
+                                                    line_number, errors, line)
+
+    return finish_segment(current_tokens, main_token, inter_relations)
+
+
+def parse_inter_relations(data, source_token, source_sentence, sentences, current_tokens=None, index=None):
+    # Parse and resolve one additional-info cell on its own. The parsers
+    # do not use this: they resolve every segment's relations in one batch.
+    if index is None:
+        index = SentenceIndex.from_sentences(sentences)
+        if current_tokens:
+            index.add(source_sentence, current_tokens)
+
+    inter_relations = [resolve_relation(relation, index)
+                       for relation in read_inter_relations(data, source_token, source_sentence)]
+    logger.debug("inter-relations of %s.%s: %s", source_sentence, source_token, inter_relations,
+                 extra={"source_sentence": source_sentence, "source_token": source_token,
+                        "inter_relations": inter_relations})
+    return inter_relations
+
+
+def create_json(tokens, main_token, inter_relations):
+    # tokens may be Token records or dicts in the old shape (see
+    # usr_model.as_token). They are copied, so the caller's objects are
+    # not changed. main_token is the (word, id) of the main row, or None.
+    return finish_segment([as_token(token) for token in tokens], main_token,
+                          [dict(relation) for relation in inter_relations])
+
+
+def finish_segment(tokens, main_token, inter_relations):
+    # create_json for tokens the parser has just built: they are finished
+    # in place, relation targets resolved to words and dangling ones
+    # dropped, without copying the segment.
+    index_to_word = {token.id: token.word for token in tokens}
+
+    for token in tokens:
+        updated_relations = []
+        for relation in token.relations:
+            if relation.target_id in index_to_word:
+                relation.target = index_to_word[relation.target_id]
+                updated_relations.append(relation)
+        token.relations = updated_relations
+
+    return {
+        "tokens": tokens,
+        "main": f"{main_token[0]}_{main_token[1]}" if main_token else None,
+        "inter_relations": inter_relations
+    }
+
+
+def parse_segments(lines, offsets, segment_ids=None, errors=None, dialect=SEGMENT_DIALECT):
+    # Inter-relations are only collected while scanning and resolved in
+    # one pass at the end, so forward references find their targets too.
+    sentences = {}
+    index = SentenceIndex()
+    for segment_id, (start, end) in offsets.items():
+        if segment_ids is None or segment_id in segment_ids:
+            sentences[segment_id] = parse_segment(lines[start:end], segment_id, start + 1, errors, dialect)
+            index.add(segment_id, sentences[segment_id]["tokens"])
+    return resolve_inter_relations(sentences, index)
+
+
+def open_usr_file(path, use_mmap=False):
+    # Line stream over a USR file. With use_mmap the file is mapped and
+    # read line by line, so the OS pages it in on demand.
+    with open(path, "rb") as file:
+        if use_mmap:
+            try:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    yield from iter(mapped.readline, b"")
+                return
+            except ValueError:  # empty files cannot be mapped
+                return
+        yield from file
+
+
+def iter_segments(fileobj, errors=None, dialect=SEGMENT_DIALECT):
+    # Yield (segment_id, segment) one block at a time from any iterable
+    # of str or bytes lines. Only the current block is held in memory.
+    # Relations inside the block are resolved; cross-segment targets are
+    # left for resolve_inter_relations.
+    for segment_id, first_line, block in iter_blocks(fileobj, errors, dialect):
+        yield segment_id, parse_block(block, segment_id, first_line, errors, dialect)
+
+
+def iter_blocks(fileobj, errors=None, dialect=SEGMENT_DIALECT):
+    # (segment_id, first_line, lines) per segment block, unparsed;
+    # first_line is the 1-based file line of lines[0].
+    current_sentence_id = None
+    block = []
+    first_line = 0
+
+    for number, line in enumerate(fileobj, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+
+        if line.lstrip().startswith(dialect.header_prefix):
+            if current_sentence_id:
+                yield current_sentence_id, first_line, block
+            current_sentence_id = header_segment_id(line, dialect.header)
+            if current_sentence_id is None:
+                report(errors, f"{dialect.name} header without an id", number, line.strip())
+            block = []
+            first_line = number + 1
+        elif current_sentence_id:
+            block.append(line)
+
+    if current_sentence_id:
+        yield current_sentence_id, first_line, block
+
+
+def parse_block(lines, segment_id, first_line=None, errors=None, dialect=SEGMENT_DIALECT):
+    sentence = parse_segment(lines, segment_id, first_line, errors, dialect)
+    index = SentenceIndex()
+    index.add(segment_id, sentence["tokens"])
+    for relation in sentence["inter_relations"]:
+        if relation["target_sentence"] == segment_id:
+            resolve_relation(relation, index)
+    return sentence
+
+
+@timed("parse_usrs")
+def parse_usrs(usrs_text, errors=None, dialect=SEGMENT_DIALECT):
+    # errors, when given a list, collects UsrSyntaxError entries with
+    # line numbers for malformed rows instead of ignoring them.
+    sentences = {}
+    index = SentenceIndex()
+    for segment_id, sentence in iter_segments(usrs_text.splitlines(), errors, dialect):
+        sentences[segment_id] = sentence
+        index.add(segment_id, sentence["tokens"])
+    count_segments(sentences.values())
+    return resolve_inter_relations(sentences, index)
+
+
+def segment_size(sentence):
+    nodes = len(sentence["tokens"]) + 1
+    edges = sum(len(token["relations"]) for token in sentence["tokens"]) + len(sentence["inter_relations"])
+    return nodes, edges
+
+
+def graph_size(usr_data):
+    nodes = edges = 0
+    for sentence in usr_data.values():
+        segment_nodes, segment_edges = segment_size(sentence)
+        nodes += segment_nodes
+        edges += segment_edges
+    return nodes, edges
+
+
+def construction_members(sentence):
+    # token node -> node of the construction it belongs to, following
+    # nested constructions up to the outermost one.
+    heads = {f'{token["word"]}_{token["id"]}' for token in sentence['tokens']
+             if '[' in token['word'] and ']' in token['word']}
+    members = {}
+    for token in sentence['tokens']:
+        token_node = f'{token["word"]}_{token["id"]}'
+        for relation in token['relations']:
+            target_node = f'{relation["target"]}_{relation["target_id"]}'
+            if target_node in heads and relation['label'] in CONSTRUCTION_LABELS and target_node != token_node:
+                members.setdefault(token_node, target_node)
+
+    def outermost(node):
+        seen = {node}
+        while node in members and members[node] not in seen:
+            node = members[node]
+            seen.add(node)
+        return node
+
+    return {node: outermost(node) for node in members}
+
+
+# Attribute lists shared by every fragment, formatted once.
+SENTENCE_NODE = dict(shape='ellipse', color='blue', fillcolor='lightblue', style='filled')
+MAIN_NODE = dict(shape='ellipse', fillcolor='lightgray')
+MAIN_EDGE = attr_list('main', fontsize='8')
+
+
+@lru_cache(maxsize=1 << 14)
+def relation_attributes(label):
+    return attr_list(label, fontcolor="blue")
+
+
+@lru_cache(maxsize=1 << 14)
+def inter_relation_attributes(label):
+    return attr_list(label, color="red", fontcolor="red")
+
+
+@lru_cache(maxsize=1 << 14)
+def tooltip(semantic_category, morpho_semantic, speakers_view, additional_info):
+    return quote(f"semCat: {semantic_category}\n"
+                 f"morphSem: {morpho_semantic}\n"
+                 f"speakersView: {speakers_view}\n"
+                 f"Additional Info: {additional_info}")
+
+
+def sentence_lines(sent_id, main):
+    sent_node = f'sent_{sent_id}'
+    lines = [node(sent_node, attr_list(f'Sentence {sent_id}', **SENTENCE_NODE))]
+    if main:
+        lines.append(node(main, attr_list(main, **MAIN_NODE)))
+        lines.append(edge(sent_node, main, MAIN_EDGE))
+    return lines
+
+
+def fragment_key(kind, sent_id, sentence, dialect):
+    # Everything a fragment is drawn from; equal keys draw equal DOT.
+    return (kind, dialect.name, sent_id, sentence['main'], tuple(
+        (token['id'], token['word'], token['info']['semantic_category'], token['info']['morpho_semantic'],
+         token['info']['speakers_view'], token['info']['additional_info'],
+         tuple((relation['target'], relation['target_id'], relation['label']) for relation in token['relations']))
+        for token in sentence['tokens']))
+
+
+_fragments = OrderedDict()
+_fragments_lock = threading.Lock()
+
+
+def cached_fragment(kind, build, sent_id, sentence, dialect):
+    # LRU of fragment lines keyed by segment content, shared by every
+    # graph the process draws: a segment that appears in many
+    # neighbourhoods (batch, export, repeated web requests) is turned
+    # into DOT once. Callers must not modify the returned list.
+    key = fragment_key(kind, sent_id, sentence, dialect)
+    with _fragments_lock:
+        lines = _fragments.get(key)
+        if lines is not None:
+            _fragments.move_to_end(key)
+    if lines is not None:
+        FRAGMENT_CACHE.inc(result="hit")
+        return lines
+
+    FRAGMENT_CACHE.inc(result="miss")
+    lines = build(sent_id, sentence, dialect)
+    with _fragments_lock:
+        _fragments[key] = lines
+        while len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+    return lines
+
+
+def segment_elements(sent_id, sentence, members=None):
+    # What one segment draws, as plain data: the DOT fragments and
+    # graph_data are both written from this, so the JSON describes the
+    # same graph as the SVG. Returns (main, nodes, edges, clusters):
+    # nodes are (node_id, token, collapsed member tokens or None), edges
+    # (source, target, label) and clusters (head_node, head_token, member
+    # node ids). With members (see construction_members) each
+    # construction is collapsed into its head, as in huge-graph mode:
+    # edges inside a construction disappear, the others are redirected
+    # to the head and drawn once, and there are no clusters.
+    main = sentence['main']
+    nodes = []
+    edges = []
+    clusters = []
+
+    if members is not None:
+        tokens = {f'{token["word"]}_{token["id"]}': token for token in sentence['tokens']}
+        grouped = {}
+        for member, head in members.items():
+            grouped.setdefault(head, []).append(tokens[member])
+        for token_node, token in tokens.items():
+            if token_node not in members:
+                nodes.append((token_node, token, grouped.get(token_node)))
+
+        drawn = set()
+        for token_node, token in tokens.items():
+            token_node = members.get(token_node, token_node)
+            for relation in token['relations']:
+                target_node = f'{relation["target"]}_{relation["target_id"]}'
+                drawn_edge = (members.get(target_node, target_node), token_node, relation['label'])
+                if drawn_edge[0] != token_node and drawn_edge not in drawn:
+                    drawn.add(drawn_edge)
+                    edges.append(drawn_edge)
+        return members.get(main, main), nodes, edges, clusters
+
+    constructions = {}
+    for token in sentence['tokens']:
+        token_node = f'{token["word"]}_{token["id"]}'
+        nodes.append((token_node, token, None))
+        if '[' in token['word'] and ']' in token['word']:
+            constructions[token_node] = (token, {})
+
+    for token in sentence['tokens']:
+        token_node = f'{token["word"]}_{token["id"]}'
+        for relation in token['relations']:
+            target_node = f'{relation["target"]}_{relation["target_id"]}'
+            edges.append((target_node, token_node, relation['label']))
+            if target_node in constructions and relation['label'] in CONSTRUCTION_LABELS:
+                # A dict keeps the members in order without repeats.
+                constructions[target_node][1][token_node] = None
+
+    for head_node, (token, cluster_members) in constructions.items():
+        clusters.append((head_node, token, list(cluster_members)))
+    return main, nodes, edges, clusters
+
+
+def build_summary_fragment(sent_id, sentence, dialect=SEGMENT_DIALECT, members=None):
+    # Huge-graph counterpart of build_segment_fragment: no tooltips, and
+    # each construction is one box listing its members instead of a
+    # cluster.
+    if members is None:
+        members = construction_members(sentence)
+    main, nodes, edges, _ = segment_elements(sent_id, sentence, members)
+
+    lines = sentence_lines(sent_id, main)
+    for token_node, token, collapsed in nodes:
+        if collapsed:
+            label = f"{token['word']}:{token['id']}\n{', '.join(member['word'] for member in collapsed)}"
+            lines.append(node(token_node, attr_list(label, shape='box', style='filled,dashed', fillcolor='lightgray')))
+        else:
+            lines.append(node(token_node, attr_list(f"{token['word']}:{token['id']}{dialect.label_suffix}")))
+    lines.extend(edge(source, target, relation_attributes(label)) for source, target, label in edges)
+    return lines
+
+
+def build_segment_fragment(sent_id, sentence, dialect=SEGMENT_DIALECT):
+    # DOT body lines for one segment: its sentence node, main edge, token
+    # nodes, dependency edges and construction clusters. Inter-relation
+    # edges depend on other segments and are added by convert_usr_to_dot.
+    main, nodes, edges, clusters = segment_elements(sent_id, sentence)
+    lines = sentence_lines(sent_id, main)
+
+    for token_node, token, _ in nodes:
+        label = f"{token['word']}:{token['id']}{dialect.label_suffix}"
+        info = token['info']
+        tooltip_info = tooltip(info['semantic_category'], info['morpho_semantic'],
+                               info['speakers_view'], info['additional_info'])
+
+        # Attributes in the order Digraph.node writes them: label, then by name.
+        if '[' in token['word'] and ']' in token['word']:
+            lines.append(f"\t{quote(token_node)} [label={quote(label)} shape=box tooltip={tooltip_info}]\n")
+        else:
+            lines.append(f"\t{quote(token_node)} [label={quote(label)} tooltip={tooltip_info}]\n")
+
+    lines.extend(edge(source, target, relation_attributes(label)) for source, target, label in edges)
+
+    for cluster_token, token, connected_nodes in clusters:
+        concept = f"{token['word']}:{token['id']}{dialect.label_suffix}"
+        cluster_lines = [node(cluster_token, attr_list(concept, shape='box'), "\t\t")]
+        cluster_lines.extend(node(member, "", "\t\t") for member in connected_nodes)
+        lines.extend(subgraph(f'cluster_{cluster_token}', cluster_lines, {
+            "style": 'filled,dashed',
+            "color": 'black',
+            "fillcolor": 'lightgray',
+            "label": f'Construction: {concept}',
+        }))
+
+    return lines
+
+
+def same_rank_pairs(usr_data):
+    # (sent_a, sent_b) of every two drawn segments that share an
+    # inter-relation, placed side by side in detailed mode.
+    pairs = set()
+    for sentence in usr_data.values():
+        for rel in sentence.get("inter_relations", []):
+            src = rel["source_sentence"]
+            tgt = rel["target_sentence"]
+            if src and tgt and src != tgt and src in usr_data and tgt in usr_data:
+                pairs.add(tuple(sorted([src, tgt])))
+    return pairs
+
+
+def inter_relation_edges(sent_id, sentence, index, members=None):
+    # (source, target, label) of the segment's resolved inter-relations;
+    # members maps segment id -> construction_members in huge-graph mode.
+    edges = []
+    for relation in sentence.get("inter_relations", []):
+        target_token = f'{relation["target_token"]}'
+        target_sentence = relation["target_sentence"]
+
+        if not target_token or not target_sentence:
+            continue
+
+        source = index.token(sent_id, f'{relation["source_token"]}')
+        target = index.token(target_sentence, target_token)
+
+        if source and target:
+            source_node = f'{source["word"]}_{source["id"]}'
+            target_node = f'{target["word"]}_{target["id"]}'
+            if members is not None:
+                source_node = members[sent_id].get(source_node, source_node)
+                target_node = members.get(target_sentence, {}).get(target_node, target_node)
+            edges.append((source_node, target_node, relation["relation"]))
+    return edges
+
+
+def clear_fragment_cache():
+    # For benchmarks that time cold conversions.
+    with _fragments_lock:
+        _fragments.clear()
+
+
+def summary_fragment(sent_id, sentence, dialect=SEGMENT_DIALECT):
+    return cached_fragment("summary", build_summary_fragment, sent_id, sentence, dialect)
+
+
+def segment_fragment(sent_id, sentence, dialect=SEGMENT_DIALECT):
+    return cached_fragment("segment", build_segment_fragment, sent_id, sentence, dialect)
+
+
+def is_huge_graph(nodes, edges):
+    return nodes > HUGE_GRAPH_NODES or edges > HUGE_GRAPH_EDGES
+
+
+def huge_graph_simplifications(dialect=SEGMENT_DIALECT):
+    applied = [f"layout:{HUGE_GRAPH_ENGINE}", "no_tooltips", "collapsed_constructions"]
+    if dialect.inter_relation_edges:
+        applied.append("no_rank_same")
+    return applied
+
+
+@timed("convert_usr_to_dot")
+def convert_usr_to_dot(usr_data, skipped=None, fragment=None, dialect=SEGMENT_DIALECT, huge=None, simplified=None):
+    # The one DOT builder for every dialect. fragment(sent_id, sentence)
+    # returns a segment's body lines; by default the cached
+    # segment_fragment, which the web app's session stores rely on too.
+    # huge=None switches to huge-graph mode above HUGE_GRAPH_NODES /
+    # HUGE_GRAPH_EDGES, True/False force it. The simplifications applied
+    # are appended to the `simplified` list when one is given.
+    nodes, edges = graph_size(usr_data)
+    observe_graph(nodes, edges)
+    if huge is None:
+        huge = is_huge_graph(nodes, edges)
+
+    members = {}
+    if huge:
+        if simplified is not None:
+            simplified.extend(huge_graph_simplifications(dialect))
+        members = {sent_id: construction_members(sentence) for sent_id, sentence in usr_data.items()}
+
+        # The hook's fragments are full detail, so it is not used here.
+        def fragment(sent_id, sentence):
+            return summary_fragment(sent_id, sentence, dialect)
+    elif fragment is None:
+        def fragment(sent_id, sentence):
+            return segment_fragment(sent_id, sentence, dialect)
+
+    dot = Digraph(comment='USR Representation', engine=HUGE_GRAPH_ENGINE if huge else 'dot')
+    if huge:
+        dot.attr(overlap='prism', splines='false', outputorder='edgesfirst')
+    elif dialect.rankdir:
+        dot.attr(rankdir=dialect.rankdir)
+    if skipped:
+        dot.attr(label=f'{len(skipped)} more segment(s) not drawn: graph budget reached', labelloc='t')
+    dot.attr(node='*', width='1.5', height=dialect.node_height, fontsize='6')
+
+    if dialect.inter_relation_edges and not huge:
+        # For each pair of segments sharing an inter-relation, emit a
+        # subgraph with rank=same so Graphviz places their sentence-root
+        # nodes on the same rank (side by side).
+        for sent_a, sent_b in same_rank_pairs(usr_data):
+            dot.body.extend(subgraph(f"same_rank_{sent_a}_{sent_b}",
+                                     [node(f'sent_{sent_a}', "", "\t\t"), node(f'sent_{sent_b}', "", "\t\t")],
+                                     {"rank": "same"}))
+
+    index = SentenceIndex.from_sentences(usr_data) if dialect.inter_relation_edges else None
+
+    # ── Now render each sentence as before ──
+    for sent_id, sentence in usr_data.items():
+        dot.body.extend(fragment(sent_id, sentence))
+        if index is not None:
+            dot.body.extend(edge(source, target, inter_relation_attributes(label))
+                            for source, target, label in inter_relation_edges(sent_id, sentence, index,
+                                                                              members if huge else None))
+
+    return dot
+
+
+def graph_data(usr_data, skipped=None, dialect=SEGMENT_DIALECT, huge=None):
+    # Layout-ready description of the graph convert_usr_to_dot draws with
+    # the same arguments, from the same segment_elements: node ids,
+    # labels, edges and construction clusters as plain lists a client can
+    # lay out itself. In huge-graph mode constructions are collapsed into
+    # their head node, which lists its "members", and there are no
+    # clusters or same_rank groups.
+    if huge is None:
+        huge = is_huge_graph(*graph_size(usr_data))
+    members = {sent_id: construction_members(sentence) for sent_id, sentence in usr_data.items()} if huge else None
+    index = SentenceIndex.from_sentences(usr_data) if dialect.inter_relation_edges else None
+    nodes = []
+    edges = []
+    clusters = []
+
+    for sent_id, sentence in usr_data.items():
+        main, segment_nodes, segment_edges, segment_clusters = segment_elements(
+            sent_id, sentence, members[sent_id] if huge else None)
+        sent_node = f'sent_{sent_id}'
+        nodes.append({"id": sent_node, "label": f'Sentence {sent_id}', "kind": "sentence", "sentence": sent_id})
+        if main:
+            edges.append({"source": sent_node, "target": main, "label": "main", "kind": "main"})
+
+        for token_node, token, collapsed in segment_nodes:
+            data = {
+                "id": token_node,
+                "label": f"{token['word']}:{token['id']}",
+                "kind": "construction" if '[' in token['word'] and ']' in token['word'] else "token",
+                "main": token_node == main,
+                "sentence": sent_id,
+                "word": token['word'],
+                "token_id": token['id'],
+                "info": to_dict(token['info']),
+            }
+            if collapsed:
+                data["members"] = [f'{member["word"]}_{member["id"]}' for member in collapsed]
+            nodes.append(data)
+
+        edges.extend({"source": source, "target": target, "label": label, "kind": "relation"}
+                     for source, target, label in segment_edges)
+        clusters.extend({"id": f'cluster_{head_node}', "sentence": sent_id, "head": head_node,
+                         "nodes": [head_node] + cluster_members}
+                        for head_node, _, cluster_members in segment_clusters)
+        if index is not None:
+            edges.extend({"source": source, "target": target, "label": label, "kind": "inter_relation"}
+                         for source, target, label in inter_relation_edges(sent_id, sentence, index, members))
+
+    same_rank = same_rank_pairs(usr_data) if dialect.inter_relation_edges and not huge else ()
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "clusters": clusters,
+        "same_rank": sorted([f'sent_{sent_a}', f'sent_{sent_b}'] for sent_a, sent_b in same_rank),
+        "skipped": list(skipped or []),
+        "engine": HUGE_GRAPH_ENGINE if huge else "dot",
+        "simplified": huge_graph_simplifications(dialect) if huge else [],
+    }
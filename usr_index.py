@@ -0,0 +1,123 @@
+import re
+
+from metrics import timed
+from usr_tokenizer import split_relations
+
+# Segment ids are matched on '_', '-' and '.' boundaries when building aliases.
+ALIAS_BOUNDARY = re.compile(r"[_\-.]")
+
+
+def segment_aliases(segment_id):
+    # "biology_chapter3_plantkingdom_173" -> "chapter3_plantkingdom_173",
+    # "plantkingdom_173", "173": the short forms annotators write in the
+    # additional-info column.
+    return [segment_id[match.end():] for match in ALIAS_BOUNDARY.finditer(segment_id) if segment_id[match.end():]]
+
+
+class SentenceIndex:
+    """Lookup tables for resolving inter-relation targets in O(1).
+
+    ``sentences`` maps exact segment ids, ``aliases`` maps id suffixes to
+    the first segment that registered them, and ``tokens`` holds an
+    id -> token dict per segment. Lookups keep the old fuzzy behaviour:
+    an exact id wins, then an alias, then the first segment whose id
+    contains the target.
+    """
+
+    def __init__(self):
+        self.sentences = {}
+        self.aliases = {}
+        self.tokens = {}
+        self.order = []
+        self._scanned = {}
+
+    @classmethod
+    def from_sentences(cls, sentences):
+        index = cls()
+        for sentence_id, sentence in sentences.items():
+            index.add(sentence_id, sentence.get("tokens", []))
+        return index
+
+    def add(self, sentence_id, tokens):
+        if sentence_id not in self.sentences:
+            self.sentences[sentence_id] = sentence_id
+            self.order.append(sentence_id)
+        for alias in segment_aliases(sentence_id):
+            self.aliases.setdefault(alias, sentence_id)
+        # reversed() so the first token wins when an id is duplicated.
+        self.tokens[sentence_id] = {str(token["id"]): token for token in reversed(tokens)}
+
+    def resolve_sentence(self, target_sentence):
+        if not target_sentence:
+            return None
+        target_sentence = str(target_sentence)
+        found = self.sentences.get(target_sentence) or self.aliases.get(target_sentence)
+        if found:
+            return found
+        # Substring fallback; each target only ever scans a segment once,
+        # and a hit is stored as an alias for the next lookup.
+        start = self._scanned.get(target_sentence, 0)
+        for sentence_id in self.order[start:]:
+            if target_sentence in sentence_id:
+                self.aliases[target_sentence] = sentence_id
+                return sentence_id
+        self._scanned[target_sentence] = len(self.order)
+        return None
+
+    def token(self, sentence_id, token_id):
+        if token_id is None:
+            return None
+        return self.tokens.get(sentence_id, {}).get(str(token_id))
+
+    def word(self, sentence_id, token_id):
+        token = self.token(sentence_id, token_id)
+        return token["word"] if token else None
+
+
+def read_inter_relations(data, source_token, source_sentence, line_number=None, errors=None, line=None):
+    # Split the additional-info column into relation references without
+    # resolving them; resolve_inter_relations fills in the targets once
+    # every segment is known.
+    inter_relations = []
+    for target_sentence_id, relation_type in split_relations(data, line_number, errors, line):
+        if target_sentence_id.isdigit():
+            target_sentence = source_sentence
+            target_token = target_sentence_id
+        elif '.' in target_sentence_id:
+            target_sentence, _, target_token = target_sentence_id.rpartition(".")
+        else:
+            target_sentence, target_token = target_sentence_id, None
+
+        inter_relations.append({
+            "source_token": source_token,
+            "target_token": target_token,
+            "target_word": None,
+            "source_sentence": source_sentence,
+            "target_sentence": target_sentence,
+            "relation": relation_type
+        })
+
+    return inter_relations
+
+
+def resolve_relation(relation, index):
+    target_sentence = relation["target_sentence"]
+    if target_sentence == relation["source_sentence"]:
+        target_sentence_found = target_sentence
+    else:
+        target_sentence_found = index.resolve_sentence(target_sentence)
+
+    if target_sentence_found:
+        relation["target_sentence"] = target_sentence_found
+        relation["target_word"] = index.word(target_sentence_found, relation["target_token"])
+    return relation
+
+
+@timed("resolve_inter_relations")
+def resolve_inter_relations(sentences, index):
+    # Batched second pass: every reference, forward or backward, is
+    # resolved against the complete index in one sweep.
+    for sentence in sentences.values():
+        for relation in sentence.get("inter_relations", []):
+            resolve_relation(relation, index)
+    return sentences
@@ -0,0 +1,112 @@
+import sys
+
+_intern = sys.intern
+
+
+class Record:
+    """Slotted record that still reads like the old dicts.
+
+    ``record["word"]``, ``record.get("info")`` and ``"target" in record``
+    keep working for existing callers; ``to_dict()`` returns the plain
+    dict shape parse_usrs used to produce.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class Relation(Record):
+    # target is the target word, filled in by create_json once the
+    # segment's tokens are known; target_id is the raw column value.
+    __slots__ = ("target", "target_id", "label")
+
+    def __init__(self, target_id, label, target=None):
+        self.target = target
+        self.target_id = _intern(target_id)
+        self.label = _intern(label)
+
+
+class TokenInfo(Record):
+    __slots__ = ("semantic_category", "morpho_semantic", "speakers_view", "additional_info")
+
+    def __init__(self, semantic_category="-", morpho_semantic="-", speakers_view="-", additional_info="-"):
+        self.semantic_category = _intern(semantic_category)
+        self.morpho_semantic = _intern(morpho_semantic)
+        self.speakers_view = _intern(speakers_view)
+        self.additional_info = additional_info
+
+
+class Token(Record):
+    __slots__ = ("id", "word", "relations", "info")
+
+    def __init__(self, id, word, relations, info):
+        self.id = _intern(id)
+        self.word = word
+        self.relations = relations
+        self.info = info
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "word": self.word,
+            "relations": [relation.to_dict() for relation in self.relations],
+            "info": self.info.to_dict(),
+        }
+
+
+def as_token(token):
+    # A new Token built from a Token or from the dict shape older callers
+    # pass: {"id", "word", "relations": [{"target": <token id>, "label"}],
+    # "info": {...}}. Relations start unresolved, as from the parser.
+    relations = [
+        Relation(str(relation["target_id"] if "target_id" in relation else relation["target"]), relation["label"])
+        for relation in token.get("relations", [])
+    ]
+    info = token.get("info") or {}
+    if not isinstance(info, TokenInfo):
+        info = TokenInfo(**{key: info[key] for key in TokenInfo.__slots__ if key in info})
+    return Token(str(token["id"]), token["word"], relations, info)
+
+
+def to_dict(value):
+    # Recursively turn parsed output (segments, tokens, relations) into
+    # plain dicts and lists, e.g. for JSON.
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key: to_dict(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_dict(item) for item in value]
+    return value
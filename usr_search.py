@@ -0,0 +1,369 @@
+import argparse
+import re
+import sys
+from array import array
+from bisect import bisect_left
+
+# Query fields -> indexed field. A term matches tokens:
+#   word:rAma        the token's word
+#   sem:per/male     semantic category (morph:, view: likewise)
+#   rel:k1           the token has a relation with this label
+#   rel:k1>[conj_1]  ... whose head is this word
+#   head:[conj_1]    the token depends on a token with this word
+#   head:(query)     ... on a token matching the query
+#   inter:coref      the token is the source of this inter-relation
+#   segment:ch3_*    the token is in a segment with this id
+# Values match exactly; * and ? are wildcards.
+FIELDS = {
+    "word": "word",
+    "sem": "sem", "semcat": "sem", "semantic_category": "sem",
+    "morph": "morph", "morpho_semantic": "morph",
+    "view": "view", "speakers_view": "view",
+    "rel": "rel",
+    "head": "head",
+    "inter": "inter",
+    "segment": "segment",
+}
+INDEXED = ("word", "sem", "morph", "view", "rel", "edge", "head", "inter")
+# Fields every token has exactly one value of.
+SINGLE_VALUED = ("word", "sem", "morph", "view")
+
+# Below this candidates-to-postings ratio an AND filters the candidates by
+# binary search instead of building a set of the postings.
+FILTER_RATIO = 64
+
+TERM = re.compile(r'([A-Za-z_]+):("(?:[^"\\]|\\.)*"|\S*)')
+NESTED = re.compile(r"head:\(")
+
+
+class QueryError(ValueError):
+    """A search query that cannot be parsed."""
+
+
+def tokenize(query):
+    # "(", ")", "|", "-" and field:value terms; a value is a quoted string
+    # or runs to the next space. A ")" closing a group may follow a value
+    # directly, unless the value's own parentheses need it (pAsa_1(a_1)).
+    tokens = []
+    position = 0
+    while position < len(query):
+        char = query[position]
+        if char.isspace():
+            position += 1
+        elif NESTED.match(query, position):
+            tokens.append(("head",))
+            position += len("head:(")
+        elif char in "()|-":
+            tokens.append(char)
+            position += 1
+        else:
+            match = TERM.match(query, position)
+            if not match or not match.group(2):
+                word = query[position:].split(None, 1)[0]
+                if word in ("AND", "OR"):
+                    tokens.append("|" if word == "OR" else "AND")
+                    position += len(word)
+                    continue
+                raise QueryError(f"expected field:value at {query[position:]!r}")
+            field, value = match.groups()
+            closing = 0
+            if value.startswith('"'):
+                value = re.sub(r"\\(.)", r"\1", value[1:-1])
+            else:
+                while value.endswith(")") and value.count(")") > value.count("("):
+                    value = value[:-1]
+                    closing += 1
+            if field.lower() not in FIELDS:
+                raise QueryError(f"unknown field {field!r}, expected one of {', '.join(sorted(FIELDS))}")
+            tokens.append(("term", FIELDS[field.lower()], value))
+            tokens.extend(")" * closing)
+            position = match.end()
+    return tokens
+
+
+def parse_query(query):
+    # expr := and ("|" and)* ; and := unary+ ; unary := "-" unary | "(" expr ")" | term
+    # Terms side by side must hold for the same token.
+    tokens = [token for token in tokenize(query) if token != "AND"]
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def expression():
+        nonlocal position
+        options = [conjunction()]
+        while peek() == "|":
+            position += 1
+            options.append(conjunction())
+        return options[0] if len(options) == 1 else ("or", options)
+
+    def conjunction():
+        parts = [unary()]
+        while peek() not in (None, "|", ")"):
+            parts.append(unary())
+        return parts[0] if len(parts) == 1 else ("and", parts)
+
+    def unary():
+        nonlocal position
+        token = peek()
+        if token is None:
+            raise QueryError("query ends too early")
+        position += 1
+        if token == "-":
+            return ("not", unary())
+        if token == "(" or token == ("head",):
+            node = expression()
+            if peek() != ")":
+                raise QueryError("missing )")
+            position += 1
+            return node if token == "(" else ("head", node)
+        if isinstance(token, tuple) and len(token) == 3:
+            return token
+        raise QueryError(f"unexpected {token!r}")
+
+    if not tokens:
+        raise QueryError("empty query")
+    node = expression()
+    if position != len(tokens):
+        raise QueryError(f"unexpected {tokens[position]!r}")
+    return node
+
+
+def contains(sequence, value):
+    index = bisect_left(sequence, value)
+    return index < len(sequence) and sequence[index] == value
+
+
+class SearchIndex:
+    """Inverted index from token attributes and relation labels to tokens.
+
+    Tokens are numbered in corpus order, so the tokens of segment i are
+    ``starts[i]`` up to ``starts[i + 1]``. ``postings[field][value]`` is
+    the ascending list of numbers of the tokens carrying that value (an
+    array, or a zero-copy view into a loaded index file). The tokens that
+    depend on token t are ``dependents[dependent_starts[t]:dependent_starts[t + 1]]``.
+    """
+
+    def __init__(self, segments, starts, token_ids, postings, dependent_starts, dependents):
+        self.segments = segments
+        self.starts = starts
+        self.token_ids = token_ids
+        self.postings = postings
+        self.dependent_starts = dependent_starts
+        self.dependents = dependents
+        self.vocabulary = {field: sorted(values) for field, values in postings.items()}
+        self.vocabulary["segment"] = sorted(segments)
+        self.segment_numbers = {segment_id: number for number, segment_id in enumerate(segments)}
+        self.token_segments = array("I")
+        for segment in range(len(segments)):
+            self.token_segments.extend(array("I", [segment]) * (starts[segment + 1] - starts[segment]))
+
+    @classmethod
+    def from_sentences(cls, sentences):
+        segments = []
+        starts = []
+        token_ids = []
+        postings = {field: {} for field in INDEXED}
+        arcs = []
+        number = 0
+        for segment_id, sentence in sentences.items():
+            segments.append(segment_id)
+            starts.append(number)
+            numbers = {}
+            for offset, token in enumerate(sentence["tokens"]):
+                numbers.setdefault(token["id"], number + offset)
+            inter_labels = {}
+            for relation in sentence["inter_relations"]:
+                inter_labels.setdefault(relation["source_token"], set()).add(relation["relation"])
+            for token in sentence["tokens"]:
+                info = token["info"]
+                values = {("word", token["word"]), ("sem", info["semantic_category"]),
+                          ("morph", info["morpho_semantic"]), ("view", info["speakers_view"])}
+                for relation in token["relations"]:
+                    values.add(("rel", relation["label"]))
+                    values.add(("head", relation["target"]))
+                    values.add(("edge", f'{relation["label"]}>{relation["target"]}'))
+                    if relation["target_id"] in numbers:
+                        arcs.append((numbers[relation["target_id"]], number))
+                for label in inter_labels.get(token["id"], ()):
+                    values.add(("inter", label))
+                for field, value in values:
+                    entries = postings[field].get(value)
+                    if entries is None:
+                        entries = postings[field][value] = array("I")
+                    entries.append(number)
+                token_ids.append(token["id"])
+                number += 1
+        starts.append(number)
+        arcs.sort()
+        dependent_starts = array("I", [0] * (number + 1))
+        for head, _ in arcs:
+            dependent_starts[head + 1] += 1
+        for head in range(number):
+            dependent_starts[head + 1] += dependent_starts[head]
+        dependents = array("I", (dependent for _, dependent in arcs))
+        return cls(segments, starts, token_ids, postings, dependent_starts, dependents)
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    def matching_values(self, field, pattern):
+        # Exact lookup, or a prefix range of the sorted vocabulary checked
+        # against the wildcard pattern.
+        vocabulary = self.vocabulary[field]
+        wildcard = re.search(r"[*?]", pattern)
+        if wildcard is None:
+            return [pattern] if pattern in (self.segment_numbers if field == "segment" else self.postings[field]) else []
+        prefix = pattern[:wildcard.start()]
+        regex = re.compile(".*".join(".".join(map(re.escape, part.split("?"))) for part in pattern.split("*")) + r"\Z")
+        start = bisect_left(vocabulary, prefix)
+        end = bisect_left(vocabulary, prefix + "\U0010ffff") if prefix else len(vocabulary)
+        return [value for value in vocabulary[start:end] if regex.match(value)]
+
+    def term_sequences(self, field, value):
+        # Ascending sequences of token numbers whose union the term matches.
+        if field == "rel" and ">" in value:
+            field = "edge"
+        if field == "segment":
+            return [range(self.starts[self.segment_numbers[segment_id]],
+                          self.starts[self.segment_numbers[segment_id] + 1])
+                    for segment_id in self.matching_values(field, value)]
+        return [self.postings[field][match] for match in self.matching_values(field, value)]
+
+    def union(self, sequences):
+        result = set()
+        for sequence in sequences:
+            result.update(sequence)
+        return result
+
+    def evaluate(self, node):
+        kind = node[0]
+        if kind == "term":
+            return self.union(self.term_sequences(node[1], node[2]))
+        if kind == "or":
+            result = set()
+            for option in node[1]:
+                result |= self.evaluate(option)
+            return result
+        if kind == "not":
+            return self.conjunction([node])
+        if kind == "head":
+            result = set()
+            for head in self.evaluate(node[1]):
+                result.update(self.dependents[self.dependent_starts[head]:self.dependent_starts[head + 1]])
+            return result
+        return self.conjunction(node[1])
+
+    def conjunction(self, parts):
+        # Start from the smallest positive part, then narrow it down. Term
+        # parts are checked by binary search while the candidates are few;
+        # excluding most of a single-valued field is keeping the rest of it.
+        filters = []
+        for part in parts:
+            keep = part[0] != "not"
+            node = part if keep else part[1]
+            sequences = None
+            size = len(self)
+            if node[0] == "term":
+                sequences = self.term_sequences(node[1], node[2])
+                size = sum(map(len, sequences))
+                if not keep and node[1] in SINGLE_VALUED and 2 * size > len(self):
+                    excluded = set(self.matching_values(node[1], node[2]))
+                    sequences = [entries for value, entries in self.postings[node[1]].items() if value not in excluded]
+                    size = len(self) - size
+                    keep = True
+            filters.append((keep, size, sequences, node))
+        filters.sort(key=lambda item: (not item[0], item[1]))
+
+        if filters[0][0]:
+            _, _, sequences, node = filters.pop(0)
+            candidates = self.union(sequences) if sequences is not None else self.evaluate(node)
+        else:
+            candidates = set(range(len(self)))
+        for keep, size, sequences, node in filters:
+            if not candidates:
+                break
+            if sequences is not None and len(candidates) * FILTER_RATIO < size:
+                candidates = {number for number in candidates
+                              if any(contains(sequence, number) for sequence in sequences) == keep}
+                continue
+            matched = self.union(sequences) if sequences is not None else self.evaluate(node)
+            candidates = candidates & matched if keep else candidates - matched
+        return candidates
+
+    def search(self, query, limit=None):
+        # (total segments matched, [(segment_id, [token ids]), ...] in
+        # corpus order, at most `limit` of them).
+        matched = self.evaluate(parse_query(query))
+        segments = sorted(set(map(self.token_segments.__getitem__, matched)))
+        results = []
+        for segment in segments[:limit]:
+            tokens = [self.token_ids[number] for number in range(self.starts[segment], self.starts[segment + 1])
+                      if number in matched]
+            results.append((self.segments[segment], tokens))
+        return len(segments), results
+
+    def to_parts(self):
+        # (meta, blob) for usr_snapshot.write_search_index: the dependents
+        # and every posting list concatenated into one uint32 array,
+        # located by offset.
+        blob = array("I", self.dependent_starts)
+        blob.extend(self.dependents)
+        locations = {}
+        for field, values in self.postings.items():
+            locations[field] = {}
+            for value, entries in values.items():
+                locations[field][value] = [len(blob), len(entries)]
+                blob.extend(entries)
+        meta = {"segments": self.segments, "starts": list(self.starts), "token_ids": self.token_ids,
+                "dependents": len(self.dependents), "postings": locations}
+        return meta, blob
+
+    @classmethod
+    def from_parts(cls, meta, blob):
+        # blob: any uint32 sequence supporting slicing, e.g. a memoryview
+        # cast over a memory-mapped file.
+        postings = {field: {value: blob[offset:offset + count] for value, (offset, count) in values.items()}
+                    for field, values in meta["postings"].items()}
+        size = len(meta["token_ids"]) + 1
+        return cls(meta["segments"], meta["starts"], meta["token_ids"], postings,
+                   blob[:size], blob[size:size + meta["dependents"]])
+
+
+def main(argv=None):
+    # Find segments by token attributes and relation labels. Imported
+    # here because usr_snapshot imports this module.
+    from USR_to_Graph import convert_usr_to_dot, select_segments
+    from renderer import render_svg
+    from usr_snapshot import load_search_index, load_snapshot
+
+    parser = argparse.ArgumentParser(prog="USR_to_Graph.py search",
+                                     description="List the segments with tokens matching a query.")
+    parser.add_argument("input_file")
+    parser.add_argument("query", help='e.g. "sem:per/male head:(word:[conj_*] rel:k1)"')
+    parser.add_argument("--limit", type=int, default=50, help="segments to list, 0 for all (default: 50)")
+    parser.add_argument("--render", metavar="SVG", help="also draw the listed segments into this file")
+    args = parser.parse_args(argv)
+
+    index = load_search_index(args.input_file)
+    try:
+        total, matches = index.search(args.query, args.limit or None)
+    except QueryError as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 2
+    for segment_id, tokens in matches:
+        print(f"{segment_id}\t{','.join(tokens)}")
+    print(f"{total} segments matched" + (f", {len(matches)} listed" if len(matches) < total else ""),
+          file=sys.stderr)
+    if args.render and matches:
+        with load_snapshot(args.input_file) as snapshot:
+            filtered_data, skipped = select_segments(snapshot, [segment_id for segment_id, _ in matches], 0)
+        with open(args.render, "wb") as file:
+            file.write(render_svg(convert_usr_to_dot(filtered_data, skipped)))
+        print(f"Graph saved as {args.render}", file=sys.stderr)
+    return 0 if total else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import uuid
+import zlib
+
+from relation_graph import RelationGraph
+from usr_search import SearchIndex
+from usr_model import Relation, Token, TokenInfo
+
+# Layout of a .usrsnap file:
+#   header   magic, format version, sha256/size/mtime of the source file,
+#            offset and length of the index
+#   blobs    one zlib-compressed JSON record per segment
+#   index    zlib-compressed JSON list of [segment_id, offset, length]
+# Segments are stored already parsed and resolved, so loading one is a
+# slice of the mapping plus one decompress.
+MAGIC = b"USRSNAP\0"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sI32sQqQQ")
+SNAPSHOT_SUFFIX = ".usrsnap"
+# The segment-level relation graph is kept beside the snapshot as JSON
+# with the same source stamp, so it can be loaded without the snapshot.
+GRAPH_SUFFIX = ".usrgraph"
+# The search index likewise: header with the source stamp and the length
+# of a JSON part (segments, token ids, posting locations), then every
+# posting list as one uint32 array, mapped and sliced without copying.
+SEARCH_MAGIC = b"USRSRCH\0"
+SEARCH_HEADER = struct.Struct("<8sI32sQqQ")
+SEARCH_SUFFIX = ".usrsearch"
+
+INTER_RELATION_FIELDS = ("source_token", "target_token", "target_word",
+                         "source_sentence", "target_sentence", "relation")
+
+
+def snapshot_path(source_path):
+    return source_path + SNAPSHOT_SUFFIX
+
+
+def relation_graph_path(source_path):
+    return source_path + GRAPH_SUFFIX
+
+
+def search_index_path(source_path):
+    return source_path + SEARCH_SUFFIX
+
+
+def source_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def encode_segment(sentence):
+    tokens = [
+        [token["id"], token["word"],
+         [[relation["target"], relation["target_id"], relation["label"]] for relation in token["relations"]],
+         [token["info"]["semantic_category"], token["info"]["morpho_semantic"],
+          token["info"]["speakers_view"], token["info"]["additional_info"]]]
+        for token in sentence["tokens"]
+    ]
+    inter_relations = [[relation[field] for field in INTER_RELATION_FIELDS]
+                       for relation in sentence["inter_relations"]]
+    record = [tokens, sentence["main"], inter_relations]
+    return zlib.compress(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_segment(blob):
+    tokens, main, inter_relations = json.loads(zlib.decompress(blob))
+    return {
+        "tokens": [
+            Token(token_id, word,
+                  [Relation(target_id, label, target) for target, target_id, label in relations],
+                  TokenInfo(*info))
+            for token_id, word, relations, info in tokens
+        ],
+        "main": main,
+        "inter_relations": [dict(zip(INTER_RELATION_FIELDS, relation)) for relation in inter_relations],
+    }
+
+
+def write_snapshot(sentences, path, digest, stat):
+    # Written under a private name and moved into place, so a reader never
+    # maps a half-written snapshot.
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".tmp_{os.path.basename(path)}_{uuid.uuid4().hex}")
+    with open(tmp_path, "wb") as file:
+        file.write(b"\0" * HEADER.size)
+        index = []
+        offset = HEADER.size
+        for segment_id, sentence in sentences.items():
+            blob = encode_segment(sentence)
+            file.write(blob)
+            index.append([segment_id, offset, len(blob)])
+            offset += len(blob)
+        index_blob = zlib.compress(json.dumps(index, ensure_ascii=False).encode("utf-8"))
+        file.write(index_blob)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, digest, stat.st_size, stat.st_mtime_ns,
+                               offset, len(index_blob)))
+    os.replace(tmp_path, path)
+
+
+def write_relation_graph(graph, path, digest, stat):
+    data = {"source": {"sha256": digest.hex(), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}}
+    data.update(graph.to_dict())
+    tmp_path = f"{path}.tmp_{uuid.uuid4().hex}"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def write_search_index(index, path, digest, stat):
+    meta, blob = index.to_parts()
+    meta["byteorder"] = sys.byteorder
+    meta_blob = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    # Pad so the postings start 4-byte aligned.
+    meta_blob += b" " * (-(SEARCH_HEADER.size + len(meta_blob)) % blob.itemsize)
+    tmp_path = f"{path}.tmp_{uuid.uuid4().hex}"
+    with open(tmp_path, "wb") as file:
+        file.write(SEARCH_HEADER.pack(SEARCH_MAGIC, FORMAT_VERSION, digest, stat.st_size, stat.st_mtime_ns,
+                                      len(meta_blob)))
+        file.write(meta_blob)
+        blob.tofile(file)
+    os.replace(tmp_path, path)
+
+
+def build_snapshot(source_path, path=None):
+    # Imported here: USR_to_Graph loads this module lazily from its CLI.
+    from USR_to_Graph import parse_usrs
+
+    path = path or snapshot_path(source_path)
+    stat = os.stat(source_path)
+    digest = source_digest(source_path)
+    with open(source_path, encoding="utf-8") as file:
+        sentences = parse_usrs(file.read())
+    write_snapshot(sentences, path, digest, stat)
+    write_relation_graph(RelationGraph.from_sentences(sentences), relation_graph_path(source_path), digest, stat)
+    write_search_index(SearchIndex.from_sentences(sentences), search_index_path(source_path), digest, stat)
+    return path
+
+
+def read_header(path):
+    try:
+        with open(path, "rb") as file:
+            header = file.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, version, digest, size, mtime_ns, index_offset, index_length = HEADER.unpack(header)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return digest, size, mtime_ns, index_offset, index_length
+
+
+def source_matches(source_path, digest, size, mtime_ns):
+    # (matches, stat). Size and mtime unchanged: trust the stamp without
+    # hashing; otherwise compare the content hash. A match with a stale
+    # mtime (touch, checkout) is the caller's cue to refresh its stamp.
+    stat = os.stat(source_path)
+    if stat.st_size == size and stat.st_mtime_ns == mtime_ns:
+        return True, None
+    if stat.st_size != size or source_digest(source_path) != digest:
+        return False, stat
+    return True, stat
+
+
+def is_current(source_path, path=None):
+    # When only the mtime moved the header is refreshed, so the next
+    # check is cheap again.
+    path = path or snapshot_path(source_path)
+    header = read_header(path)
+    if header is None:
+        return False
+    digest, size, mtime_ns = header[:3]
+    matches, stat = source_matches(source_path, digest, size, mtime_ns)
+    if not matches or stat is None:
+        return matches
+    with open(path, "r+b") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, digest, stat.st_size, stat.st_mtime_ns, *header[3:]))
+    return True
+
+
+class CorpusSnapshot:
+    """Read-only, memory-mapped view of a parsed corpus.
+
+    Only the segment index is decoded on open; ``get(segment_id)``
+    decompresses that one segment. Supports ``len``, ``in``, iteration
+    over ids and ``get``, so it can stand in for the dict parse_usrs
+    returns (e.g. in select_segments).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        header = read_header(path)
+        if header is None:
+            raise ValueError(f"{path} is not a USR snapshot (format {FORMAT_VERSION})")
+        self.digest, _, _, index_offset, index_length = header
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        index = json.loads(zlib.decompress(self._map[index_offset:index_offset + index_length]))
+        self.offsets = {segment_id: (offset, length) for segment_id, offset, length in index}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, segment_id):
+        return segment_id in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def keys(self):
+        return self.offsets.keys()
+
+    def get(self, segment_id, default=None):
+        location = self.offsets.get(segment_id)
+        if location is None:
+            return default
+        offset, length = location
+        return decode_segment(self._map[offset:offset + length])
+
+    def __getitem__(self, segment_id):
+        sentence = self.get(segment_id)
+        if sentence is None:
+            raise KeyError(segment_id)
+        return sentence
+
+    def items(self):
+        for segment_id in self.offsets:
+            yield segment_id, self.get(segment_id)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_snapshot(source_path, path=None):
+    # Open the snapshot of source_path, rebuilding it first when the
+    # source has changed since it was written.
+    path = path or snapshot_path(source_path)
+    if not is_current(source_path, path):
+        build_snapshot(source_path, path)
+    return CorpusSnapshot(path)
+
+
+def read_relation_graph(source_path, path=None):
+    # The stored graph, or None when it is missing or out of date.
+    path = path or relation_graph_path(source_path)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        source = data["source"]
+        digest = bytes.fromhex(source["sha256"])
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    matches, stat = source_matches(source_path, digest, source["size"], source["mtime_ns"])
+    if not matches:
+        return None
+    graph = RelationGraph.from_dict(data)
+    if stat is not None:
+        write_relation_graph(graph, path, digest, stat)
+    return graph
+
+
+def load_relation_graph(source_path):
+    # Segment-level relation graph of source_path. It is written together
+    # with the snapshot, so a stale or missing graph rebuilds both.
+    graph = read_relation_graph(source_path)
+    if graph is None:
+        build_snapshot(source_path)
+        graph = read_relation_graph(source_path)
+    return graph
+
+
+def read_search_index(source_path, path=None):
+    # The stored index, or None when it is missing or out of date.
+    path = path or search_index_path(source_path)
+    try:
+        with open(path, "rb") as file:
+            header = file.read(SEARCH_HEADER.size)
+            if len(header) < SEARCH_HEADER.size:
+                return None
+            magic, version, digest, size, mtime_ns, meta_length = SEARCH_HEADER.unpack(header)
+            if magic != SEARCH_MAGIC or version != FORMAT_VERSION:
+                return None
+            matches, stat = source_matches(source_path, digest, size, mtime_ns)
+            if not matches:
+                return None
+            meta = json.loads(file.read(meta_length))
+            if meta.get("byteorder") != sys.byteorder:
+                return None
+            if os.fstat(file.fileno()).st_size > SEARCH_HEADER.size + meta_length:
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                blob = memoryview(mapping)[SEARCH_HEADER.size + meta_length:].cast("I")
+            else:
+                blob = memoryview(b"").cast("I")
+    except (FileNotFoundError, ValueError):
+        return None
+    if stat is not None:
+        with open(path, "r+b") as file:
+            file.write(SEARCH_HEADER.pack(SEARCH_MAGIC, FORMAT_VERSION, digest, stat.st_size, stat.st_mtime_ns,
+                                          meta_length))
+    return SearchIndex.from_parts(meta, blob)
+
+
+def load_search_index(source_path):
+    # Token search index of source_path; written with the snapshot, so a
+    # stale or missing index rebuilds both.
+    index = read_search_index(source_path)
+    if index is None:
+        build_snapshot(source_path)
+        index = read_search_index(source_path)
+    return index
@@ -0,0 +1,73 @@
+import re
+
+# A USR token row has nine whitespace separated columns:
+# word, id, semCat, morphSem, dependency, additional info (discourse /
+# coreference), speaker's view, scope, construction.
+COLUMNS = 9
+EMPTY = "-"
+
+SEGMENT_HEADER = re.compile(r"<segment_id=\s*(\S+)>")
+SENT_HEADER = re.compile(r"<sent_id=\s*(\S+)>")
+
+
+class UsrSyntaxError(ValueError):
+    """A problem in the USR text, reported with its 1-based line number."""
+
+    def __init__(self, message, line_number=None, line=None):
+        super().__init__(message)
+        self.message = message
+        self.line_number = line_number
+        self.line = line
+
+    def __str__(self):
+        if self.line_number is None:
+            return self.message
+        return f"line {self.line_number}: {self.message}"
+
+    def to_dict(self):
+        return {"line": self.line_number, "message": self.message, "text": self.line}
+
+
+def report(errors, message, line_number=None, line=None):
+    # Collect the problem when the caller asked for it, otherwise ignore
+    # it: parsing never stops on a malformed field.
+    if errors is not None:
+        errors.append(UsrSyntaxError(message, line_number, line))
+
+
+def split_row(line):
+    # One split pass: str.split() with no separator collapses runs of
+    # tabs/spaces and ignores surrounding whitespace. Missing trailing
+    # columns are padded with "-". Returns None for lines that are not
+    # token rows (fewer than two columns).
+    fields = line.split()
+    if len(fields) < 2:
+        return None
+    if len(fields) < COLUMNS:
+        fields.extend([EMPTY] * (COLUMNS - len(fields)))
+    return fields
+
+
+def split_relations(field, line_number=None, errors=None, line=None):
+    # "14:k1|15:op1" -> [("14", "k1"), ("15", "op1")]. Entries without a
+    # target or label are skipped; extra ":" parts are dropped. Both are
+    # reported instead of aborting the parse.
+    relations = []
+    if not field or field == EMPTY:
+        return relations
+
+    for part in field.split("|"):
+        target, separator, label = part.partition(":")
+        if not separator or not target or not label:
+            report(errors, f"malformed relation {part!r}, expected target:label", line_number, line)
+            continue
+        if ":" in label:
+            label, _, extra = label.partition(":")
+            report(errors, f"extra ':{extra}' in relation {part!r} ignored", line_number, line)
+        relations.append((target, label))
+    return relations
+
+
+def segment_id(line, header=SEGMENT_HEADER):
+    match = header.search(line)
+    return match.group(1) if match else None
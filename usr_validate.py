@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from usr_engine import MAIN_OR_RC, SEGMENT_DIALECT, SENT_DIALECT, iter_blocks, iter_rows
+from usr_index import SentenceIndex, read_inter_relations
+
+DIALECTS = {"segment": SEGMENT_DIALECT, "sentence": SENT_DIALECT}
+
+ERROR = "error"
+WARNING = "warning"
+
+# Issue code -> severity. Any error fails the run (exit status 1).
+CODES = {
+    "syntax": ERROR,                   # malformed relation field (tokenizer)
+    "missing-segment-id": ERROR,       # header without an id; its rows are ignored
+    "duplicate-segment": ERROR,        # the later segment replaces the earlier one
+    "duplicate-token": ERROR,
+    "dangling-target": ERROR,          # relation to a token id the segment lacks
+    "missing-main": ERROR,             # no 0:main row (nor rc*, for <sent_id=...>)
+    "multiple-main": WARNING,          # only the last 0:main row is used
+    "unknown-target-sentence": ERROR,  # inter-relation to a segment not in the file
+    "unknown-target-token": ERROR,     # ... or to a token that segment lacks
+}
+
+# Segments handed to a worker at a time; keeps inter-process overhead
+# small next to the per-segment work.
+CHUNK_SIZE = 256
+
+
+def issue(code, message, segment_id=None, line_number=None, line=None):
+    return {"severity": CODES[code], "code": code, "segment_id": segment_id,
+            "line": line_number, "message": message, "text": line}
+
+
+def check_segment(segment_id, first_line, lines, dialect):
+    # Checks that need only this segment. Returns the issues, the token
+    # ids and the inter-relations still to be checked against the corpus.
+    # Rows are read by usr_engine.iter_rows, so only the relations the
+    # dialect's relation policy keeps are checked.
+    issues = []
+    errors = []
+    token_lines = {}
+    relations = []
+    inter_relations = []
+    main_lines = []
+    has_rc = False
+
+    for number, line, fields, dependencies, pairs in iter_rows(lines, first_line, errors, dialect):
+        word, token_id, _, _, dependency_info, additional_info = fields[:6]
+
+        if token_id in token_lines:
+            issues.append(issue("duplicate-token", f"token id {token_id} already used on line {token_lines[token_id]}",
+                                segment_id, number, line))
+        else:
+            token_lines[token_id] = number
+
+        for target, label in pairs:
+            if label == "main" and target == "0":
+                continue
+            relations.append((target, label, number, line))
+        if "0:main" in dependency_info:
+            main_lines.append(number)
+        has_rc = has_rc or any(label.startswith("rc") for _, label in dependencies)
+
+        if additional_info != "-":
+            for relation in read_inter_relations(additional_info, token_id, segment_id, number, errors, line):
+                inter_relations.append((relation["target_sentence"], relation["target_token"],
+                                        relation["relation"], number, line))
+    issues.extend(issue("syntax", error.message, segment_id, error.line_number, error.line) for error in errors)
+
+    for target, label, number, line in relations:
+        if target not in token_lines:
+            issues.append(issue("dangling-target", f"{label} relation to missing token {target}",
+                                segment_id, number, line))
+    if len(main_lines) > 1:
+        issues.append(issue("multiple-main", f"0:main on lines {', '.join(map(str, main_lines))}",
+                            segment_id, main_lines[-1]))
+    if not main_lines and not (dialect.main_policy == MAIN_OR_RC and has_rc):
+        issues.append(issue("missing-main", "no 0:main row", segment_id, first_line - 1))
+    return issues, list(token_lines), inter_relations
+
+
+def check_chunk(chunk, dialect_name):
+    # Runs in a worker process.
+    dialect = DIALECTS[dialect_name]
+    return [(segment_id, first_line) + check_segment(segment_id, first_line, lines, dialect)
+            for segment_id, first_line, lines in chunk]
+
+
+def iter_chunks(blocks, size=CHUNK_SIZE):
+    chunk = []
+    for block in blocks:
+        chunk.append(block)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def check_file(path, dialect_name="segment", pool=None, max_pending=8):
+    # One streaming pass: chunks of segments go to the pool as they are
+    # read (at most max_pending in flight), then every inter-relation is
+    # checked against the index of the whole file.
+    dialect = DIALECTS[dialect_name]
+    header_errors = []
+    results = []
+    pending = deque()
+    with open(path, "r", encoding="utf-8") as file:
+        for chunk in iter_chunks(iter_blocks(file, header_errors, dialect)):
+            if pool is None:
+                results.extend(check_chunk(chunk, dialect_name))
+                continue
+            pending.append(pool.submit(check_chunk, chunk, dialect_name))
+            if len(pending) >= max_pending:
+                results.extend(pending.popleft().result())
+    while pending:
+        results.extend(pending.popleft().result())
+
+    # The only errors iter_blocks reports are headers without an id.
+    issues = [issue("missing-segment-id", error.message, None, error.line_number, error.line)
+              for error in header_errors]
+
+    index = SentenceIndex()
+    token_ids = {}
+    header_lines = {}
+    for segment_id, first_line, segment_issues, tokens, _ in results:
+        issues.extend(segment_issues)
+        if segment_id in header_lines:
+            issues.append(issue("duplicate-segment", f"segment id already used on line {header_lines[segment_id]}",
+                                segment_id, first_line - 1))
+        header_lines[segment_id] = first_line - 1
+        index.add(segment_id, [])
+        token_ids[segment_id] = set(tokens)
+
+    for segment_id, _, _, _, inter_relations in results:
+        for target_sentence, target_token, relation, number, line in inter_relations:
+            if target_sentence == segment_id:
+                found = segment_id
+            else:
+                found = index.resolve_sentence(target_sentence)
+            if found is None:
+                issues.append(issue("unknown-target-sentence", f"{relation} relation to unknown segment "
+                                    f"{target_sentence!r}", segment_id, number, line))
+            elif target_token is not None and target_token not in token_ids[found]:
+                issues.append(issue("unknown-target-token", f"{relation} relation to missing token "
+                                    f"{found}.{target_token}", segment_id, number, line))
+
+    issues.sort(key=lambda item: item["line"] or 0)
+    return len(results), issues
+
+
+def validate(paths, dialect_name="segment", workers=None):
+    # Machine-readable report over one or more files.
+    started = time.perf_counter()
+    report = {"dialect": dialect_name, "files": {}, "segments": 0, "counts": {}, "errors": 0, "warnings": 0}
+    counts = Counter()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        for path in paths:
+            segments, issues = check_file(path, dialect_name, pool, max_pending=2 * (workers or os.cpu_count() or 1))
+            report["files"][path] = {"segments": segments, "issues": issues}
+            report["segments"] += segments
+            counts.update(item["code"] for item in issues)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    report["counts"] = dict(sorted(counts.items()))
+    report["errors"] = sum(count for code, count in counts.items() if CODES[code] == ERROR)
+    report["warnings"] = sum(count for code, count in counts.items() if CODES[code] == WARNING)
+    seconds = time.perf_counter() - started
+    report["seconds"] = round(seconds, 6)
+    report["segments_per_second"] = round(report["segments"] / seconds) if seconds else None
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="USR_to_Graph.py validate",
+                                     description="Check USR files for broken annotations.")
+    parser.add_argument("inputs", nargs="+", help="USR files to check")
+    parser.add_argument("--dialect", choices=sorted(DIALECTS), default="segment",
+                        help="segment: <segment_id=...> files, sentence: <sent_id=...> files")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (1 checks in this process)")
+    parser.add_argument("--format", choices=("text", "json"), default="text", help="report format on stdout")
+    parser.add_argument("-o", "--output", help="also write the JSON report here")
+    args = parser.parse_args(argv)
+
+    result = validate(args.inputs, args.dialect, args.workers)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    if args.format == "json":
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for path, checked in result["files"].items():
+            for item in checked["issues"]:
+                location = f"{path}:{item['line']}" if item["line"] else path
+                print(f"{location}: {item['severity']}: [{item['code']}] {item['segment_id'] or '-'}: {item['message']}")
+        print(f"{result['segments']} segments, {result['errors']} errors, {result['warnings']} warnings "
+              f"in {result['seconds']:.3f}s", file=sys.stderr)
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+# Production entry point:
+#
+#     gunicorn -c gunicorn.conf.py wsgi:application
+#
+# Any WSGI server works; with more than one process, give them the same
+# USR_SECRET_KEY and USR_JOB_STATE_DIR (gunicorn.conf.py does).
+import logging
+import os
+
+from app import create_app
+
+logging.basicConfig(level=os.environ.get("USR_LOG_LEVEL", "INFO").upper())
+
+application = create_app()